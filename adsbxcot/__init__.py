@@ -18,6 +18,92 @@
 
 __version__ = "7.0.0"
 
-from .constants import DEFAULT_POLL_INTERVAL, DEFAULT_RAPIDAPI_HOST  # NOQA
-from .functions import adsbx_to_cot, create_tasks  # NOQA
-from .classes import ADSBXWorker  # NOQA
+from .constants import (  # NOQA
+    DEFAULT_POLL_INTERVAL,
+    DEFAULT_RAPIDAPI_HOST,
+    DEFAULT_MIN_POSITION_CHANGE,
+    DEFAULT_MIN_ALTITUDE_CHANGE,
+    DEFAULT_MIN_TRACK_CHANGE,
+    DEFAULT_MIN_SPEED_CHANGE,
+    DEFAULT_STREAM_CHUNK_SIZE,
+    DEFAULT_MIN_BACKOFF,
+    DEFAULT_MAX_BACKOFF,
+    DEFAULT_REQUEST_BUDGET_PERIOD,
+    DEFAULT_TILE_DIST,
+    DEFAULT_MAX_CONCURRENT_FEEDS,
+    DEFAULT_ALT_CACHE_SIZE,
+    DEFAULT_ALT_CACHE_TTL,
+    DEFAULT_ALT_CELL_SIZE,
+    DEFAULT_REPLAY_SPEED,
+    DEFAULT_RECORD_ROTATE,
+    DEFAULT_METRICS_HOST,
+    DEFAULT_EXTRAPOLATE_MAX_AGE,
+    DEFAULT_AIRCRAFT_TTL_POLLS,
+    DEFAULT_REGISTRY_SIZE,
+    DEFAULT_FRAGMENT_CACHE_SIZE,
+    DEFAULT_ZONE_CELL_SIZE,
+    DEFAULT_FEED_FILE_INTERVAL,
+    FEED_FILE_MMAP_SIZE,
+    ADSBX_API_DOMAINS,
+    AIRCRAFT_KEYS,
+    COT_SERIALIZERS,
+    EMERGENCY_SQUAWKS,
+    JSON_DECODERS,
+    STALE_OUT_EVENTS,
+    TAK_PROTO_FRAMINGS,
+    ZONE_FILTERS,
+)
+from .functions import (  # NOQA
+    adsbx_to_cot,
+    compile_profile,
+    cot_uid,
+    convert_shard,
+    create_tasks,
+    change_score,
+    craft_changed,
+    craft_in_limits,
+    craft_state,
+    delete_event,
+    extrapolate,
+    file_signature,
+    get_aircraft,
+    get_feed_urls,
+    is_adsbx_url,
+    merge_aircraft,
+    next_cycle,
+    output_lane,
+    output_priority,
+    parse_retry_after,
+    backoff_delay,
+    read_feed_file,
+    read_replay,
+    read_recording,
+    read_recording_index,
+    response_time,
+    stale_event,
+    parse_area,
+    point_in_polygon,
+    point_in_zone,
+    classify_cell,
+    read_zones,
+    cover_tiles,
+    tile_feed_urls,
+)
+from .metrics import Histogram, WorkerMetrics  # NOQA
+from .classes import (  # NOQA
+    ADSBXWorker,
+    Aircraft,
+    AircraftRegistry,
+    AircraftStreamParser,
+    AltitudeReferenceCache,
+    CoalescingQueue,
+    CotFragmentCache,
+    FileWatcher,
+    ConversionProfile,
+    FeedRecorder,
+    FeedRecording,
+    KnownCraftIndex,
+    OutputBudget,
+    RequestBudget,
+    ZoneIndex,
+)
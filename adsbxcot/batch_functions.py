@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright Sensors & Signals LLC https://www.snstac.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""ADSBXCOT Vectorized (NumPy) Batch Functions."""
+
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore
+
+import adsbxcot  # pylint: disable=cyclic-import
+
+HAS_NUMPY: bool = np is not None
+
+# Unit conversions, as in `aircot.functions.get_speed()` and `get_hae()`:
+KNOTS_TO_MPS: float = 0.514444
+FEET_TO_METERS: float = 0.3048
+
+
+def _floats(values, count: int) -> "np.ndarray":
+    """Build a float array from values, with NaN for non-numeric values."""
+    return np.fromiter(
+        (
+            (
+                val
+                if isinstance(val, (int, float)) and not isinstance(val, bool)
+                else np.nan
+            )
+            for val in values
+        ),
+        dtype=np.float64,
+        count=count,
+    )
+
+
+def _column(data: list, key: str) -> "np.ndarray":
+    """Extract one numeric field of every aircraft as a float array (NaN if unset)."""
+    return _floats((craft.get(key) for craft in data), len(data))
+
+
+def _str_column(data: list, key: str) -> "np.ndarray":
+    """Extract one string field of every aircraft, stripped and upper cased."""
+    return np.char.upper(
+        np.char.strip(
+            np.array([str(craft.get(key) or "") for craft in data], dtype=np.str_)
+        )
+    )
+
+
+def snapshot_columns(data: list) -> dict:
+    """
+    Turn a list of aircraft `dict`s into columnar arrays.
+
+    Parameters
+    ----------
+    data : `list`
+        Aircraft, as returned in the `ac` key of the feed. Items must be `dict`s.
+
+    Returns
+    -------
+    `dict`
+        Arrays of lat, lon, alt_baro (0 on the ground), alt_geom, gs, track,
+        seen_pos and the hex, r and flight strings.
+    """
+    alt_baro = _column(data, "alt_baro")
+    alt_baro[
+        np.fromiter(
+            (craft.get("alt_baro") == "ground" for craft in data),
+            dtype=bool,
+            count=len(data),
+        )
+    ] = 0.0
+    alt_geom = _floats(
+        (craft.get("alt_geom", craft.get("alt_geom_x")) for craft in data), len(data)
+    )
+    return {
+        "lat": _column(data, "lat"),
+        "lon": _column(data, "lon"),
+        "alt_baro": alt_baro,
+        "alt_geom": alt_geom,
+        "gs": _column(data, "gs"),
+        "track": _column(data, "track"),
+        "seen_pos": _column(data, "seen_pos"),
+        "hex": np.array(
+            [
+                str(craft.get("icao") if craft.get("hex") is None else craft["hex"])
+                for craft in data
+            ],
+            dtype=np.str_,
+        ),
+        "r": _str_column(data, "r"),
+        "flight": _str_column(data, "flight"),
+    }
+
+
+def _in_polygon(lat: "np.ndarray", lon: "np.ndarray", polygon) -> "np.ndarray":
+    """Vectorized `adsbxcot.point_in_polygon()`, with the same ray casting test."""
+    inside = np.zeros(len(lat), dtype=bool)
+    j = len(polygon) - 1
+    for i, (lat_i, lon_i) in enumerate(polygon):
+        lat_j, lon_j = polygon[j]
+        # A horizontal edge is never crossed, and would divide by zero:
+        if lat_i != lat_j:
+            inside ^= ((lat_i > lat) != (lat_j > lat)) & (
+                lon < (lon_j - lon_i) * (lat - lat_i) / (lat_j - lat_i) + lon_i
+            )
+        j = i
+    return inside
+
+
+def batch_mask(
+    columns: dict,
+    profile: "adsbxcot.ConversionProfile",
+    known_craft_index: Optional["adsbxcot.KnownCraftIndex"] = None,
+) -> "np.ndarray":
+    """
+    Compute which aircraft pass the TIS-B, known craft, position, BBOX (or
+    POLYGON), altitude and staleness filters, exactly as
+    `ADSBXWorker.prepare_craft()` would apply them.
+    """
+    lat, lon = columns["lat"], columns["lon"]
+    mask = ~(np.isnan(lat) | np.isnan(lon))
+
+    tisb = np.char.find(columns["hex"], "~") >= 0
+    if not profile.include_tisb:
+        mask &= ~tisb
+    if profile.tisb_only:
+        mask &= tisb
+
+    if known_craft_index is not None and not profile.include_all_craft:
+        known = np.zeros(len(lat), dtype=bool)
+        for key, column in (
+            ("HEX", np.char.upper(np.char.strip(columns["hex"]))),
+            ("REG", columns["r"]),
+            ("FLIGHT", columns["flight"]),
+        ):
+            values = list(known_craft_index.index.get(key, {}))
+            if values:
+                known |= np.isin(column, values)
+        mask &= known
+
+    if profile.bbox:
+        min_lat, min_lon, max_lat, max_lon = profile.bbox
+        mask &= (
+            (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+        )
+        if profile.polygon:
+            mask &= _in_polygon(lat, lon, profile.polygon)
+
+    # NaN compares False, so aircraft missing a value are kept, as in
+    # `adsbxcot.craft_in_limits()`:
+    alt = columns["alt_baro"]
+    if profile.min_altitude is not None:
+        mask &= ~(alt < profile.min_altitude)
+    if profile.max_altitude is not None:
+        mask &= ~(alt > profile.max_altitude)
+    if profile.max_seen_pos is not None:
+        mask &= ~(columns["seen_pos"] > profile.max_seen_pos)
+
+    return mask
+
+
+def batch_filter(
+    data: list,
+    profile: "adsbxcot.ConversionProfile",
+    known_craft_index: Optional["adsbxcot.KnownCraftIndex"] = None,
+) -> list:
+    """
+    Filter a whole snapshot of aircraft at once, and convert units for survivors.
+
+    Surviving aircraft are returned as `adsbxcot.Aircraft` records, with
+    `x_speed` (m/s) and `x_hae` (meters) set as strings formatted exactly as
+    `aircot.functions.get_speed()` and `get_hae()` would. The aircraft in `data`
+    are not modified.
+
+    Parameters
+    ----------
+    data : `list`
+        Aircraft, as returned in the `ac` key of the feed.
+    profile : `adsbxcot.ConversionProfile`
+        Compiled filter settings.
+    known_craft_index : `adsbxcot.KnownCraftIndex`
+        KNOWN_CRAFT index, if KNOWN_CRAFT is set.
+
+    Returns
+    -------
+    `list`
+        `adsbxcot.Aircraft` records of the surviving aircraft, in feed order.
+    """
+    data = [craft for craft in data if isinstance(craft, dict)]
+    if not data:
+        return []
+
+    columns = snapshot_columns(data)
+    mask = batch_mask(columns, profile, known_craft_index)
+    indices = np.flatnonzero(mask)
+
+    gs = columns["gs"][indices]
+    speed = np.where(np.isnan(gs) | (gs == 0), np.nan, gs * KNOTS_TO_MPS).tolist()
+    alt_geom = columns["alt_geom"][indices]
+    hae = np.where(
+        np.isnan(alt_geom) | (alt_geom == 0), np.nan, alt_geom * FEET_TO_METERS
+    ).tolist()
+
+    survivors: list = []
+    for i, idx in enumerate(indices.tolist()):
+        craft = adsbxcot.Aircraft(data[idx])
+        craft.x_speed = "9999999.0" if speed[i] != speed[i] else str(speed[i])
+        craft.x_hae = "9999999.0" if hae[i] != hae[i] else str(hae[i])
+        survivors.append(craft)
+    return survivors
@@ -17,25 +17,976 @@
 """ADSBXCOT Class Definitions."""
 
 import asyncio
+import codecs
+import csv
+import ctypes
+import json
+import logging
+import math
+import multiprocessing
+import os
+import struct
+import time
+import zlib
 
+from collections import OrderedDict, deque
+from collections.abc import MutableMapping
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from configparser import SectionProxy
-from typing import Union, Optional
+from typing import (
+    FrozenSet,
+    Iterator,
+    NamedTuple,
+    Union,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
 import aiohttp
+import aiohttp.web
 
 import pytak
 import aircot
 import adsbxcot
 
+from adsbxcot import batch_functions, decode_functions
+from adsbxcot.metrics import WorkerMetrics
+
+
+class ConversionProfile(NamedTuple):
+    """
+    Immutable, pre-parsed settings for filtering and converting aircraft.
+
+    Compiled once from the config with `adsbxcot.compile_profile()`, so options
+    are validated at startup rather than re-read for every aircraft.
+    """
+
+    include_tisb: bool = False
+    tisb_only: bool = False
+    include_all_craft: bool = False
+    uid_key: str = "ICAO"
+    cot_stale: int = int(pytak.DEFAULT_COT_STALE)
+    cot_host_id: str = pytak.DEFAULT_HOST_ID
+    cot_serializer: str = "xml"
+    change_detection: bool = False
+    heartbeat_interval: float = int(pytak.DEFAULT_COT_STALE) / 2
+    min_position_change: float = adsbxcot.DEFAULT_MIN_POSITION_CHANGE
+    min_altitude_change: float = adsbxcot.DEFAULT_MIN_ALTITUDE_CHANGE
+    min_track_change: float = adsbxcot.DEFAULT_MIN_TRACK_CHANGE
+    min_speed_change: float = adsbxcot.DEFAULT_MIN_SPEED_CHANGE
+    bbox: Optional[Tuple[float, float, float, float]] = None
+    polygon: Optional[Tuple[Tuple[float, float], ...]] = None
+    min_altitude: Optional[float] = None
+    max_altitude: Optional[float] = None
+    max_seen_pos: Optional[float] = None
+    batch_filter: bool = False
+    convert_processes: int = 0
+    output_rate: Optional[float] = None
+    output_byte_rate: Optional[float] = None
+    output_burst: float = adsbxcot.DEFAULT_POLL_INTERVAL
+    extrapolate_interval: Optional[float] = None
+    extrapolate_max_age: float = adsbxcot.DEFAULT_EXTRAPOLATE_MAX_AGE
+    stale_out: str = ""
+    tak_proto_framing: str = "mesh"
+    fragment_cache_size: int = adsbxcot.DEFAULT_FRAGMENT_CACHE_SIZE
+    zone_filter: str = ""
+
+
+class Aircraft(MutableMapping):  # pylint: disable=too-many-instance-attributes
+    """
+    Compact record of one aircraft, holding only the fields ADSBXCOT reads.
+
+    Built once from the feed's `dict`, with the hex (or icao), r, flight,
+    category, t and squawk strings stripped and upper cased, so nothing
+    downstream normalizes them again. Behaves as a `dict` of the fields that
+    are set, so functions that take aircraft `dict`s take an `Aircraft` too.
+    Fields that are missing, or null in the feed, are None, and not in the
+    mapping.
+    """
+
+    # The feed fields of `decode_functions.AIRCRAFT_FIELDS` (icao is folded
+    # into hex), and the derived x_ fields:
+    FIELDS: Tuple[str, ...] = tuple(
+        key for key in decode_functions.AIRCRAFT_FIELDS if key != "icao"
+    ) + ("x_alt_geom", "x_alt_baro_offset", "x_hae", "x_speed", "x_zones")
+    # For membership tests on every access; FIELDS keeps the order:
+    _FIELD_SET: FrozenSet[str] = frozenset(FIELDS)
+    NORMALIZED: Tuple[str, ...] = ("hex", "r", "flight", "category", "t", "squawk")
+
+    __slots__ = FIELDS + ("tisb",)
+
+    def __init__(self, data: Union[dict, "Aircraft", None] = None) -> None:
+        get = (data or {}).get
+        for key in self.FIELDS:
+            setattr(self, key, get(key))
+        if self.hex is None and data:  # pylint: disable=access-member-before-definition
+            self.hex = data.get("icao")
+        if isinstance(data, Aircraft):
+            self.tisb: bool = data.tisb
+            return
+        for key in self.NORMALIZED:
+            val = getattr(self, key)
+            if val is not None:
+                setattr(self, key, str(val).strip().upper())
+        self.tisb = "~" in (self.hex or "")
+
+    def __getitem__(self, key: str):
+        val = getattr(self, key, None) if key in self._FIELD_SET else None
+        if val is None:
+            raise KeyError(key)
+        return val
+
+    def __setitem__(self, key: str, val) -> None:
+        if key not in self._FIELD_SET:
+            raise KeyError(key)
+        setattr(self, key, val)
+
+    def __delitem__(self, key: str) -> None:
+        self[key]  # pylint: disable=pointless-statement
+        setattr(self, key, None)
+
+    def __iter__(self) -> Iterator[str]:
+        return (key for key in self.FIELDS if getattr(self, key) is not None)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __contains__(self, key) -> bool:
+        return key in self._FIELD_SET and getattr(self, key) is not None
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({dict(self)!r})"
+
+    def get(self, key: str, default=None):
+        """Value of a field, or `default` if it is not set."""
+        val = getattr(self, key, None) if key in self._FIELD_SET else None
+        return default if val is None else val
+
+    def copy(self) -> "Aircraft":
+        """Shallow copy, as `dict.copy()`."""
+        return self.__class__(self)
+
+
+class AircraftStreamParser:
+    """
+    Incremental parser for the aircraft array of an ADS-B Aggregator response.
+
+    Bytes are pushed in with `feed()` as they arrive, and each aircraft `dict` of
+    the array under `key` (or any of several keys) is returned as soon as it has
+    been fully received, without buffering or decoding the whole response. Other
+    top-level values are kept in `meta`.
+    """
+
+    _WHITESPACE = " \t\n\r"
+
+    def __init__(self, key: Union[str, Sequence[str]] = adsbxcot.AIRCRAFT_KEYS) -> None:
+        self.keys: Tuple[str, ...] = (key,) if isinstance(key, str) else tuple(key)
+        self.meta: dict = {}
+        self.found: bool = False
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buf: str = ""
+        self._state: str = "start"
+        self._current_key: Optional[str] = None
+        self._closed: bool = False
+
+    def feed(self, data: bytes) -> List[dict]:
+        """Push bytes into the parser, returning any completed aircraft."""
+        self._buf += self._utf8.decode(data)
+        return self._parse()
+
+    def close(self) -> List[dict]:
+        """Signal the end of the response, returning any remaining aircraft."""
+        self._buf += self._utf8.decode(b"", final=True)
+        self._closed = True
+        crafts = self._parse()
+        if self._state != "done":
+            raise ValueError(f"Truncated or invalid JSON response ({self._state}).")
+        return crafts
+
+    def _decode(self, pos: int):
+        """Decode one JSON value at `pos`, or return None if more data is needed."""
+        try:
+            value, end = self._decoder.raw_decode(self._buf, pos)
+        except json.JSONDecodeError:
+            if self._closed:
+                raise
+            return None
+        # A number at the very end of the buffer may still be incomplete:
+        if end >= len(self._buf) and not self._closed:
+            return None
+        return value, end
+
+    def _parse(  # NOQA pylint: disable=too-many-branches,too-many-statements
+        self,
+    ) -> List[dict]:
+        crafts: List[dict] = []
+        buf = self._buf
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in self._WHITESPACE:
+                pos += 1
+            if pos >= len(buf) or self._state == "done":
+                break
+
+            char = buf[pos]
+            state = self._state
+            if state == "start":
+                if char != "{":
+                    raise ValueError("JSON response is not an object.")
+                pos += 1
+                self._state = "key"
+            elif state == "key":
+                if char == "}":
+                    pos += 1
+                    self._state = "done"
+                    continue
+                decoded = self._decode(pos)
+                if decoded is None:
+                    break
+                self._current_key, pos = decoded
+                self._state = "colon"
+            elif state == "colon":
+                if char != ":":
+                    raise ValueError("Expected ':' in JSON response.")
+                pos += 1
+                self._state = "value"
+            elif state == "value":
+                if self._current_key in self.keys and char == "[":
+                    pos += 1
+                    self.found = True
+                    self._state = "array"
+                    continue
+                decoded = self._decode(pos)
+                if decoded is None:
+                    break
+                self.meta[self._current_key], pos = decoded
+                self._state = "next_key"
+            elif state == "next_key":
+                if char not in ",}":
+                    raise ValueError("Expected ',' or '}' in JSON response.")
+                pos += 1
+                self._state = "key" if char == "," else "done"
+            elif state == "array":
+                if char == "]":
+                    pos += 1
+                    self._state = "next_key"
+                    continue
+                decoded = self._decode(pos)
+                if decoded is None:
+                    break
+                craft, pos = decoded
+                crafts.append(craft)
+                self._state = "next_item"
+            elif state == "next_item":
+                if char not in ",]":
+                    raise ValueError("Expected ',' or ']' in JSON response.")
+                pos += 1
+                self._state = "array" if char == "," else "next_key"
+
+        self._buf = buf[pos:]
+        return crafts
+
+
+class RequestBudget:
+    """Fixed-window request budget, for metered API keys (e.g. RapidAPI)."""
+
+    def __init__(self, limit: int, period: float) -> None:
+        self.limit: int = limit
+        self.period: float = period
+        self.used: int = 0
+        self.window_start: Optional[float] = None
+
+    def acquire(self, now: Optional[float] = None) -> bool:
+        """Use one request from the budget, returning False if it is exhausted."""
+        now = time.monotonic() if now is None else now
+        if self.window_start is None or now - self.window_start >= self.period:
+            self.window_start = now
+            self.used = 0
+        if self.used >= self.limit:
+            return False
+        self.used += 1
+        return True
+
+    @property
+    def remaining(self) -> int:
+        """Requests remaining in the current window."""
+        return max(0, self.limit - self.used)
+
+
+class OutputBudget:
+    """
+    Token bucket limiting output to `rate` events and/or `byte_rate` bytes per
+    second, averaged over `burst` seconds.
+
+    An event larger than `burst` seconds of `byte_rate` is allowed once the
+    bucket is full, overdrawing it, rather than never being allowed.
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        byte_rate: Optional[float] = None,
+        burst: float = adsbxcot.DEFAULT_POLL_INTERVAL,
+    ) -> None:
+        self.rate: Optional[float] = rate
+        self.byte_rate: Optional[float] = byte_rate
+        self.burst: float = burst
+        self.events: float = rate * burst if rate else math.inf
+        self.bytes: float = byte_rate * burst if byte_rate else math.inf
+        self.updated: Optional[float] = None
+
+    def refill(self, now: float) -> None:
+        """Add the tokens accrued since the last refill, up to `burst` seconds."""
+        if self.updated is not None:
+            elapsed: float = max(0.0, now - self.updated)
+            if self.rate:
+                self.events = min(
+                    self.rate * self.burst, self.events + elapsed * self.rate
+                )
+            if self.byte_rate:
+                self.bytes = min(
+                    self.byte_rate * self.burst, self.bytes + elapsed * self.byte_rate
+                )
+        self.updated = now
+
+    def _needed(self, size: int) -> float:
+        """Bytes of budget needed to send an event of `size` bytes."""
+        if self.byte_rate:
+            return min(size, self.byte_rate * self.burst)
+        return size
+
+    def allow(self, size: int, now: Optional[float] = None) -> bool:
+        """Use budget for one event of `size` bytes, returning False if there is none."""
+        self.refill(time.monotonic() if now is None else now)
+        if self.events < 1 or self.bytes < self._needed(size):
+            return False
+        self.events -= 1
+        self.bytes -= size
+        return True
+
+    def delay(self, size: int, now: Optional[float] = None) -> float:
+        """Seconds until there is budget for one event of `size` bytes."""
+        self.refill(time.monotonic() if now is None else now)
+        wait: float = 0.0
+        if self.rate and self.events < 1:
+            wait = (1 - self.events) / self.rate
+        if self.byte_rate and self.bytes < self._needed(size):
+            wait = max(wait, (self._needed(size) - self.bytes) / self.byte_rate)
+        return wait
+
+    def consume(self, size: int, now: Optional[float] = None) -> None:
+        """Use budget for one event of `size` bytes, even if that overdraws it."""
+        self.refill(time.monotonic() if now is None else now)
+        self.events -= 1
+        self.bytes -= size
+
+
+class KnownCraftIndex:
+    """
+    Hashed index of KNOWN_CRAFT rows, keyed on their HEX, REG and FLIGHT columns.
+
+    As with `aircot.get_known_craft()`, values are compared stripped and upper
+    cased, and the first matching row wins.
+    """
+
+    KEYS: Sequence[str] = ("HEX", "REG", "FLIGHT")
+
+    def __init__(self, rows: list, keys: Sequence[str] = KEYS) -> None:
+        self.rows: list = rows
+        self.index: dict = {key: {} for key in keys}
+        for row in rows:
+            for key, index in self.index.items():
+                value = (row.get(key) or "").strip().upper()
+                if value and value not in index:
+                    index[value] = row
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def get(self, value: Optional[str], key: str = "HEX") -> dict:
+        """Get the known craft row with the given (normalized) key value."""
+        if not value:
+            return {}
+        return self.index.get(key, {}).get(value, {})
+
+    def lookup(
+        self, icao: str, reg: Optional[str] = None, flight: Optional[str] = None
+    ) -> dict:
+        """Get the known craft row for an aircraft, by HEX, then REG, then FLIGHT."""
+        return (
+            self.get(icao, "HEX")
+            or self.get((reg or "").strip().upper(), "REG")
+            or self.get((flight or "").strip().upper(), "FLIGHT")
+        )
+
+
+class ZoneIndex:
+    """
+    Grid index of geofence zones, for ZONES, built once when they are loaded.
+
+    The zones' bounding boxes are cut into `cell_size` degree cells, and each
+    cell keeps the zones wholly covering it and the zones whose boundary crosses
+    it. Looking up a point is then one `dict` lookup, plus a point in polygon
+    test for just the zones whose boundary crosses its cell.
+    """
+
+    def __init__(
+        self,
+        zones: List[Tuple[str, list]],
+        cell_size: float = adsbxcot.DEFAULT_ZONE_CELL_SIZE,
+    ) -> None:
+        self.cell_size: float = cell_size
+        # Zone names, in load order, and each one's position in it:
+        self.order: dict = {}
+        for name, _ in zones:
+            self.order.setdefault(name, len(self.order))
+        self.cells: dict = {}
+        for name, rings in zones:
+            self.add(name, rings)
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def add(self, name: str, rings: list) -> None:
+        """Index the cells a zone polygon overlaps."""
+        size: float = self.cell_size
+        lats = [lat for lat, _ in rings[0]]
+        lons = [lon for _, lon in rings[0]]
+        self.order.setdefault(name, len(self.order))
+        for row in range(
+            math.floor(min(lats) / size), math.floor(max(lats) / size) + 1
+        ):
+            for col in range(
+                math.floor(min(lons) / size), math.floor(max(lons) / size) + 1
+            ):
+                min_lat, min_lon = row * size, col * size
+                cell = [
+                    (min_lat, min_lon),
+                    (min_lat, min_lon + size),
+                    (min_lat + size, min_lon + size),
+                    (min_lat + size, min_lon),
+                ]
+                covered: Optional[bool] = adsbxcot.classify_cell(cell, rings)
+                if covered is None:
+                    continue
+                full, edge = self.cells.setdefault((row, col), ([], []))
+                if covered:
+                    full.append(name)
+                else:
+                    edge.append((name, rings))
+
+    def lookup(self, lat: float, lon: float) -> Tuple[str, ...]:
+        """Names of the zones a point is in, in the order they were loaded."""
+        entry: Optional[tuple] = self.cells.get(
+            (math.floor(lat / self.cell_size), math.floor(lon / self.cell_size))
+        )
+        if entry is None:
+            return ()
+        full, edge = entry
+        found: set = set(full)
+        for name, rings in edge:
+            if name not in found and adsbxcot.point_in_zone(lat, lon, rings):
+                found.add(name)
+        return tuple(sorted(found, key=self.order.__getitem__))
+
+
+class AltitudeReferenceCache:
+    """
+    Bounded cache of baro to geometric altitude offsets (alt_geom - alt_baro).
+
+    Offsets are kept per aircraft, and per cell of a coarse lat/lon grid for the
+    region around it. Entries expire after `ttl` seconds, and at most `max_size`
+    aircraft are kept, least recently updated first out, so memory stays flat as
+    aircraft come and go.
+    """
+
+    def __init__(
+        self,
+        max_size: int = adsbxcot.DEFAULT_ALT_CACHE_SIZE,
+        ttl: float = adsbxcot.DEFAULT_ALT_CACHE_TTL,
+        cell_size: float = adsbxcot.DEFAULT_ALT_CELL_SIZE,
+    ) -> None:
+        self.max_size: int = max_size
+        self.ttl: float = ttl
+        self.cell_size: float = cell_size
+        self.crafts: OrderedDict = OrderedDict()
+        self.cells: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.crafts)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (int(lat // self.cell_size), int(lon // self.cell_size))
+
+    def expire(self, now: float) -> None:
+        """Evict entries older than the TTL, oldest first."""
+        for entries in (self.crafts, self.cells):
+            while entries:
+                key, (_, updated) = next(iter(entries.items()))
+                if now - updated < self.ttl:
+                    break
+                del entries[key]
+
+    def update(
+        self,
+        icao: str,
+        offset: float,
+        lat: Optional[float] = None,
+        lon: Optional[float] = None,
+        now: Optional[float] = None,
+    ) -> None:
+        """Record an aircraft's offset, and fold it into its region's offset."""
+        now = time.monotonic() if now is None else now
+        if icao:
+            self.crafts[icao] = (offset, now)
+            self.crafts.move_to_end(icao)
+            while len(self.crafts) > self.max_size:
+                self.crafts.popitem(last=False)
+
+        if lat is not None and lon is not None:
+            cell = self._cell(lat, lon)
+            prev = self.cells.pop(cell, None)
+            if prev is not None and now - prev[1] < self.ttl:
+                offset = (prev[0] + offset) / 2
+            self.cells[cell] = (offset, now)
+
+        self.expire(now)
+
+    def get(
+        self,
+        icao: str,
+        lat: Optional[float] = None,
+        lon: Optional[float] = None,
+        now: Optional[float] = None,
+    ) -> Optional[float]:
+        """
+        Get the offset for an aircraft from its own history, or else from its
+        region, or else from the nearest neighbouring region.
+        """
+        now = time.monotonic() if now is None else now
+        self.expire(now)
+
+        entry = self.crafts.get(icao)
+        if entry is not None:
+            return entry[0]
+
+        if lat is None or lon is None:
+            return None
+
+        row, col = self._cell(lat, lon)
+        # Position in cell units, to measure the distance to each cell's center:
+        pos_row, pos_col = lat / self.cell_size, lon / self.cell_size
+        nearest: Optional[Tuple[float, float]] = None
+        for cell_row in (row, row - 1, row + 1):
+            for cell_col in (col, col - 1, col + 1):
+                entry = self.cells.get((cell_row, cell_col))
+                if entry is None:
+                    continue
+                dist = (cell_row + 0.5 - pos_row) ** 2 + (cell_col + 0.5 - pos_col) ** 2
+                if (cell_row, cell_col) == (row, col):
+                    return entry[0]
+                if nearest is None or dist < nearest[0]:
+                    nearest = (dist, entry[0])
+        return nearest[1] if nearest else None
+
+
+class CotFragmentCache:
+    """
+    Bounded cache of each aircraft's static CoT fields: its UID, CoT type,
+    callsign, icon, and the identity part of its ``_aircot_`` detail and remarks.
+
+    Entries are keyed by ICAO, and only used while the aircraft's hex, reg,
+    flight, squawk, category, type and KNOWN_CRAFT row are unchanged, so each
+    poll only derives the position, track and altitude fields. Beyond
+    `max_size` the least recently used aircraft is evicted.
+    """
+
+    def __init__(self, max_size: int = adsbxcot.DEFAULT_FRAGMENT_CACHE_SIZE) -> None:
+        self.max_size: int = max_size
+        self.entries: OrderedDict = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, icao: str, inputs: tuple, known_craft: dict) -> Optional[dict]:
+        """Get an aircraft's static fields, if derived from the same inputs."""
+        entry: Optional[tuple] = self.entries.get(icao)
+        if (
+            entry is None
+            or entry[0] != inputs
+            or (entry[1] is not known_craft and entry[1] != known_craft)
+        ):
+            self.misses += 1
+            return None
+        self.entries.move_to_end(icao)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, icao: str, inputs: tuple, known_craft: dict, fields: dict) -> None:
+        """Cache an aircraft's static fields, and the inputs they derive from."""
+        self.entries[icao] = (inputs, known_craft, fields)
+        self.entries.move_to_end(icao)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def discard(self, icao: str) -> None:
+        """Drop an aircraft's static fields."""
+        self.entries.pop(icao, None)
+
+
+class AircraftRegistry:
+    """
+    Bounded registry of the aircraft seen in the feed, and the CoT UID (and,
+    optionally, the event) last sent for each.
+
+    Aircraft not seen for `ttl` seconds expire, and beyond `max_size` the least
+    recently seen aircraft is evicted.
+    """
+
+    def __init__(
+        self, ttl: float, max_size: int = adsbxcot.DEFAULT_REGISTRY_SIZE
+    ) -> None:
+        self.ttl: float = ttl
+        self.max_size: int = max_size
+        self.aircraft: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.aircraft)
+
+    def seen(self, icao: str, now: Optional[float] = None) -> Optional[str]:
+        """
+        Record an aircraft as seen in the feed.
+
+        Returns
+        -------
+        `str`
+            ICAO of the aircraft evicted to make room, if any.
+        """
+        entry: dict = self.aircraft.pop(icao, None) or {"uid": None, "event": None}
+        entry["seen"] = time.monotonic() if now is None else now
+        self.aircraft[icao] = entry
+        if len(self.aircraft) > self.max_size:
+            return self.aircraft.popitem(last=False)[0]
+        return None
+
+    def sent(
+        self, icao: str, uid: Optional[str], event: Optional[bytes] = None
+    ) -> None:
+        """Record the CoT UID, and optionally the event, last sent for an aircraft."""
+        entry: Optional[dict] = self.aircraft.get(icao)
+        if entry is not None:
+            entry["uid"] = uid
+            entry["event"] = event
+
+    def expire(self, now: Optional[float] = None) -> List[Tuple[str, dict]]:
+        """Remove, and return, the aircraft not seen for `ttl` seconds."""
+        now = time.monotonic() if now is None else now
+        expired: List[Tuple[str, dict]] = []
+        # Kept in the order last seen, so the oldest are first:
+        while self.aircraft:
+            icao, entry = next(iter(self.aircraft.items()))
+            if now - entry["seen"] < self.ttl:
+                break
+            self.aircraft.popitem(last=False)
+            expired.append((icao, entry))
+        return expired
+
+
+class CoalescingQueue(asyncio.Queue):
+    """
+    TX queue holding at most one pending event per CoT UID.
+
+    An event for a UID that is already queued replaces the queued event in
+    place, so after congestion the current picture is sent, rather than a
+    backlog of old positions. As it is bounded by the number of aircraft, the
+    queue has no `maxsize`, and `put()` never blocks.
+    """
+
+    def __init__(self, key=None) -> None:
+        self.key = key or adsbxcot.cot_uid
+        self.coalesced: int = 0
+        self._unkeyed: int = 0
+        super().__init__()
+
+    def _init(self, maxsize: int) -> None:
+        self._queue: OrderedDict = OrderedDict()
+
+    def put_nowait(self, item) -> None:
+        key = self.key(item)
+        if key is not None and key in self._queue:
+            self._queue[key] = item
+            self.coalesced += 1
+            return
+        super().put_nowait(item)
+
+    def _put(self, item) -> None:
+        key = self.key(item)
+        if key is None:
+            # Events without a UID are never coalesced:
+            self._unkeyed += 1
+            key = (None, self._unkeyed)
+        self._queue[key] = item
+
+    def _get(self):
+        return self._queue.popitem(last=False)[1]
+
+    def _qsize(self) -> int:
+        return len(self._queue)
+
+
+class FeedRecording:
+    """One raw feed response being recorded, as one gzip member, by `FeedRecorder`."""
+
+    def __init__(self, recorder: "FeedRecorder", url: str, now: float) -> None:
+        self.recorder: "FeedRecorder" = recorder
+        self.url: str = url
+        self.now: float = now
+        self.chunks: List[bytes] = []
+
+    def write(self, chunk: bytes) -> None:
+        """Record a chunk of the raw response."""
+        if chunk:
+            self.chunks.append(chunk)
+
+    def finish(self, valid: bool = True) -> None:
+        """
+        Append the recorded response to the archive. If it is not `valid` JSON
+        (or was cut off), it is recorded as a JSON string, flagged ``"raw"``.
+        """
+        self.recorder.submit(self._finish, b"".join(self.chunks), valid)
+        self.chunks = []
+
+    def _finish(self, body: bytes, valid: bool) -> None:
+        record: dict = {"recorded": self.now, "url": self.url}
+        if valid:
+            # JSON only has newlines between tokens, so this keeps one record per line:
+            response: bytes = body.replace(b"\n", b" ").replace(b"\r", b" ") or b"null"
+        else:
+            record["raw"] = True
+            response = json.dumps(body.decode("UTF-8", "replace")).encode()
+        # gzip container, so each member can be decompressed on its own:
+        compressor = zlib.compressobj(self.recorder.level, zlib.DEFLATED, 31)
+        member: bytes = compressor.compress(
+            json.dumps(record)[:-1].encode() + b', "response": ' + response + b"}\n"
+        )
+        self.recorder.append(self.url, self.now, member + compressor.flush())
+
+
+class FeedRecorder:
+    """
+    Appends raw feed responses to rotating, gzipped, time-indexed archives.
+
+    Each response is recorded as one gzip member holding one JSON line:
+    ``{"recorded": <seconds since the epoch>, "url": <feed URL>, "response": ...}``.
+    Responses that are not valid JSON are recorded as a string, with
+    ``"raw": true``, so every record can be read back.
+    Archives are named for the start of their RECORD_ROTATE period, and each
+    has an index (``.idx``) with one ``<recorded> <offset> <length> <url>`` line
+    per response, so any one poll cycle can be read without decompressing the
+    rest. Compression and writes run, in order, on one background thread.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        rotate: float = adsbxcot.DEFAULT_RECORD_ROTATE,
+        level: int = 6,
+    ) -> None:
+        self.directory: str = directory
+        self.rotate: float = rotate
+        self.level: int = level
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="adsbxcot-recorder"
+        )
+        self._logger = logging.getLogger(__name__)
+
+    def archive_path(self, now: float) -> str:
+        """Archive file recording responses at time `now`."""
+        start: float = now - now % self.rotate
+        stamp: str = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime(start))
+        return os.path.join(self.directory, f"adsbxcot-{stamp}.jsonl.gz")
+
+    def submit(self, func, *args) -> Future:
+        """Run `func` on the recorder thread, logging any error."""
+        future: Future = self.executor.submit(func, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Future) -> None:
+        exc = future.exception()
+        if exc is not None:
+            self._logger.error("Error recording feed: %s", exc)
+
+    def start(self, url: str, now: Optional[float] = None) -> FeedRecording:
+        """Start recording a raw response from `url`, to be written in chunks."""
+        return FeedRecording(self, url, time.time() if now is None else now)
+
+    def record(
+        self, url: str, body: bytes, now: Optional[float] = None, valid: bool = True
+    ) -> None:
+        """Record a whole raw response from `url`, and whether it is `valid` JSON."""
+        recording: FeedRecording = self.start(url, now)
+        recording.write(body)
+        recording.finish(valid)
+
+    def append(self, url: str, now: float, member: bytes) -> None:
+        """Append a gzip member, and its index entry. Runs on the recorder thread."""
+        path: str = self.archive_path(now)
+        with open(path, "ab") as archive_fd:
+            offset: int = archive_fd.tell()
+            archive_fd.write(member)
+        with open(f"{path}.idx", "a", encoding="UTF-8") as index_fd:
+            index_fd.write(f"{now:.3f} {offset} {len(member)} {url}\n")
+
+    def close(self) -> None:
+        """Finish writing all recorded responses."""
+        self.executor.shutdown(wait=True)
+
+
+class FileWatcher:
+    """
+    Waits for a file to be rewritten, for FEED_FILE.
+
+    Uses inotify on Linux, watching the file's directory so that files replaced
+    by rename (as readsb does) are seen, and otherwise just waits `interval`.
+    Either way, `wait()` returns at least every `interval` seconds, so callers
+    should check the file's `adsbxcot.file_signature()` before reading it.
+    """
+
+    # From <sys/inotify.h>:
+    IN_CLOSE_WRITE: int = 0x00000008
+    IN_MOVED_TO: int = 0x00000080
+    IN_CREATE: int = 0x00000100
+    EVENT_HEADER: struct.Struct = struct.Struct("iIII")
+
+    def __init__(self, path: str, interval: float) -> None:
+        self.path: str = os.path.abspath(path)
+        self.name: bytes = os.fsencode(os.path.basename(self.path))
+        self.interval: float = interval
+        self.inotify_fd: Optional[int] = None
+        self.changed: asyncio.Event = asyncio.Event()
+        self._logger = logging.getLogger(__name__)
+
+    def start(self, inotify: bool = True) -> bool:
+        """Start watching, returning True if inotify is in use."""
+        if not inotify:
+            return False
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            inotify_fd: int = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if inotify_fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1")
+            mask: int = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+            if (
+                libc.inotify_add_watch(
+                    inotify_fd, os.fsencode(os.path.dirname(self.path)), mask
+                )
+                < 0
+            ):
+                errno: int = ctypes.get_errno()
+                os.close(inotify_fd)
+                raise OSError(errno, "inotify_add_watch")
+        except (AttributeError, OSError) as exc:
+            self._logger.info(
+                "inotify unavailable (%s), checking %s every %ss.",
+                exc,
+                self.path,
+                self.interval,
+            )
+            return False
+
+        self.inotify_fd = inotify_fd
+        asyncio.get_running_loop().add_reader(inotify_fd, self._read_events)
+        return True
+
+    def _read_events(self) -> None:
+        """Read pending inotify events, flagging any for the watched file."""
+        try:
+            buf: bytes = os.read(self.inotify_fd, 65536)  # type: ignore
+        except BlockingIOError:
+            return
+        pos: int = 0
+        while pos + self.EVENT_HEADER.size <= len(buf):
+            _, _, _, length = self.EVENT_HEADER.unpack_from(buf, pos)
+            pos += self.EVENT_HEADER.size
+            if buf[pos : pos + length].rstrip(b"\0") == self.name:
+                self.changed.set()
+            pos += length
+
+    async def wait(self) -> None:
+        """Wait until the file may have changed, or at most `interval` seconds."""
+        if self.inotify_fd is None:
+            await asyncio.sleep(self.interval)
+            return
+        try:
+            await asyncio.wait_for(self.changed.wait(), self.interval)
+        except asyncio.TimeoutError:
+            pass
+        self.changed.clear()
+
+    def close(self) -> None:
+        """Stop watching."""
+        if self.inotify_fd is not None:
+            asyncio.get_running_loop().remove_reader(self.inotify_fd)
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+
 
 class ADSBXWorker(pytak.QueueWorker):
     """Reads ADS-B Aggregator Data, renders to COT, and puts on Queue."""
 
     def __init__(self, queue: asyncio.Queue, config: SectionProxy) -> None:
         super().__init__(queue, config)
-        self.known_craft_db: Union[dict, None] = None
+        self.known_craft_db: Union[list, None] = None
+        self.known_craft_index: Optional[KnownCraftIndex] = None
+        self.known_craft_mtime: Optional[int] = None
+        self.zones: Optional[ZoneIndex] = None
+        self.zones_mtime: Optional[int] = None
         self.session: Union[aiohttp.ClientSession, None] = None
-        self.altitudes: dict = {}
+        self.altitudes: AltitudeReferenceCache = AltitudeReferenceCache(
+            int(self.config.get("ALT_CACHE_SIZE") or adsbxcot.DEFAULT_ALT_CACHE_SIZE),
+            float(self.config.get("ALT_CACHE_TTL") or adsbxcot.DEFAULT_ALT_CACHE_TTL),
+            float(self.config.get("ALT_CELL_SIZE") or adsbxcot.DEFAULT_ALT_CELL_SIZE),
+        )
+        self.craft_states: dict = {}
+        self._profile: Optional[ConversionProfile] = None
+        self._fragments: Optional[CotFragmentCache] = None
+        self.backoffs: dict = {}
+        self.request_budget: Optional[RequestBudget] = None
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.recorder: Optional[FeedRecorder] = None
+        self.metrics: WorkerMetrics = WorkerMetrics()
+        self.metrics_runner: Optional[aiohttp.web.AppRunner] = None
+        self.output_budget: Optional[OutputBudget] = None
+        self.deferred: OrderedDict = OrderedDict()
+        self.deferred_order: deque = deque()
+        self.pacer: Optional[asyncio.Task] = None
+        self.tracks: dict = {}
+        self.decode_json = decode_functions.get_decoder(self.config.get("JSON_DECODER"))
+        # Forget aircraft missing for a few polls, well before TAK stales them:
+        aircraft_ttl: float = float(
+            self.config.get("AIRCRAFT_TTL")
+            or min(
+                adsbxcot.DEFAULT_AIRCRAFT_TTL_POLLS
+                * float(
+                    self.config.get("POLL_INTERVAL") or adsbxcot.DEFAULT_POLL_INTERVAL
+                ),
+                float(self.config.get("COT_STALE") or pytak.DEFAULT_COT_STALE),
+            )
+        )
+        self.registry: AircraftRegistry = AircraftRegistry(
+            aircraft_ttl,
+            int(
+                self.config.get("AIRCRAFT_REGISTRY_SIZE")
+                or adsbxcot.DEFAULT_REGISTRY_SIZE
+            ),
+        )
 
     async def handle_data(self, data: list) -> None:
         """Marshal ADS-B data into CoT, and put it onto a TX queue."""
@@ -47,42 +998,436 @@ class ADSBXWorker(pytak.QueueWorker):
             self._logger.warning("Empty aircraft list")
             return None
 
+        self.metrics.received += len(data)
+
+        # Aircraft that pass the batch filter skip the per-aircraft filters:
+        prefiltered: bool = self.profile.batch_filter and batch_functions.HAS_NUMPY
+        if prefiltered:
+            start: float = time.perf_counter()
+            received: int = len(data)
+            data = self.batch_filter(data)
+            self.metrics.observe("filter", time.perf_counter() - start)
+            self.metrics.filter("batch_filter", received - len(data))
+
+        if self.profile.convert_processes > 0:
+            await self.handle_data_sharded(data, prefiltered)
+            return None
+
+        if self.budgeted:
+            await self.handle_data_budgeted(data, prefiltered)
+            return None
+
         lod = len(data)
         i = 1
         for craft in data:
             i += 1
-            icao = await self.process_craft(craft)
+            icao = await self.process_craft(craft, prefiltered)
             self._logger.debug("Handling %s/%s ICAO: %s", i, lod, icao)
 
-    async def process_craft(self, craft: dict) -> Optional[str]:
+    async def handle_data_sharded(self, data: list, prefiltered: bool = False) -> None:
+        """
+        Convert a snapshot across a pool of worker processes, sharded by ICAO.
+
+        Each aircraft is always converted by the same shard, and shards are put
+        onto the TX queue in order, so per-aircraft order is kept. If a worker
+        process dies, the pool is replaced and the snapshot is converted inline.
+        """
+        nshards: int = self.profile.convert_processes
+        shards: List[list] = [[] for _ in range(nshards)]
+        states: List[list] = [[] for _ in range(nshards)]
+        start: float = time.perf_counter()
+        for craft in data:
+            prepared: Optional[tuple] = self.prepare_craft(craft, prefiltered)
+            if prepared is None:
+                continue
+            icao, craft, known_craft, state = prepared
+            shard: int = zlib.crc32(icao.encode()) % nshards
+            shards[shard].append((icao, craft, known_craft))
+            states[shard].append(state)
+        self.metrics.observe("filter", time.perf_counter() - start)
+
+        executor: ProcessPoolExecutor = self.get_executor()
+        results = await asyncio.gather(
+            *[self.convert_in_pool(executor, shard) for shard in shards if shard]
+        )
+
+        results = iter(results)
+        entries: list = []
+        for shard, shard_states in zip(shards, states):
+            if not shard:
+                continue
+            for (icao, event), state, (_, craft, known_craft) in zip(
+                next(results), shard_states, shard
+            ):
+                if self.budgeted:
+                    entries.append(
+                        (adsbxcot.output_lane(craft, known_craft), icao, event, state)
+                    )
+                else:
+                    await self.emit_craft(icao, event, state)
+
+        if entries:
+            await self.emit_budgeted(entries)
+
+    async def handle_data_budgeted(self, data: list, prefiltered: bool = False) -> None:
+        """Convert a whole snapshot, then send as much of it as OUTPUT_RATE allows."""
+        entries: list = []
+        for craft in data:
+            start: float = time.perf_counter()
+            prepared: Optional[tuple] = self.prepare_craft(craft, prefiltered)
+            converting: float = time.perf_counter()
+            self.metrics.observe("filter", converting - start)
+            if prepared is None:
+                continue
+
+            icao, craft, known_craft, state = prepared
+            event: Optional[bytes] = adsbxcot.adsbx_to_cot(
+                craft,
+                known_craft=known_craft,
+                profile=self.profile,
+                fragments=self.fragments,
+            )
+            self.metrics.observe("convert", time.perf_counter() - converting)
+            entries.append(
+                (adsbxcot.output_lane(craft, known_craft), icao, event, state)
+            )
+
+        await self.emit_budgeted(entries)
+
+    async def emit_budgeted(self, entries: list) -> None:
+        """
+        Put events onto the TX queue within the OUTPUT_RATE / OUTPUT_BYTE_RATE
+        budget. Emergencies are sent at once, even over budget. All other events
+        are held, one per aircraft (a newer event replacing a held one), and
+        released by `pace_output()` as the budget refills: KNOWN_CRAFT first,
+        then all other aircraft by `adsbxcot.output_priority()`.
+
+        Parameters
+        ----------
+        entries : `list`
+            (lane, ICAO, CoT event, change detection state) of each aircraft,
+            with lanes from `adsbxcot.output_lane()`.
+        """
+        if self.output_budget is None:
+            profile: ConversionProfile = self.profile
+            self.output_budget = OutputBudget(
+                profile.output_rate, profile.output_byte_rate, profile.output_burst
+            )
+
+        now: float = time.monotonic()
+        replaced: int = 0
+        for lane, icao, event, state in entries:
+            if not event or lane == 0:
+                if event:
+                    self.output_budget.consume(len(event), now)
+                self.deferred.pop(icao, None)
+                await self.emit_craft(icao, event, state)
+                continue
+            if icao in self.deferred:
+                replaced += 1
+            self.deferred[icao] = (lane, event, state)
+
+        if replaced:
+            self.metrics.filter("budget", replaced)
+            self._logger.debug("Replaced %s events held by the output budget", replaced)
+
+        self.rank_deferred(now)
+        await self.release_deferred(now)
+        if self.deferred and (self.pacer is None or self.pacer.done()):
+            self.pacer = asyncio.get_running_loop().create_task(self.pace_output())
+
+    def rank_deferred(self, now: float) -> None:
+        """Order the held events by lane, then by `adsbxcot.output_priority()`."""
+        profile: ConversionProfile = self.profile
+        self.deferred_order = deque(
+            sorted(
+                self.deferred,
+                key=lambda icao: (
+                    self.deferred[icao][0],
+                    -adsbxcot.output_priority(
+                        self.craft_states.get(icao),
+                        self.deferred[icao][2],
+                        profile,
+                        now,
+                    ),
+                ),
+            )
+        )
+
+    async def release_deferred(self, now: Optional[float] = None) -> Optional[float]:
+        """
+        Send held events, in ranked order, for as long as the budget allows.
+
+        Returns
+        -------
+        `float`
+            Seconds until the next held event can be sent, or None if none are held.
+        """
+        now = time.monotonic() if now is None else now
+        while self.deferred_order:
+            icao: str = self.deferred_order[0]
+            entry: Optional[tuple] = self.deferred.get(icao)
+            if entry is None:
+                self.deferred_order.popleft()
+                continue
+            _, event, state = entry
+            if not self.output_budget.allow(len(event), now):
+                return self.output_budget.delay(len(event), now)
+            self.deferred_order.popleft()
+            del self.deferred[icao]
+            await self.emit_craft(icao, event, state)
+        return None
+
+    async def pace_output(self) -> None:
+        """Release held events as the output budget refills, until none are left."""
+        while True:
+            delay: Optional[float] = await self.release_deferred()
+            if delay is None:
+                return
+            await asyncio.sleep(delay)
+
+    def stop_pacer(self) -> None:
+        """Stop releasing held events, dropping any still held."""
+        if self.pacer is not None:
+            self.pacer.cancel()
+            self.pacer = None
+        self.deferred.clear()
+        self.deferred_order.clear()
+
+    async def extrapolate_tracks(self, now: Optional[float] = None) -> int:
+        """
+        Send the predicted positions of aircraft between polls, for
+        EXTRAPOLATE_INTERVAL, forgetting fixes older than EXTRAPOLATE_MAX_AGE.
+
+        Returns
+        -------
+        `int`
+            Number of aircraft predicted.
+        """
+        profile: ConversionProfile = self.profile
+        now = time.monotonic() if now is None else now
+        entries: list = []
+        for icao, (craft, known_craft, fixed) in list(self.tracks.items()):
+            age: float = now - fixed
+            if age > profile.extrapolate_max_age:
+                del self.tracks[icao]
+                continue
+
+            predicted: Optional[dict] = adsbxcot.extrapolate(craft, age)
+            if predicted is None:
+                continue
+            if self.zones is not None:
+                zones: Optional[Tuple[str, ...]] = self.match_zones(predicted)
+                if zones is None:
+                    continue
+                predicted["x_zones"] = zones or None
+            event: Optional[bytes] = adsbxcot.adsbx_to_cot(
+                predicted,
+                known_craft=known_craft,
+                profile=profile,
+                fragments=self.fragments,
+            )
+            state: Optional[dict] = None
+            if profile.change_detection or self.budgeted:
+                state = adsbxcot.craft_state(predicted)
+            entries.append(
+                (adsbxcot.output_lane(craft, known_craft), icao, event, state)
+            )
+
+        self.metrics.extrapolated += len(entries)
+        if self.budgeted:
+            await self.emit_budgeted(entries)
+        else:
+            for _, icao, event, state in entries:
+                await self.emit_craft(icao, event, state)
+        return len(entries)
+
+    def forget_craft(self, icao: str) -> None:
+        """Drop all per-aircraft state for an aircraft."""
+        self.craft_states.pop(icao, None)
+        self.tracks.pop(icao, None)
+        self.deferred.pop(icao, None)
+        if self._fragments is not None:
+            self._fragments.discard(icao)
+
+    async def expire_craft(self, now: Optional[float] = None) -> int:
+        """
+        Forget aircraft no longer in the feed, after AIRCRAFT_TTL, and send a
+        STALE_OUT event for those that were sent.
+
+        Returns
+        -------
+        `int`
+            Number of aircraft expired.
+        """
+        expired: List[Tuple[str, dict]] = self.registry.expire(now)
+        stale_out: str = self.profile.stale_out
+        for icao, entry in expired:
+            self.forget_craft(icao)
+            if not stale_out or not entry["uid"]:
+                continue
+            if stale_out == "stale" and entry["event"]:
+                event: Optional[bytes] = adsbxcot.stale_event(entry["event"])
+            else:
+                event = adsbxcot.delete_event(entry["uid"], self.profile)
+            if event:
+                self._logger.debug("Staling out %s: %s", icao, entry["uid"])
+                await self.put_queue(event)
+                self.metrics.staled += 1
+
+        if expired:
+            self._logger.info(
+                "%s aircraft left the feed, tracking %s.",
+                len(expired),
+                len(self.registry),
+            )
+        return len(expired)
+
+    async def wait_for_cycle(self, cycle_start: float) -> None:
+        """Sleep until the next poll cycle, extrapolating tracks meanwhile."""
+        loop = asyncio.get_running_loop()
+        interval: Optional[float] = self.profile.extrapolate_interval
+        if interval:
+            while loop.time() + interval < cycle_start:
+                await asyncio.sleep(interval)
+                count: int = await self.extrapolate_tracks()
+                self._logger.debug("Extrapolated %s aircraft.", count)
+        await asyncio.sleep(max(0.0, cycle_start - loop.time()))
+
+    @property
+    def budgeted(self) -> bool:
+        """True if output is limited by OUTPUT_RATE or OUTPUT_BYTE_RATE."""
+        return bool(self.profile.output_rate or self.profile.output_byte_rate)
+
+    async def convert_in_pool(
+        self, executor: ProcessPoolExecutor, shard: list
+    ) -> List[Tuple[str, Optional[bytes]]]:
+        """Convert one shard in the process pool, or inline if the pool has died."""
+        loop = asyncio.get_running_loop()
+        start: float = time.perf_counter()
+        try:
+            events = await loop.run_in_executor(
+                executor, adsbxcot.convert_shard, shard, self.profile
+            )
+        except (BrokenProcessPool, OSError) as exc:
+            self._logger.error("Conversion process died, restarting pool: %s", exc)
+            if self.executor is executor:
+                self.shutdown_executor()
+            events = adsbxcot.convert_shard(shard, self.profile)
+        self.metrics.observe("convert", time.perf_counter() - start)
+        return events
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        """Process pool for CONVERT_PROCESSES, started on first use."""
+        if self.executor is None:
+            # Spawn, rather than fork, as forking a threaded process is unsafe.
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.profile.convert_processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self.executor
+
+    def shutdown_executor(self) -> None:
+        """Stop the CONVERT_PROCESSES process pool, if it was started."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    def batch_filter(self, data: list) -> list:
+        """Filter a whole snapshot at once with NumPy, if it is installed."""
+        if not batch_functions.HAS_NUMPY:
+            return data
+        if self.known_craft_db:
+            # Ensure the index is current before handing it to the batch filter.
+            self.get_known_craft({}, "")
+        survivors: list = batch_functions.batch_filter(
+            data, self.profile, self.known_craft_index if self.known_craft_db else None
+        )
+        self._logger.debug(
+            "Batch filter kept %s of %s aircraft", len(survivors), len(data)
+        )
+        return survivors
+
+    async def process_craft(
+        self, craft: dict, prefiltered: bool = False
+    ) -> Optional[str]:
         """Process individual aircraft data."""
-        if not isinstance(craft, dict):
-            self._logger.warning("Aircraft list item was not a Python `dict`.")
+        start: float = time.perf_counter()
+        prepared: Optional[tuple] = self.prepare_craft(craft, prefiltered)
+        converting: float = time.perf_counter()
+        self.metrics.observe("filter", converting - start)
+        if prepared is None:
             return None
 
-        icao: str = craft.get("hex", craft.get("icao", ""))
-        if icao:
-            icao = icao.strip().upper()
-        else:
+        icao, craft, known_craft, state = prepared
+
+        event: Optional[bytes] = adsbxcot.adsbx_to_cot(
+            craft,
+            known_craft=known_craft,
+            profile=self.profile,
+            fragments=self.fragments,
+        )
+        self.metrics.observe("convert", time.perf_counter() - converting)
+
+        return await self.emit_craft(icao, event, state)
+
+    def prepare_craft(self, craft: dict, prefiltered: bool = False) -> Optional[tuple]:
+        """
+        Filter an aircraft and update its per-aircraft state, ahead of conversion.
+
+        Parameters
+        ----------
+        craft : `dict`
+            Aircraft, as in the feed, or an `Aircraft` record.
+        prefiltered : `bool`
+            True if `craft` is an `Aircraft` record returned by `batch_filter()`,
+            which has already applied the TIS-B, KNOWN_CRAFT and limits filters.
+
+        Returns
+        -------
+        `tuple`
+            The aircraft's ICAO, `Aircraft` record, KNOWN_CRAFT row and change
+            detection state, or None if the aircraft is not to be sent.
+        """
+        if not prefiltered:
+            if not isinstance(craft, (dict, Aircraft)):
+                self._logger.warning("Aircraft list item was not a Python `dict`.")
+                self.metrics.filter("invalid")
+                return None
+            craft = Aircraft(craft)
+
+        icao: Optional[str] = craft.hex
+        if not icao:
             self._logger.warning("No ICAO in craft data: %s", craft)
+            self.metrics.filter("no_uid")
             return None
 
-        if "~" in icao:
-            if not self.config.getboolean("INCLUDE_TISB"):
+        profile: ConversionProfile = self.profile
+
+        if not prefiltered:
+            if craft.tisb and not profile.include_tisb:
+                self.metrics.filter("tisb")
                 return None
-        else:
-            if self.config.getboolean("TISB_ONLY"):
+            if not craft.tisb and profile.tisb_only:
+                self.metrics.filter("not_tisb")
                 return None
 
-        known_craft: dict = aircot.get_known_craft(self.known_craft_db, icao, "HEX")
+        known_craft: dict = self.get_known_craft(craft, icao)
 
-        if (
-            self.known_craft_db
-            and not known_craft
-            and not self.config.getboolean("INCLUDE_ALL_CRAFT")
-        ):
-            self._logger.debug("Not including unknown craft: %s", icao)
-            return None
+        if not prefiltered:
+            if (
+                self.known_craft_db
+                and not known_craft
+                and not profile.include_all_craft
+            ):
+                self._logger.debug("Not including unknown craft: %s", icao)
+                self.metrics.filter("unknown_craft")
+                return None
+
+            if not adsbxcot.craft_in_limits(craft, profile):
+                self._logger.debug("Craft outside BBOX or altitude, or stale: %s", icao)
+                self.metrics.filter("limits")
+                return None
 
         ref_alts = self.calc_altitude(craft)
         craft.update(ref_alts)
@@ -91,19 +1436,219 @@ class ADSBXWorker(pytak.QueueWorker):
             self._logger.debug("No altitude data for craft: %s", icao)
             return None
 
-        event: Optional[bytes] = adsbxcot.adsbx_to_cot(
-            craft, config=self.config, known_craft=known_craft
-        )
+        if craft.get("lat") is None or craft.get("lon") is None:
+            self._logger.debug("No position for craft: %s", icao)
+            self.metrics.filter("no_position")
+            return None
+
+        if self.zones is not None:
+            zones: Optional[Tuple[str, ...]] = self.match_zones(craft)
+            if zones is None:
+                self._logger.debug("Craft filtered by ZONE_FILTER: %s", icao)
+                self.metrics.filter("zone")
+                return None
+            craft["x_zones"] = zones or None
+
+        evicted: Optional[str] = self.registry.seen(icao)
+        if evicted is not None:
+            self.forget_craft(evicted)
+
+        if profile.extrapolate_interval:
+            seen_pos = craft.get("seen_pos")
+            self.tracks[icao] = (
+                craft,
+                known_craft,
+                time.monotonic()
+                - (seen_pos if isinstance(seen_pos, (int, float)) else 0),
+            )
 
+        state: Optional[dict] = None
+        if profile.change_detection or self.budgeted:
+            state = adsbxcot.craft_state(craft)
+        if profile.change_detection:
+            if not self.craft_due(icao, state):
+                self._logger.debug("Unchanged craft: %s", icao)
+                self.metrics.filter("unchanged")
+                return None
+
+        return icao, craft, known_craft, state
+
+    async def emit_craft(
+        self, icao: str, event: Optional[bytes], state: Optional[dict] = None
+    ) -> Optional[str]:
+        """Put an aircraft's CoT event onto the TX queue, and record it as sent."""
         if not event:
             self._logger.debug("Empty CoT for craft: %s", icao)
+            self.metrics.filter("no_cot")
             return None
 
+        start: float = time.perf_counter()
+        if self.queue.full():
+            self.metrics.dropped += 1
         await self.put_queue(event)
+        self.metrics.observe("enqueue", time.perf_counter() - start)
+        self.metrics.emitted += 1
+
+        uid: Optional[bytes] = adsbxcot.cot_uid(event)
+        self.registry.sent(
+            icao,
+            uid.decode() if uid else None,
+            event if self.profile.stale_out == "stale" else None,
+        )
+
+        if state is not None:
+            state["sent"] = time.monotonic()
+            self.craft_states[icao] = state
+
         return icao
 
+    @property
+    def profile(self) -> ConversionProfile:
+        """Conversion profile compiled from the config, on first use."""
+        if self._profile is None:
+            self._profile = adsbxcot.compile_profile(self.config)
+        return self._profile
+
+    @property
+    def fragments(self) -> Optional[CotFragmentCache]:
+        """Static CoT field cache, unless FRAGMENT_CACHE_SIZE is 0."""
+        if self._fragments is None and self.profile.fragment_cache_size > 0:
+            self._fragments = CotFragmentCache(self.profile.fragment_cache_size)
+        return self._fragments
+
+    def get_known_craft(self, craft: dict, icao: str) -> dict:
+        """Look up an aircraft in the KNOWN_CRAFT index."""
+        if not self.known_craft_db:
+            return {}
+        if self.known_craft_index is None or (
+            self.known_craft_index.rows is not self.known_craft_db
+        ):
+            self.known_craft_index = KnownCraftIndex(self.known_craft_db)
+        return self.known_craft_index.lookup(icao, craft.get("r"), craft.get("flight"))
+
+    async def load_known_craft(self) -> None:
+        """(Re)load the KNOWN_CRAFT file and its index if the file has changed."""
+        known_craft: Optional[str] = self.config.get("KNOWN_CRAFT")
+        if not known_craft:
+            return
+
+        try:
+            mtime: int = os.stat(known_craft).st_mtime_ns
+        except OSError as exc:
+            self._logger.warning("Unable to read KNOWN_CRAFT: %s", exc)
+            return
+
+        if mtime == self.known_craft_mtime:
+            return
+
+        loop = asyncio.get_running_loop()
+        try:
+            rows: list = await loop.run_in_executor(
+                None, aircot.read_known_craft, known_craft
+            )
+            index = await loop.run_in_executor(None, KnownCraftIndex, rows)
+        except (OSError, UnicodeDecodeError, csv.Error) as exc:
+            self._logger.warning("Unable to read KNOWN_CRAFT: %s", exc)
+            return
+
+        self._logger.info(
+            "%s KNOWN_CRAFT: %s (%s craft)",
+            "Reloaded" if self.known_craft_mtime else "Using",
+            known_craft,
+            len(index),
+        )
+        # Swap both together, so lookups never see a mismatched db and index:
+        self.known_craft_db, self.known_craft_index = rows, index
+        self.known_craft_mtime = mtime
+
+    def match_zones(self, craft: dict) -> Optional[Tuple[str, ...]]:
+        """
+        Names of the ZONES an aircraft is in, or None if ZONE_FILTER drops it.
+        """
+        lat, lon = craft.get("lat"), craft.get("lon")
+        zones: Tuple[str, ...] = ()
+        if isinstance(lat, (int, float)) and isinstance(lon, (int, float)):
+            zones = self.zones.lookup(lat, lon)  # type: ignore
+        zone_filter: str = self.profile.zone_filter
+        if (zone_filter == "inside" and not zones) or (
+            zone_filter == "outside" and zones
+        ):
+            return None
+        return zones
+
+    async def load_zones(self) -> None:
+        """(Re)load the ZONES file and its index if the file has changed."""
+        zones_file: Optional[str] = self.config.get("ZONES")
+        if not zones_file:
+            return
+
+        try:
+            mtime: int = os.stat(zones_file).st_mtime_ns
+        except OSError as exc:
+            self._logger.warning("Unable to read ZONES: %s", exc)
+            return
+
+        if mtime == self.zones_mtime:
+            return
+
+        loop = asyncio.get_running_loop()
+        try:
+            zones: list = await loop.run_in_executor(
+                None,
+                adsbxcot.read_zones,
+                zones_file,
+                self.config.get("ZONE_NAME_PROPERTY") or "name",
+            )
+            index = await loop.run_in_executor(
+                None,
+                ZoneIndex,
+                zones,
+                float(
+                    self.config.get("ZONE_CELL_SIZE") or adsbxcot.DEFAULT_ZONE_CELL_SIZE
+                ),
+            )
+        except (OSError, UnicodeDecodeError, ValueError) as exc:
+            self._logger.warning("Unable to read ZONES: %s", exc)
+            return
+
+        self._logger.info(
+            "%s ZONES: %s (%s zones, %s cells)",
+            "Reloaded" if self.zones_mtime else "Using",
+            zones_file,
+            len(index),
+            len(index.cells),
+        )
+        self.zones = index
+        self.zones_mtime = mtime
+
+    def craft_due(self, icao: str, state: dict) -> bool:
+        """Determine if an aircraft has changed, or is due for a heartbeat."""
+        prev: Optional[dict] = self.craft_states.get(icao)
+        if not prev:
+            return True
+
+        profile: ConversionProfile = self.profile
+        if time.monotonic() - prev["sent"] >= profile.heartbeat_interval:
+            return True
+
+        return adsbxcot.craft_changed(
+            prev,
+            state,
+            min_position=profile.min_position_change,
+            min_altitude=profile.min_altitude_change,
+            min_track=profile.min_track_change,
+            min_speed=profile.min_speed_change,
+        )
+
     def calc_altitude(self, craft: dict) -> dict:
-        """Calculate altitude based on barometric and geometric altitude."""
+        """
+        Calculate altitude based on barometric and geometric altitude.
+
+        Aircraft reporting both altitudes update the reference offset for
+        themselves and their region. Aircraft reporting only barometric
+        altitude get a geometric altitude from their own recent offset, or
+        from that of their region or the nearest neighbouring region.
+        """
         alt_baro = craft.get("alt_baro", "")
         alt_geom = craft.get("alt_geom", "")
 
@@ -114,28 +1659,25 @@ class ADSBXWorker(pytak.QueueWorker):
             return {}
 
         alt_baro = float(alt_baro)
+        icao: str = str(craft.get("hex", craft.get("icao", ""))).strip().upper()
+        lat: Optional[float] = craft.get("lat")
+        lon: Optional[float] = craft.get("lon")
+
         if alt_geom:
-            self.altitudes["alt_geom"] = float(alt_geom)
-            self.altitudes["alt_baro"] = alt_baro
-        elif "alt_baro" in self.altitudes and "alt_geom" in self.altitudes:
-            ref_alt_baro = float(self.altitudes["alt_baro"])
-            alt_baro_offset = alt_baro - ref_alt_baro
-            return {
-                "x_alt_baro_offset": alt_baro_offset,
-                "x_alt_geom": ref_alt_baro + alt_baro_offset,
-            }
+            self.altitudes.update(icao, float(alt_geom) - alt_baro, lat, lon)
+            return {}
 
-        return {}
+        alt_baro_offset: Optional[float] = self.altitudes.get(icao, lat, lon)
+        if alt_baro_offset is None:
+            return {}
 
-    async def get_feed(self, url: str) -> None:
-        """
-        ADS-B Aggregator API Client wrapper.
-        Connects to API and passes messages to `self.handle_message()`.
-        """
-        if self.session is None or self.session.closed:
-            self._logger.error("Session is closed, cannot proceed.")
-            return
+        return {
+            "x_alt_baro_offset": alt_baro_offset,
+            "x_alt_geom": alt_baro + alt_baro_offset,
+        }
 
+    def feed_headers(self, url: str) -> dict:
+        """HTTP headers for the given ADS-B Aggregator API URL."""
         api_key: str = self.config.get("API_KEY")
 
         # Support for either direct ADSBX API, or RapidAPI:
@@ -146,38 +1688,464 @@ class ADSBXWorker(pytak.QueueWorker):
                     "RAPIDAPI_HOST", adsbxcot.DEFAULT_RAPIDAPI_HOST
                 ),
             }
-        else:
+        elif adsbxcot.is_adsbx_url(url):
             headers = {"api-auth": api_key}
+        else:
+            # Never send the key to other feeds (adsb.fi, tar1090, et al.):
+            headers = {}
+
+        return {key: val for key, val in headers.items() if val}
 
+    async def fetch_feed(self, url: str, stream: bool = False) -> Optional[list]:
+        """
+        ADS-B Aggregator API Client.
+        Connects to API and returns the list of aircraft, or if `stream` is set,
+        processes each aircraft as it arrives and returns None.
+        """
+        if self.session is None or self.session.closed:
+            self._logger.error("Session is closed, cannot proceed.")
+            return None
+
+        if not self.feed_ready(url):
+            return None
+
+        headers: dict = self.feed_headers(url)
+
+        try:
+            return await self._fetch_feed(url, headers, stream)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            self._logger.warning("Error polling %s: %s", url, exc)
+            self.feed_failed(url)
+            return None
+
+    async def _fetch_feed(
+        self, url: str, headers: dict, stream: bool = False
+    ) -> Optional[list]:
+        """Request a feed, backing off on HTTP 429/5xx, and decode its aircraft."""
+        start: float = time.perf_counter()
         async with self.session.get(url=url, headers=headers) as resp:
             if resp.status != 200:
                 response_content = await resp.text()
                 self._logger.warning("Received HTTP Status %s for %s", resp.status, url)
                 self._logger.warning(response_content)
-                return
+                if resp.status == 429 or resp.status >= 500:
+                    self.feed_failed(url, resp.headers.get("Retry-After"))
+                return None
 
-            json_resp = await resp.json()
+            self.backoffs.pop(url, None)
+
+            if stream:
+                await self.stream_feed(resp, url)
+                return None
+
+            body: bytes = await resp.read()
+            decoding: float = time.perf_counter()
+            self.metrics.observe("fetch", decoding - start)
+
+            try:
+                json_resp = self.decode_json(body)
+            except ValueError as exc:
+                self._logger.warning("Invalid JSON response from %s: %s", url, exc)
+                if self.recorder is not None:
+                    self.recorder.record(url, body, valid=False)
+                return None
+            self.metrics.observe("decode", time.perf_counter() - decoding)
+
+            if self.recorder is not None:
+                self.recorder.record(url, body)
             if json_resp is None:
                 self._logger.warning("No JSON response from %s", url)
-                return
+                return None
 
-            data = json_resp.get("ac")
+            data = adsbxcot.get_aircraft(json_resp)
             if data is None:
-                self._logger.warning("No 'ac' key in JSON response from %s", url)
-                return
+                self._logger.warning("No aircraft list in JSON response from %s", url)
+                return None
 
             self._logger.info("Retrieved %s aircraft messages.", str(len(data) or "No"))
+            return data
+
+    def feed_ready(self, url: str) -> bool:
+        """Determine if a feed may be polled, given its backoff and request budget."""
+        backoff: Optional[dict] = self.backoffs.get(url)
+        if backoff and time.monotonic() < backoff["until"]:
+            self._logger.debug("Backing off %s", url)
+            return False
+
+        if self.request_budget and "rapidapi" in url.lower():
+            if not self.request_budget.acquire():
+                self._logger.warning(
+                    "REQUEST_BUDGET of %s exhausted, not polling %s",
+                    self.request_budget.limit,
+                    url,
+                )
+                return False
+
+        return True
+
+    def feed_failed(self, url: str, retry_after: Optional[str] = None) -> None:
+        """Back off from a feed, honoring its Retry-After header if given."""
+        failures: int = self.backoffs.get(url, {}).get("failures", 0) + 1
+        delay: float = adsbxcot.parse_retry_after(
+            retry_after
+        ) or adsbxcot.backoff_delay(
+            failures,
+            float(self.config.get("MIN_BACKOFF") or adsbxcot.DEFAULT_MIN_BACKOFF),
+            float(self.config.get("MAX_BACKOFF") or adsbxcot.DEFAULT_MAX_BACKOFF),
+        )
+        self._logger.warning("Backing off %s for %.1fs", url, delay)
+        self.backoffs[url] = {"failures": failures, "until": time.monotonic() + delay}
+
+    async def get_feed(self, url: str) -> None:
+        """
+        ADS-B Aggregator API Client wrapper.
+        Connects to API and passes messages to `self.handle_message()`.
+        """
+        data: Optional[list] = await self.fetch_feed(
+            url, stream=bool(self.config.getboolean("STREAM_PARSE"))
+        )
+        if data is None:
+            return
+        await self.handle_data(data)
+
+    async def get_feeds(self, urls: List[str]) -> None:
+        """
+        Polls several ADS-B Aggregator APIs concurrently, merges their aircraft by
+        ICAO keeping the freshest position, and passes them to `self.handle_data()`.
+        """
+        limit = asyncio.Semaphore(
+            int(
+                self.config.get("MAX_CONCURRENT_FEEDS")
+                or adsbxcot.DEFAULT_MAX_CONCURRENT_FEEDS
+            )
+        )
+
+        async def fetch(url: str) -> Optional[list]:
+            async with limit:
+                return await self.fetch_feed(url)
+
+        results = await asyncio.gather(
+            *[fetch(url) for url in urls], return_exceptions=True
+        )
+
+        feeds: List[list] = []
+        for url, result in zip(urls, results):
+            if isinstance(result, BaseException):
+                self._logger.warning("Error polling %s: %s", url, result)
+            elif isinstance(result, list):
+                feeds.append(result)
+
+        if not feeds:
+            return
+
+        data: list = adsbxcot.merge_aircraft(feeds)
+        self._logger.info(
+            "Merged %s aircraft from %s of %s feeds.", len(data), len(feeds), len(urls)
+        )
+        await self.handle_data(data)
+
+    async def stream_feed(self, resp: aiohttp.ClientResponse, url: str) -> None:
+        """Parse the aircraft array as it streams in, processing each aircraft."""
+        parser = adsbxcot.AircraftStreamParser()
+        chunk_size: int = int(
+            self.config.get("STREAM_CHUNK_SIZE") or adsbxcot.DEFAULT_STREAM_CHUNK_SIZE
+        )
+        count: int = 0
+        recording: Optional[FeedRecording] = (
+            self.recorder.start(url) if self.recorder is not None else None
+        )
+        # Only record the response as JSON once all of it has parsed:
+        complete: bool = False
+        # The output budget, BATCH_FILTER and CONVERT_PROCESSES all work on the
+        # whole snapshot, so it is collected and passed to handle_data():
+        whole: bool = (
+            self.budgeted
+            or self.profile.batch_filter
+            or self.profile.convert_processes > 0
+        )
+        snapshot: List[dict] = []
+        # Fetch and decode overlap with processing, so each is timed per chunk:
+        fetch_time: float = 0.0
+        decode_time: float = 0.0
+        waiting: float = time.perf_counter()
+        try:
+            async for chunk in resp.content.iter_chunked(chunk_size):
+                decoding: float = time.perf_counter()
+                fetch_time += decoding - waiting
+                if recording is not None:
+                    recording.write(chunk)
+                try:
+                    crafts: List[dict] = parser.feed(chunk)
+                except ValueError as exc:
+                    self._logger.warning("Invalid JSON response from %s: %s", url, exc)
+                    return
+                decode_time += time.perf_counter() - decoding
+                for craft in crafts:
+                    count += 1
+                    if whole:
+                        snapshot.append(craft)
+                        continue
+                    self.metrics.received += 1
+                    await self.process_craft(craft)
+                waiting = time.perf_counter()
+            try:
+                crafts = parser.close()
+            except ValueError as exc:
+                self._logger.warning("Invalid JSON response from %s: %s", url, exc)
+                return
+            complete = True
+            for craft in crafts:
+                count += 1
+                if whole:
+                    snapshot.append(craft)
+                    continue
+                self.metrics.received += 1
+                await self.process_craft(craft)
+        finally:
+            self.metrics.observe("fetch", fetch_time)
+            self.metrics.observe("decode", decode_time)
+            if recording is not None:
+                recording.finish(complete)
+
+        if not parser.found:
+            self._logger.warning("No aircraft list in JSON response from %s", url)
+            return
+
+        self._logger.info("Retrieved %s aircraft messages.", str(count or "No"))
+        if snapshot:
+            await self.handle_data(snapshot)
+
+    async def start_metrics_server(self) -> None:
+        """Serve `self.metrics` in Prometheus text format, if METRICS_PORT is set."""
+        port = self.config.get("METRICS_PORT")
+        if not port:
+            return
+
+        async def handler(_request: aiohttp.web.Request) -> aiohttp.web.Response:
+            return aiohttp.web.Response(
+                text=self.metrics.render(self.queue, len(self.registry)),
+                content_type="text/plain",
+                headers={"Cache-Control": "no-cache"},
+            )
+
+        app = aiohttp.web.Application()
+        app.router.add_get("/metrics", handler)
+        self.metrics_runner = aiohttp.web.AppRunner(app, access_log=None)
+        await self.metrics_runner.setup()
+        host: str = self.config.get("METRICS_HOST") or adsbxcot.DEFAULT_METRICS_HOST
+        await aiohttp.web.TCPSite(self.metrics_runner, host, int(port)).start()
+        self._logger.info("Serving metrics on http://%s:%s/metrics", host, port)
+
+    async def stop_metrics_server(self) -> None:
+        """Stop serving metrics."""
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+            self.metrics_runner = None
+
+    async def replay(self, source: str, speed: float, interval: float) -> int:
+        """
+        Replays recorded feed responses through `handle_data()`.
+
+        Parameters
+        ----------
+        source : `str`
+            Recording file or directory, see `adsbxcot.read_replay()`.
+        speed : `float`
+            Multiple of the recorded cadence to replay at, or 0 for no delay.
+        interval : `float`
+            Cadence, in seconds, between responses without a recorded time.
+
+        Returns
+        -------
+        `int`
+            Number of responses replayed.
+        """
+        loop = asyncio.get_running_loop()
+        responses = adsbxcot.read_replay(source)
+        count: int = 0
+        recorded: Optional[float] = None
+        next_start: float = loop.time()
+
+        while True:
+            response = await loop.run_in_executor(None, next, responses, None)
+            if response is None:
+                break
+
+            now: Optional[float] = adsbxcot.response_time(response)
+            if speed > 0 and count:
+                gap: float = now - recorded if None not in (now, recorded) else interval
+                next_start += max(0.0, gap) / speed
+                await asyncio.sleep(max(0.0, next_start - loop.time()))
+            recorded = now
+            count += 1
+
+            data = (
+                response
+                if isinstance(response, list)
+                else adsbxcot.get_aircraft(response)
+            )
+            self._logger.info(
+                "Replaying response %s, %s aircraft.", count, len(data or [])
+            )
+            start: float = time.perf_counter()
             await self.handle_data(data)
+            self.metrics.observe("cycle", time.perf_counter() - start)
+            await self.expire_craft()
+
+        return count
+
+    async def watch_file(
+        self, path: str, interval: float, inotify: bool = True
+    ) -> None:
+        """
+        Reads a local feed file, such as readsb's ``aircraft.json``, each time it
+        is rewritten, and passes its aircraft to `handle_data()`.
+
+        Parameters
+        ----------
+        path : `str`
+            Feed file, holding one JSON response with an ``aircraft`` or ``ac``
+            list.
+        interval : `float`
+            Longest time, in seconds, between checks of the file.
+        inotify : `bool`
+            Use inotify, where available, rather than checking every `interval`.
+        """
+        watcher = FileWatcher(path, interval)
+        self._logger.info(
+            "%s watching %s%s",
+            self.__class__,
+            path,
+            " with inotify" if watcher.start(inotify) else f" every {interval}s",
+        )
+        signature: Optional[Tuple[int, int, int]] = None
+        crc: Optional[int] = None
+        try:
+            while True:
+                new_signature = adsbxcot.file_signature(path)
+                if new_signature is not None and new_signature != signature:
+                    crc = await self.read_feed_file(path, crc)
+                    # Only skip this version of the file once it has been read:
+                    signature = new_signature if crc is not None else None
+                await watcher.wait()
+        finally:
+            watcher.close()
+
+    async def read_feed_file(self, path: str, crc: Optional[int]) -> Optional[int]:
+        """
+        Read the feed file if its contents changed, returning its CRC-32, or
+        None if it could not be read, so it is read again on the next check.
+        """
+        await self.load_known_craft()
+        await self.load_zones()
+        start: float = time.perf_counter()
+        try:
+            crc, body = adsbxcot.read_feed_file(path, crc)
+        except OSError as exc:
+            self._logger.warning("Error reading %s: %s", path, exc)
+            return None
+        decoding: float = time.perf_counter()
+        self.metrics.observe("fetch", decoding - start)
+        if body is None:
+            return crc
+
+        try:
+            response = self.decode_json(body)
+        except ValueError as exc:
+            # Most likely caught mid-write, so read it again next time:
+            self._logger.warning("Invalid JSON in %s: %s", path, exc)
+            return None
+        self.metrics.observe("decode", time.perf_counter() - decoding)
+
+        data = response
+        if isinstance(response, dict):
+            data = response.get("aircraft", response.get("ac"))
+        if not isinstance(data, list):
+            self._logger.warning("No 'aircraft' key in JSON from %s", path)
+            return crc
+
+        self._logger.debug("Read %s aircraft from %s", len(data), path)
+        await self.handle_data(data)
+        self.metrics.observe("cycle", time.perf_counter() - start)
+        await self.expire_craft()
+        return crc
 
     async def run(self, _=-1) -> None:
         """Runs this Thread, Reads from Pollers."""
         self._logger.info("Running %s", self.__class__)
 
-        url: Optional[str] = self.config.get("FEED_URL")
-        if not url:
+        self._profile = adsbxcot.compile_profile(self.config)
+        if self._profile.batch_filter and not batch_functions.HAS_NUMPY:
+            self._logger.warning(
+                "BATCH_FILTER is set, but the 'numpy' Python module is not installed."
+                "\nTry: python -m pip install adsbxcot[with_numpy]"
+            )
+
+        replay_source = self.config.get("REPLAY_SOURCE")
+        if replay_source:
+            speed: float = float(
+                self.config.get("REPLAY_SPEED", adsbxcot.DEFAULT_REPLAY_SPEED)
+            )
+            if speed < 0:
+                raise ValueError(f"Invalid REPLAY_SPEED: {speed}")
+            await self.load_known_craft()
+            await self.load_zones()
+            await self.start_metrics_server()
+            try:
+                count: int = await self.replay(
+                    replay_source,
+                    speed,
+                    float(
+                        self.config.get("POLL_INTERVAL")
+                        or adsbxcot.DEFAULT_POLL_INTERVAL
+                    ),
+                )
+            finally:
+                self.shutdown_executor()
+                self.stop_pacer()
+                await self.stop_metrics_server()
+            self._logger.info("Replayed %s responses from %s", count, replay_source)
+            # Give the TX worker a chance to send everything before exiting:
+            while not self.queue.empty():
+                await asyncio.sleep(0.1)
+            return
+
+        feed_file = self.config.get("FEED_FILE")
+        if feed_file:
+            await self.load_known_craft()
+            await self.load_zones()
+            await self.start_metrics_server()
+            try:
+                await self.watch_file(
+                    feed_file,
+                    float(
+                        self.config.get("FEED_FILE_INTERVAL")
+                        or adsbxcot.DEFAULT_FEED_FILE_INTERVAL
+                    ),
+                )
+            finally:
+                self.shutdown_executor()
+                self.stop_pacer()
+                await self.stop_metrics_server()
+            return
+
+        urls: List[str] = adsbxcot.get_feed_urls(self.config.get("FEED_URL"))
+        if not urls:
             self._logger.error("FEED_URL not set in config, cannot proceed.")
             raise ValueError("FEED_URL not set in config, cannot proceed.")
 
+        area = adsbxcot.parse_area(self.config.get("BBOX"), self.config.get("POLYGON"))
+        if area:
+            urls = adsbxcot.tile_feed_urls(
+                urls,
+                area,
+                float(self.config.get("TILE_DIST") or adsbxcot.DEFAULT_TILE_DIST),
+            )
+            self._logger.info("Covering area with %s feed requests.", len(urls))
+        if any("{lat}" in url for url in urls):
+            self._logger.error("FEED_URL has {lat}/{lon} but no BBOX or POLYGON set.")
+            raise ValueError("FEED_URL has {lat}/{lon} but no BBOX or POLYGON set.")
+
         poll_interval: Union[int, str, None] = self.config.get("POLL_INTERVAL")
         if poll_interval == "" or poll_interval is None:
             self._logger.info(
@@ -186,15 +2154,76 @@ class ADSBXWorker(pytak.QueueWorker):
             )
             poll_interval = adsbxcot.DEFAULT_POLL_INTERVAL
 
-        known_craft = self.config.get("KNOWN_CRAFT")
-        if known_craft:
-            self._logger.info("Using KNOWN_CRAFT: %s", known_craft)
-            self.known_craft_db = aircot.read_known_craft(known_craft)
+        interval: float = float(poll_interval)
+
+        request_budget = self.config.get("REQUEST_BUDGET")
+        if request_budget:
+            period: float = float(
+                self.config.get("REQUEST_BUDGET_PERIOD")
+                or adsbxcot.DEFAULT_REQUEST_BUDGET_PERIOD
+            )
+            self.request_budget = RequestBudget(int(request_budget), period)
+            if period / int(request_budget) > interval:
+                self._logger.warning(
+                    "REQUEST_BUDGET of %s per %ss will run out early at a "
+                    "POLL_INTERVAL of %ss.",
+                    request_budget,
+                    period,
+                    interval,
+                )
+
+        await self.load_known_craft()
+        await self.load_zones()
 
+        record_dir = self.config.get("RECORD_DIR")
+        if record_dir:
+            os.makedirs(record_dir, exist_ok=True)
+            self.recorder = FeedRecorder(
+                record_dir,
+                float(
+                    self.config.get("RECORD_ROTATE") or adsbxcot.DEFAULT_RECORD_ROTATE
+                ),
+            )
+            self._logger.info("Recording feed responses to %s", record_dir)
+
+        await self.start_metrics_server()
+        try:
+            await self.poll_feeds(urls, interval)
+        finally:
+            self.shutdown_executor()
+            self.stop_pacer()
+            await self.stop_metrics_server()
+            if self.recorder is not None:
+                self.recorder.close()
+
+    async def poll_feeds(self, urls: List[str], interval: float) -> None:
+        """Polls the feed URLs every `interval` seconds, until the session closes."""
+        loop = asyncio.get_running_loop()
         async with aiohttp.ClientSession() as self.session:
+            cycle_start: float = loop.time()
             while self.session.closed is False:
+                await self.load_known_craft()
+                await self.load_zones()
                 self._logger.info(
-                    "%s polling every %ss: %s", self.__class__, poll_interval, url
+                    "%s polling every %ss: %s",
+                    self.__class__,
+                    interval,
+                    urls[0] if len(urls) == 1 else f"{len(urls)} URLs",
+                )
+                start: float = time.perf_counter()
+                if len(urls) == 1:
+                    await self.get_feed(urls[0])
+                else:
+                    await self.get_feeds(urls)
+                self.metrics.observe("cycle", time.perf_counter() - start)
+                await self.expire_craft()
+
+                cycle_start, skipped = adsbxcot.next_cycle(
+                    cycle_start, interval, loop.time()
                 )
-                await self.get_feed(url)
-                await asyncio.sleep(int(poll_interval))
+                if skipped:
+                    self._logger.warning(
+                        "Poll cycle overran POLL_INTERVAL, skipping %s cycle(s).",
+                        skipped,
+                    )
+                await self.wait_for_cycle(cycle_start)
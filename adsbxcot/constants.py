@@ -18,3 +18,89 @@
 
 DEFAULT_POLL_INTERVAL: int = 30
 DEFAULT_RAPIDAPI_HOST: str = "adsb-exchange1.p.rapidapi.com"
+
+# Change detection thresholds, used when CHANGE_DETECTION is enabled:
+DEFAULT_MIN_POSITION_CHANGE: int = 100  # meters
+DEFAULT_MIN_ALTITUDE_CHANGE: int = 100  # feet
+DEFAULT_MIN_TRACK_CHANGE: int = 5  # degrees
+DEFAULT_MIN_SPEED_CHANGE: int = 5  # knots
+
+# Bytes read from the HTTP response per chunk when STREAM_PARSE is enabled:
+DEFAULT_STREAM_CHUNK_SIZE: int = 65536
+
+# Backoff, in seconds, after HTTP 429/5xx or connection errors (before jitter):
+DEFAULT_MIN_BACKOFF: int = 10
+DEFAULT_MAX_BACKOFF: int = 600
+
+# Period, in seconds, of the REQUEST_BUDGET for metered RapidAPI keys (30 days):
+DEFAULT_REQUEST_BUDGET_PERIOD: int = 2592000
+
+# Radius, in nautical miles, of each lat/lon/dist tile covering a BBOX or POLYGON:
+DEFAULT_TILE_DIST: int = 100
+
+# Domains (and their subdomains) sent API_KEY as an ``api-auth`` header:
+ADSBX_API_DOMAINS: tuple = ("adsbexchange.com",)
+
+# Keys of the aircraft list in ADSBX v2 (and adsb.fi et al.) responses, and in
+# readsb/tar1090 aircraft.json:
+AIRCRAFT_KEYS: tuple = ("ac", "aircraft")
+
+# Maximum number of feed (or tile) requests in flight at once:
+DEFAULT_MAX_CONCURRENT_FEEDS: int = 8
+
+# Baro to geometric altitude reference cache:
+DEFAULT_ALT_CACHE_SIZE: int = 50000  # aircraft
+DEFAULT_ALT_CACHE_TTL: int = 600  # seconds
+DEFAULT_ALT_CELL_SIZE: float = 1.0  # degrees
+
+# Multiple of the recorded cadence at which REPLAY_SOURCE is replayed (0: no delay):
+DEFAULT_REPLAY_SPEED: float = 1.0
+
+# Period, in seconds, after which RECORD_DIR starts a new archive:
+DEFAULT_RECORD_ROTATE: int = 3600
+
+# Address the METRICS_PORT endpoint listens on (local only, by default):
+DEFAULT_METRICS_HOST: str = "127.0.0.1"
+
+# Squawks that always go first, and are never held back, under an OUTPUT_RATE:
+EMERGENCY_SQUAWKS: tuple = ("7500", "7600", "7700")
+
+# Age, in seconds, of a position fix after which EXTRAPOLATE_INTERVAL stops
+# predicting an aircraft's position:
+DEFAULT_EXTRAPOLATE_MAX_AGE: int = 60
+
+# POLL_INTERVALs an aircraft may be missing from the feed before it is
+# forgotten (and STALE_OUT sent), capped at COT_STALE:
+DEFAULT_AIRCRAFT_TTL_POLLS: int = 3
+
+# Aircraft tracked at once, for STALE_OUT and bounding per-aircraft state:
+DEFAULT_REGISTRY_SIZE: int = 50000
+
+# Aircraft whose static CoT fields (UID, callsign, type, remarks) are cached:
+DEFAULT_FRAGMENT_CACHE_SIZE: int = 50000
+
+# Size, in degrees, of the grid cells ZONES are indexed by:
+DEFAULT_ZONE_CELL_SIZE: float = 0.25
+
+# Valid values for STALE_OUT:
+STALE_OUT_EVENTS: tuple = ("stale", "delete")
+
+# Seconds between checks of FEED_FILE for changes, if inotify is unavailable:
+DEFAULT_FEED_FILE_INTERVAL: float = 0.5
+
+# Size, in bytes, from which FEED_FILE is read through a memory map rather than
+# copied with read(). Smaller files are not worth mapping, and read() is safe
+# if the file is truncated underneath it, where touching a map would SIGBUS:
+FEED_FILE_MMAP_SIZE: int = 1 << 20
+
+# Valid values for COT_SERIALIZER:
+COT_SERIALIZERS: tuple = ("xml", "template", "protobuf")
+
+# Valid values for TAK_PROTO_FRAMING:
+TAK_PROTO_FRAMINGS: tuple = ("mesh", "stream")
+
+# Valid values for JSON_DECODER:
+JSON_DECODERS: tuple = ("json", "orjson", "msgspec", "auto")
+
+# Valid values for ZONE_FILTER:
+ZONE_FILTERS: tuple = ("inside", "outside")
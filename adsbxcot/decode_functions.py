@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright Sensors & Signals LLC https://www.snstac.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""ADSBXCOT Feed Response (JSON) Decoding Functions."""
+
+import json
+import logging
+
+from typing import Callable, List, Union
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover
+    msgspec = None  # type: ignore
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+import adsbxcot  # pylint: disable=cyclic-import
+
+HAS_MSGSPEC: bool = msgspec is not None
+HAS_ORJSON: bool = orjson is not None
+
+Number = Union[int, float]
+
+# Aircraft fields read by ADSBXCOT, and their types in readsb/ADSBX responses.
+# Numbers keep whichever of int or float the feed sent, as `json.loads()` would:
+AIRCRAFT_FIELDS: dict = {
+    "hex": str,
+    "icao": str,
+    "type": str,
+    "flight": str,
+    "r": str,
+    "t": str,
+    "category": str,
+    "squawk": str,
+    "lat": Number,
+    "lon": Number,
+    "alt_baro": Union[int, float, str],
+    "alt_geom": Number,
+    "alt_geom_x": Number,
+    "gs": Number,
+    "track": Number,
+    "baro_rate": Number,
+    "geom_rate": Number,
+    "seen_pos": Number,
+    "seen": Number,
+    "nac_p": Number,
+    "nac_v": Number,
+}
+
+_logger = logging.getLogger(__name__)
+_msgspec_decoder = None
+
+
+def decode_json(body: bytes):
+    """Decode a feed response with the standard library."""
+    return json.loads(body)
+
+
+def decode_orjson(body: bytes):
+    """Decode a feed response with orjson, keeping every field."""
+    return orjson.loads(body)
+
+
+def msgspec_decoder() -> "msgspec.json.Decoder":
+    """
+    Decoder for feed responses, keeping only the `AIRCRAFT_FIELDS` of each
+    aircraft, as plain `dict`s.
+    """
+    global _msgspec_decoder  # pylint: disable=global-statement
+    if _msgspec_decoder is None:
+        # TypedDict, like msgspec, needs Python 3.8+:
+        from typing import TypedDict  # pylint: disable=import-outside-toplevel
+
+        aircraft = TypedDict("Aircraft", AIRCRAFT_FIELDS, total=False)  # type: ignore
+        response = TypedDict(  # type: ignore
+            "FeedResponse",
+            {"now": Number, "ac": List[aircraft], "aircraft": List[aircraft]},
+            total=False,
+        )
+        _msgspec_decoder = msgspec.json.Decoder(response)
+    return _msgspec_decoder
+
+
+def decode_msgspec(body: bytes):
+    """
+    Decode a feed response with msgspec, straight into `dict`s of only the
+    `AIRCRAFT_FIELDS`, skipping every other field.
+
+    Responses that do not fit the schema (a field of an unexpected type, say)
+    are decoded with `decode_json()` instead.
+    """
+    try:
+        return msgspec_decoder().decode(body)
+    except msgspec.ValidationError as exc:
+        _logger.debug("Response does not fit schema (%s), using json.", exc)
+        return json.loads(body)
+    except msgspec.DecodeError as exc:
+        raise ValueError(str(exc)) from exc
+
+
+def get_decoder(name: str = "json") -> Callable[[bytes], object]:
+    """
+    Get the JSON_DECODER decode function.
+
+    Parameters
+    ----------
+    name : `str`
+        ``json``, ``orjson``, ``msgspec``, or ``auto`` for the fastest installed.
+        Falls back to ``json``, with a warning, if the module is not installed.
+
+    Returns
+    -------
+    `function`
+        Decodes a response body, raising `ValueError` if it is not valid JSON.
+
+    Raises
+    ------
+    `ValueError`
+        If `name` is not a valid JSON_DECODER.
+    """
+    name = (name or "json").strip().lower()
+    if name not in adsbxcot.JSON_DECODERS:
+        raise ValueError(f"Invalid JSON_DECODER: {name}")
+
+    if name == "auto":
+        name = "msgspec" if HAS_MSGSPEC else "orjson" if HAS_ORJSON else "json"
+
+    if name == "msgspec":
+        if HAS_MSGSPEC:
+            return decode_msgspec
+        _logger.warning(
+            "JSON_DECODER is set to 'msgspec', but the 'msgspec' Python module is "
+            "not installed.\nTry: python -m pip install adsbxcot[with_msgspec]"
+        )
+    elif name == "orjson":
+        if HAS_ORJSON:
+            return decode_orjson
+        _logger.warning(
+            "JSON_DECODER is set to 'orjson', but the 'orjson' Python module is "
+            "not installed.\nTry: python -m pip install adsbxcot[with_orjson]"
+        )
+    return decode_json
@@ -16,15 +16,36 @@
 
 """ADSBXCOT Functions."""
 
+import bisect
+import datetime
+import email.utils
+import gzip
+import ipaddress
+import itertools
+import json
+import logging
+import math
+import mmap
+import os
+import random
+import re
+import sys
+import time
+import urllib.parse
+import zlib
 import xml.etree.ElementTree as ET
 
-from configparser import SectionProxy
-from typing import Union, Set, Optional
+from configparser import ConfigParser, SectionProxy
+from typing import Iterator, Union, List, Set, Optional, Tuple
 
 import pytak
 import aircot
 import adsbxcot  # pylint: disable=cyclic-import
 
+from adsbxcot import proto_functions
+
+_logger = logging.getLogger(__name__)
+
 
 def create_tasks(config: SectionProxy, clitool: pytak.CLITool) -> Set[pytak.Worker,]:
     """
@@ -42,90 +63,1299 @@ def create_tasks(config: SectionProxy, clitool: pytak.CLITool) -> Set[pytak.Work
     `set`
         Set of PyTAK Worker classes for this application.
     """
+    if _get_bool(config, "COALESCE_QUEUE"):
+        # pytak has already given its TXWorker the default TX queue, so swap it:
+        queue = adsbxcot.CoalescingQueue()
+        for task in clitool.tasks:
+            if getattr(task, "queue", None) is clitool.tx_queue:
+                task.queue = queue
+        clitool.tx_queue = queue
+
+    if compile_profile(config).cot_serializer == "protobuf":
+        # Events are already TAK Protocol v1, so stop pytak re-encoding them:
+        for task in clitool.tasks:
+            if getattr(task, "use_protobuf", False):
+                task.use_protobuf = False
+
     return set([adsbxcot.ADSBXWorker(clitool.tx_queue, config)])
 
 
-def adsbx_to_cot_xml(  # NOQA pylint: disable=too-many-locals,too-many-branches,too-many-statements
-    craft: dict, config: Optional[dict] = None, known_craft: Optional[dict] = None
-) -> Optional[ET.Element]:
+def _get_bool(config: Union[dict, SectionProxy], key: str) -> bool:
+    """Parses a boolean config option as `ConfigParser.getboolean()` does."""
+    value = config.get(key)
+    if value is None or value == "":
+        return False
+    if isinstance(value, bool):
+        return value
+    try:
+        return ConfigParser.BOOLEAN_STATES[str(value).lower()]
+    except KeyError as exc:
+        raise ValueError(f"Invalid boolean for {key}: {value}") from exc
+
+
+def _get_number(config: Union[dict, SectionProxy], key: str, default, cast=float):
+    """Parses a numeric config option, falling back to `default` if unset."""
+    value = config.get(key)
+    if value is None or value == "":
+        return cast(default)
+    try:
+        return cast(value)
+    except ValueError as exc:
+        raise ValueError(f"Invalid value for {key}: {value}") from exc
+
+
+def _optional_float(value) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+def craft_altitude(craft: dict) -> Optional[float]:
+    """Barometric altitude of an aircraft in feet, 0 if on the ground."""
+    alt_baro = craft.get("alt_baro")
+    if alt_baro == "ground":
+        return 0.0
+    if isinstance(alt_baro, (int, float)):
+        return float(alt_baro)
+    return None
+
+
+def craft_in_limits(craft: dict, profile: "adsbxcot.ConversionProfile") -> bool:
     """
-    Serializes ADS-B Aggregator aircraft objects as Cursor on Target.
+    Determines if an aircraft is within the profile's BBOX (or POLYGON),
+    MIN_ALTITUDE, MAX_ALTITUDE and MAX_SEEN_POS limits. Aircraft missing a value
+    are kept.
+    """
+    if profile.bbox:
+        lat, lon = craft.get("lat"), craft.get("lon")
+        if lat is not None and lon is not None:
+            min_lat, min_lon, max_lat, max_lon = profile.bbox
+            if not (min_lat <= lat <= max_lat and min_lon <= lon <= max_lon):
+                return False
+            if profile.polygon and not point_in_polygon(lat, lon, profile.polygon):
+                return False
+
+    if profile.min_altitude is not None or profile.max_altitude is not None:
+        alt = craft_altitude(craft)
+        if alt is not None:
+            if profile.min_altitude is not None and alt < profile.min_altitude:
+                return False
+            if profile.max_altitude is not None and alt > profile.max_altitude:
+                return False
+
+    if profile.max_seen_pos is not None:
+        seen_pos = craft.get("seen_pos")
+        if isinstance(seen_pos, (int, float)) and seen_pos > profile.max_seen_pos:
+            return False
+
+    return True
+
+
+def compile_profile(
+    config: Union[dict, SectionProxy, None] = None,
+) -> "adsbxcot.ConversionProfile":
+    """
+    Compiles the config into an immutable `ConversionProfile`.
+
+    Parameters
+    ----------
+    config : `configparser.SectionProxy`
+        Configuration options and values.
+
+    Returns
+    -------
+    `adsbxcot.ConversionProfile`
+        Pre-parsed filter and conversion settings.
+
+    Raises
+    ------
+    `ValueError`
+        If an option has an invalid value.
+    """
+    config = config or {}
+
+    cot_stale: int = _get_number(config, "COT_STALE", pytak.DEFAULT_COT_STALE, cast=int)
+    cot_serializer: str = config.get("COT_SERIALIZER") or "xml"
+    if cot_serializer not in adsbxcot.COT_SERIALIZERS:
+        raise ValueError(f"Invalid COT_SERIALIZER: {cot_serializer}")
+
+    stale_out: str = (config.get("STALE_OUT") or "").strip().lower()
+    if stale_out and stale_out not in adsbxcot.STALE_OUT_EVENTS:
+        raise ValueError(f"Invalid STALE_OUT: {stale_out}")
+
+    zone_filter: str = (config.get("ZONE_FILTER") or "").strip().lower()
+    if zone_filter and zone_filter not in adsbxcot.ZONE_FILTERS:
+        raise ValueError(f"Invalid ZONE_FILTER: {zone_filter}")
+
+    tak_proto_framing: str = (config.get("TAK_PROTO_FRAMING") or "").strip().lower()
+    if not tak_proto_framing:
+        tak_proto_framing = "mesh" if _is_multicast(config.get("COT_URL")) else "stream"
+    if tak_proto_framing not in adsbxcot.TAK_PROTO_FRAMINGS:
+        raise ValueError(f"Invalid TAK_PROTO_FRAMING: {tak_proto_framing}")
+
+    # POLYGON is used instead of BBOX, as in `tile_feed_urls()`, with its bounds
+    # as the BBOX, to skip the polygon test for most aircraft outside it:
+    bbox: Optional[Tuple[float, float, float, float]] = None
+    polygon: Optional[Tuple[Tuple[float, float], ...]] = None
+    area = parse_area(config.get("BBOX"), config.get("POLYGON"))
+    if area:
+        lats, lons = [vertex[0] for vertex in area], [vertex[1] for vertex in area]
+        bbox = (min(lats), min(lons), max(lats), max(lons))
+        if config.get("POLYGON"):
+            polygon = tuple(area)
+
+    return adsbxcot.ConversionProfile(
+        include_tisb=_get_bool(config, "INCLUDE_TISB"),
+        tisb_only=_get_bool(config, "TISB_ONLY"),
+        include_all_craft=_get_bool(config, "INCLUDE_ALL_CRAFT"),
+        uid_key=config.get("UID_KEY", "ICAO"),
+        cot_stale=cot_stale,
+        cot_host_id=config.get("COT_HOST_ID", pytak.DEFAULT_HOST_ID),
+        cot_serializer=cot_serializer,
+        change_detection=_get_bool(config, "CHANGE_DETECTION"),
+        heartbeat_interval=_get_number(config, "HEARTBEAT_INTERVAL", cot_stale / 2),
+        min_position_change=_get_number(
+            config, "MIN_POSITION_CHANGE", adsbxcot.DEFAULT_MIN_POSITION_CHANGE
+        ),
+        min_altitude_change=_get_number(
+            config, "MIN_ALTITUDE_CHANGE", adsbxcot.DEFAULT_MIN_ALTITUDE_CHANGE
+        ),
+        min_track_change=_get_number(
+            config, "MIN_TRACK_CHANGE", adsbxcot.DEFAULT_MIN_TRACK_CHANGE
+        ),
+        min_speed_change=_get_number(
+            config, "MIN_SPEED_CHANGE", adsbxcot.DEFAULT_MIN_SPEED_CHANGE
+        ),
+        bbox=bbox,
+        polygon=polygon,
+        min_altitude=_get_number(config, "MIN_ALTITUDE", None, cast=_optional_float),
+        max_altitude=_get_number(config, "MAX_ALTITUDE", None, cast=_optional_float),
+        max_seen_pos=_get_number(config, "MAX_SEEN_POS", None, cast=_optional_float),
+        batch_filter=_get_bool(config, "BATCH_FILTER"),
+        convert_processes=_get_number(config, "CONVERT_PROCESSES", 0, cast=int),
+        output_rate=_get_number(config, "OUTPUT_RATE", None, cast=_optional_float),
+        output_byte_rate=_get_number(
+            config, "OUTPUT_BYTE_RATE", None, cast=_optional_float
+        ),
+        output_burst=_get_number(
+            config, "OUTPUT_BURST", adsbxcot.DEFAULT_POLL_INTERVAL
+        ),
+        extrapolate_interval=_get_number(
+            config, "EXTRAPOLATE_INTERVAL", None, cast=_optional_float
+        ),
+        stale_out=stale_out,
+        extrapolate_max_age=_get_number(
+            config, "EXTRAPOLATE_MAX_AGE", adsbxcot.DEFAULT_EXTRAPOLATE_MAX_AGE
+        ),
+        tak_proto_framing=tak_proto_framing,
+        fragment_cache_size=_get_number(
+            config,
+            "FRAGMENT_CACHE_SIZE",
+            adsbxcot.DEFAULT_FRAGMENT_CACHE_SIZE,
+            cast=int,
+        ),
+        zone_filter=zone_filter,
+    )
+
+
+def _is_multicast(cot_url: Optional[str]) -> bool:
+    """Determines if COT_URL is a multicast address, as `pytak.TXWorker` does."""
+    try:
+        host, _ = pytak.parse_url(cot_url or pytak.DEFAULT_COT_URL)
+        return ipaddress.ip_address(host).is_multicast
+    except ValueError:
+        return False
+
+
+def get_feed_urls(feed_url: Optional[str]) -> List[str]:
+    """Splits a FEED_URL setting of one or more comma or space separated URLs."""
+    return [url for url in re.split(r"[,\s]+", feed_url or "") if url]
+
+
+def is_adsbx_url(url: str) -> bool:
+    """Determines if a feed URL is on one of the `ADSBX_API_DOMAINS`."""
+    host: str = (urllib.parse.urlsplit(url).hostname or "").lower()
+    return any(
+        host == domain or host.endswith(f".{domain}")
+        for domain in adsbxcot.ADSBX_API_DOMAINS
+    )
+
+
+def get_aircraft(response) -> Optional[list]:
+    """
+    Gets the aircraft list of a decoded feed response, under whichever of the
+    `AIRCRAFT_KEYS` it has, or None if it has none.
+    """
+    if not isinstance(response, dict):
+        return None
+    for key in adsbxcot.AIRCRAFT_KEYS:
+        data = response.get(key)
+        if data is not None:
+            return data
+    return None
+
+
+def _seen_pos(craft: dict) -> float:
+    """Seconds since the aircraft's last position, or infinity if it has none."""
+    seen_pos = craft.get("seen_pos")
+    if isinstance(seen_pos, (int, float)) and craft.get("lat") is not None:
+        return seen_pos
+    return math.inf
+
+
+def merge_aircraft(feeds: List[list]) -> list:
+    """
+    Merges the aircraft lists of several feeds into one list with one entry per
+    ICAO, keeping the entry with the freshest position (lowest `seen_pos`).
+
+    Parameters
+    ----------
+    feeds : `list`
+        List of aircraft lists, as returned in the `ac` key of each feed.
+
+    Returns
+    -------
+    `list`
+        Merged list of aircraft.
+    """
+    merged: dict = {}
+    unkeyed: list = []
+    for data in feeds:
+        for craft in data:
+            if not isinstance(craft, dict):
+                continue
+            icao = str(craft.get("hex", craft.get("icao", ""))).strip().upper()
+            if not icao:
+                unkeyed.append(craft)
+                continue
+            prev = merged.get(icao)
+            if prev is None or _seen_pos(craft) < _seen_pos(prev):
+                merged[icao] = craft
+    return list(merged.values()) + unkeyed
+
+
+def next_cycle(previous: float, interval: float, now: float) -> Tuple[float, int]:
+    """
+    Computes the start time of the next fixed-rate poll cycle.
+
+    Cycles are scheduled from the start of the previous cycle, not its end, so
+    fetch and conversion time don't add to the period. Cycles that were overrun
+    are skipped rather than run back to back.
+
+    Parameters
+    ----------
+    previous : `float`
+        Scheduled start time of the previous cycle.
+    interval : `float`
+        Poll interval, in seconds.
+    now : `float`
+        Current time, on the same clock as `previous`.
+
+    Returns
+    -------
+    `tuple`
+        Start time of the next cycle, and the number of cycles skipped.
+    """
+    next_start = previous + interval
+    skipped = 0
+    if now > next_start:
+        skipped = int((now - next_start) // interval) + 1
+        next_start += skipped * interval
+    return next_start, skipped
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> float:
+    """
+    Parses an HTTP Retry-After header, given as seconds or as an HTTP-date.
+
+    Returns
+    -------
+    `float`
+        Seconds to wait, or 0 if the header is missing or invalid.
+    """
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0.0
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc).timestamp()
+    return max(0.0, retry_at.timestamp() - now)
+
+
+def backoff_delay(
+    failures: int,
+    min_backoff: float = adsbxcot.DEFAULT_MIN_BACKOFF,
+    max_backoff: float = adsbxcot.DEFAULT_MAX_BACKOFF,
+) -> float:
+    """Exponential backoff, in seconds, with jitter, after `failures` failures."""
+    delay = min(max_backoff, min_backoff * 2 ** max(0, failures - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def cot_uid(event: bytes) -> Optional[bytes]:
+    """
+    Gets the UID of a CoT XML (without parsing it) or TAK Protocol v1 event, for
+    COALESCE_QUEUE.
+    """
+    if proto_functions.is_tak_proto(event):
+        return proto_functions.proto_uid(event)
+    start: int = event.find(b' uid="')
+    if start == -1:
+        return None
+    start += 6
+    end: int = event.find(b'"', start)
+    return event[start:end] if end != -1 else None
+
+
+_EVENT_TIMES = re.compile(rb'\b(time|start|stale)="[^"]*"')
+
+
+def stale_event(event: bytes) -> bytes:
+    """
+    Rewrites a CoT XML event to be stale now, for STALE_OUT=stale, so TAK
+    clients stale the aircraft out at its last known position.
+
+    TAK Protocol v1 events are re-encoded with their times set to now.
+    """
+    if proto_functions.is_tak_proto(event):
+        now_ms: int = int(time.time() * 1000)
+        try:
+            return proto_functions.restamp(event, now_ms, now_ms, now_ms)
+        except ValueError:
+            return event
+
+    start: int = event.find(b"<event")
+    end: int = event.find(b">", start)
+    if start == -1 or end == -1:
+        return event
+    now: bytes = pytak.cot_time().encode()
+    head: bytes = _EVENT_TIMES.sub(
+        lambda match: match.group(1) + b'="' + now + b'"', event[start:end]
+    )
+    return event[:start] + head + event[end:]
+
+
+def delete_event(
+    uid: str, profile: Optional["adsbxcot.ConversionProfile"] = None
+) -> Optional[bytes]:
+    """
+    Generates a CoT delete (``t-x-d-d``) event for a UID, for STALE_OUT=delete,
+    so TAK clients remove the aircraft.
+
+    Encoded as TAK Protocol v1 if `profile` has COT_SERIALIZER=protobuf.
+    """
+    if profile is not None and profile.cot_serializer == "protobuf":
+        return _proto_event(
+            cot_type="t-x-d-d",
+            uid=f"{uid}-delete",
+            how="h-g-i-g-o",
+            stale=pytak.DEFAULT_COT_STALE,
+            xml_detail=f'<link uid="{xml_escape_attrib(uid)}" relation="none" '
+            'type="none" /><__forcedelete />',
+            framing=profile.tak_proto_framing,
+        )
+
+    cot: Optional[ET.Element] = pytak.gen_cot_xml(
+        uid=f"{uid}-delete", cot_type="t-x-d-d"
+    )
+    if cot is None:
+        return None
+    cot.set("how", "h-g-i-g-o")
+
+    detail = cot.find("detail")
+    link = ET.Element("link")
+    link.set("uid", uid)
+    link.set("relation", "none")
+    link.set("type", "none")
+    detail.insert(0, link)
+    detail.insert(1, ET.Element("__forcedelete"))
+
+    return b"\n".join([pytak.DEFAULT_XML_DECLARATION, ET.tostring(cot)])
+
+
+def file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    """
+    Gets the inode, size and modification time (ns) of a file, which change
+    whenever it is rewritten or replaced, or None if it does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def read_feed_file(
+    path: str, last_crc: Optional[int] = None
+) -> Tuple[Optional[int], Optional[bytes]]:
+    """
+    Reads a local feed file, such as readsb's ``aircraft.json``, for FEED_FILE.
+
+    Files of FEED_FILE_MMAP_SIZE bytes or more are read through a memory map,
+    which is only safe if the file is replaced (renamed into place) rather than
+    truncated and rewritten while it is being read.
+
+    Parameters
+    ----------
+    path : `str`
+        Feed file.
+    last_crc : `int`
+        CRC-32 of the file when last read.
+
+    Returns
+    -------
+    `tuple`
+        The file's CRC-32, and its contents, or None if it is empty or its
+        contents are unchanged since `last_crc`.
+    """
+    with open(path, "rb") as feed_fd:
+        size: int = os.fstat(feed_fd.fileno()).st_size
+        if not size:
+            return last_crc, None
+        if size < adsbxcot.FEED_FILE_MMAP_SIZE:
+            body: bytes = feed_fd.read()
+            crc: int = zlib.crc32(body)
+            if crc == last_crc:
+                return crc, None
+            return crc, body
+        with mmap.mmap(feed_fd.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            crc = zlib.crc32(mapped)
+            if crc == last_crc:
+                return crc, None
+            return crc, mapped[:]
+
+
+def _is_gzipped(path: str) -> bool:
+    """Checks a recorded response file for the gzip magic number."""
+    with open(path, "rb") as rec_fd:
+        return rec_fd.read(2) == b"\x1f\x8b"
+
+
+def _open_recording(path: str):
+    """Opens a recorded response file as text, gunzipping it if it is gzipped."""
+    if _is_gzipped(path):
+        return gzip.open(path, "rt", encoding="UTF-8")
+    return open(path, "r", encoding="UTF-8")  # pylint: disable=consider-using-with
+
+
+def _unwrap_record(response: Union[dict, list]) -> Union[dict, list]:
+    """Unwraps a response recorded by `FeedRecorder`, keeping its recorded time."""
+    if isinstance(response, dict) and "recorded" in response and "response" in response:
+        inner = response["response"]
+        if isinstance(inner, dict):
+            inner.setdefault("now", response["recorded"])
+        return inner
+    return response
+
+
+def _decode_record(text: str, path: str, line: int) -> Optional[Union[dict, list]]:
+    """Decodes one recorded response, logging and skipping it if it is invalid."""
+    try:
+        record = json.loads(text)
+    except ValueError as exc:
+        _logger.warning("Invalid JSON response in %s, line %s: %s", path, line, exc)
+        return None
+    if isinstance(record, dict) and record.get("raw") is True:
+        _logger.warning("Invalid JSON response recorded in %s, line %s", path, line)
+        return None
+    return _unwrap_record(record)
+
+
+def read_replay(path: str) -> Iterator[Union[dict, list]]:
+    """
+    Reads recorded feed responses, for REPLAY_SOURCE.
+
+    Parameters
+    ----------
+    path : `str`
+        A recording, or a directory of recordings replayed in file name order.
+        Each recording is plain or gzipped, and holds either one JSON response
+        or one JSON response per line. Archives written by RECORD_DIR are read
+        as-is. Gzipped and ``.jsonl`` recordings are always read one response
+        per line, and responses that are not valid JSON are logged and skipped.
+
+    Returns
+    -------
+    `Iterator`
+        Responses, in recorded order.
+    """
+    if os.path.isdir(path):
+        paths: List[str] = [
+            os.path.join(path, name)
+            for name in sorted(os.listdir(path))
+            if not name.startswith(".")
+            and not name.endswith(".idx")
+            and os.path.isfile(os.path.join(path, name))
+        ]
+    else:
+        paths = [path]
+
+    for rec_path in paths:
+        by_line: bool = _is_gzipped(rec_path) or ".jsonl" in os.path.basename(rec_path)
+        with _open_recording(rec_path) as rec_fd:
+            first: str = rec_fd.readline()
+            if not by_line:
+                try:
+                    json.loads(first)
+                except ValueError:
+                    # Not one response per line, so the whole file is one response:
+                    response = _decode_record(first + rec_fd.read(), rec_path, 1)
+                    if response is not None:
+                        yield response
+                    continue
+
+            for number, line in enumerate(itertools.chain((first,), rec_fd), 1):
+                if not line.strip():
+                    continue
+                response = _decode_record(line, rec_path, number)
+                if response is not None:
+                    yield response
+
+
+def read_recording_index(archive: str) -> List[Tuple[float, int, int, str]]:
+    """
+    Reads the index of a RECORD_DIR archive.
+
+    Returns
+    -------
+    `list`
+        (recorded time, offset, length, feed URL) of each response, in the
+        order they were recorded.
+    """
+    entries: List[Tuple[float, int, int, str]] = []
+    with open(f"{archive}.idx", "r", encoding="UTF-8") as index_fd:
+        for line in index_fd:
+            if not line.strip():
+                continue
+            recorded, offset, length, url = line.rstrip("\n").split(" ", 3)
+            entries.append((float(recorded), int(offset), int(length), url))
+    return entries
+
+
+def read_recording(
+    archive: str, start: float = 0, end: float = math.inf
+) -> Iterator[dict]:
+    """
+    Reads the responses recorded between `start` and `end` from a RECORD_DIR
+    archive, seeking to each through its index.
+
+    Returns
+    -------
+    `Iterator`
+        Records of ``recorded`` time, feed ``url`` and raw ``response``. If
+        the response was not valid JSON, ``raw`` is true and ``response`` is
+        its text.
+    """
+    # Concurrent feeds may finish, and so be indexed, out of order:
+    entries = sorted(read_recording_index(archive), key=lambda entry: entry[0])
+    times: List[float] = [entry[0] for entry in entries]
+    first: int = bisect.bisect_left(times, start)
+    with open(archive, "rb") as archive_fd:
+        for recorded, offset, length, _ in entries[first:]:
+            if recorded > end:
+                break
+            archive_fd.seek(offset)
+            yield json.loads(gzip.decompress(archive_fd.read(length)))
+
+
+def response_time(response: Union[dict, list]) -> Optional[float]:
+    """
+    Gets the time, in seconds since the epoch, a feed response was generated.
+
+    Uses the response's `now` key, in milliseconds (ADSBX API) or seconds
+    (readsb / tar1090 `aircraft.json`). Returns None if it has none.
+    """
+    if not isinstance(response, dict):
+        return None
+    now = response.get("now")
+    if not isinstance(now, (int, float)) or isinstance(now, bool):
+        return None
+    return now / 1000 if now > 1e11 else float(now)
+
+
+def parse_area(
+    bbox: Optional[str] = None, polygon: Optional[str] = None
+) -> Optional[List[Tuple[float, float]]]:
+    """
+    Parses an area of responsibility from a BBOX or POLYGON setting.
+
+    Parameters
+    ----------
+    bbox : `str`
+        Bounding box as "min_lat,min_lon,max_lat,max_lon".
+    polygon : `str`
+        Polygon vertices as space separated "lat,lon" pairs.
+
+    Returns
+    -------
+    `list`
+        Polygon vertices as (lat, lon) tuples, or None if neither is set.
+    """
+    if polygon:
+        vertices = [
+            tuple(float(val) for val in pair.split(","))
+            for pair in polygon.split()
+            if pair
+        ]
+        if len(vertices) < 3 or any(len(vertex) != 2 for vertex in vertices):
+            raise ValueError(f"Invalid POLYGON: {polygon}")
+        return vertices  # type: ignore
+
+    if bbox:
+        vals = [float(val) for val in bbox.split(",")]
+        if len(vals) != 4:
+            raise ValueError(f"Invalid BBOX: {bbox}")
+        min_lat, min_lon, max_lat, max_lon = vals
+        return [
+            (min_lat, min_lon),
+            (min_lat, max_lon),
+            (max_lat, max_lon),
+            (max_lat, min_lon),
+        ]
+
+    return None
+
+
+def point_in_polygon(
+    lat: float, lon: float, polygon: List[Tuple[float, float]]
+) -> bool:
+    """Ray casting test for a point inside a polygon of (lat, lon) vertices."""
+    inside = False
+    j = len(polygon) - 1
+    for i, (lat_i, lon_i) in enumerate(polygon):
+        lat_j, lon_j = polygon[j]
+        if (lat_i > lat) != (lat_j > lat) and lon < (lon_j - lon_i) * (lat - lat_i) / (
+            lat_j - lat_i
+        ) + lon_i:
+            inside = not inside
+        j = i
+    return inside
+
+
+def _segments_intersect(p1, p2, p3, p4) -> bool:
+    """Determines if line segment p1-p2 crosses line segment p3-p4."""
+
+    def orient(a, b, c):
+        return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+
+    return (orient(p3, p4, p1) > 0) != (orient(p3, p4, p2) > 0) and (
+        orient(p1, p2, p3) > 0
+    ) != (orient(p1, p2, p4) > 0)
+
+
+def _cell_intersects(cell: List[Tuple[float, float]], polygon) -> bool:
+    """Determines if a rectangular cell and a polygon overlap."""
+    (min_lat, min_lon), (max_lat, max_lon) = cell[0], cell[2]
+    if any(point_in_polygon(lat, lon, polygon) for lat, lon in cell):
+        return True
+    if any(
+        min_lat <= lat <= max_lat and min_lon <= lon <= max_lon for lat, lon in polygon
+    ):
+        return True
+    for i, vertex in enumerate(polygon):
+        for j, corner in enumerate(cell):
+            if _segments_intersect(vertex, polygon[i - 1], corner, cell[j - 1]):
+                return True
+    return False
+
+
+def point_in_zone(
+    lat: float, lon: float, rings: List[List[Tuple[float, float]]]
+) -> bool:
+    """
+    Determines if a point is inside a zone polygon: inside its outer ring, the
+    first of `rings`, and outside any holes, the rest.
+    """
+    if not point_in_polygon(lat, lon, rings[0]):
+        return False
+    return not any(point_in_polygon(lat, lon, hole) for hole in rings[1:])
+
+
+def classify_cell(
+    cell: List[Tuple[float, float]], rings: List[List[Tuple[float, float]]]
+) -> Optional[bool]:
+    """
+    Determines how a rectangular cell, as (lat, lon) corners, overlaps a zone.
+
+    Returns
+    -------
+    `bool`
+        True if the cell is wholly inside the zone, False if the zone's boundary
+        crosses it, or None if it is wholly outside the zone.
+    """
+    (min_lat, min_lon), (max_lat, max_lon) = cell[0], cell[2]
+    for ring in rings:
+        if any(
+            min_lat <= lat <= max_lat and min_lon <= lon <= max_lon for lat, lon in ring
+        ):
+            return False
+        for i, vertex in enumerate(ring):
+            for j, corner in enumerate(cell):
+                if _segments_intersect(vertex, ring[i - 1], corner, cell[j - 1]):
+                    return False
+    # The boundary misses the cell, so all of it is on one side:
+    return True if point_in_zone(min_lat, min_lon, rings) else None
+
+
+def _geojson_polygons(geometry: Optional[dict]) -> List[list]:
+    """Polygons of a GeoJSON geometry, as lists of (lat, lon) rings."""
+    if not geometry:
+        return []
+    kind = geometry.get("type")
+    if kind == "GeometryCollection":
+        return [
+            polygon
+            for part in geometry.get("geometries", [])
+            for polygon in _geojson_polygons(part)
+        ]
+    if kind == "Polygon":
+        polygons = [geometry["coordinates"]]
+    elif kind == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        return []
+    # GeoJSON positions are [lon, lat(, alt)]:
+    return [
+        [[(float(pos[1]), float(pos[0])) for pos in ring] for ring in polygon]
+        for polygon in polygons
+        if polygon and len(polygon[0]) >= 3
+    ]
+
+
+def read_zones(
+    path: str, name_property: str = "name"
+) -> List[Tuple[str, List[List[Tuple[float, float]]]]]:
+    """
+    Reads geofence zones, for ZONES, from a GeoJSON file.
+
+    Parameters
+    ----------
+    path : `str`
+        GeoJSON FeatureCollection, Feature or geometry. Polygon, MultiPolygon
+        and GeometryCollection geometries are read, anything else is skipped.
+    name_property : `str`
+        Feature property holding each zone's name. Features without it are named
+        by their ``id``, or their position in the file.
+
+    Returns
+    -------
+    `list`
+        (name, rings) tuples, one per polygon, with each polygon's outer ring
+        first and any holes after, as lists of (lat, lon) vertices.
+
+    Raises
+    ------
+    `ValueError`
+        If the file is not valid GeoJSON.
+    """
+    with open(path, "r", encoding="UTF-8") as zones_fd:
+        doc = json.load(zones_fd)
+
+    if not isinstance(doc, dict):
+        raise ValueError(f"Invalid GeoJSON in {path}")
+    if doc.get("type") == "FeatureCollection":
+        features = doc.get("features") or []
+    elif doc.get("type") == "Feature":
+        features = [doc]
+    else:
+        features = [{"type": "Feature", "geometry": doc}]
+
+    zones: List[Tuple[str, List[List[Tuple[float, float]]]]] = []
+    for index, feature in enumerate(features):
+        props: dict = feature.get("properties") or {}
+        name: str = str(
+            props.get(name_property) or feature.get("id") or f"zone-{index}"
+        )
+        try:
+            polygons = _geojson_polygons(feature.get("geometry"))
+        except (KeyError, IndexError, TypeError) as exc:
+            raise ValueError(f"Invalid geometry for zone {name} in {path}") from exc
+        zones.extend((name, rings) for rings in polygons)
+    return zones
+
+
+def cover_tiles(
+    polygon: List[Tuple[float, float]], dist: float = adsbxcot.DEFAULT_TILE_DIST
+) -> List[Tuple[float, float]]:
+    """
+    Computes the centers of lat/lon/dist tiles covering a polygon.
+
+    Each tile is a circle of radius `dist` nautical miles. Tiles are laid out on a
+    grid of squares inscribed in those circles, so together they cover the
+    polygon without gaps, and only tiles overlapping the polygon are kept.
+
+    Parameters
+    ----------
+    polygon : `list`
+        Polygon vertices as (lat, lon) tuples, from `parse_area()`.
+    dist : `float`
+        Tile radius, in nautical miles.
+
+    Returns
+    -------
+    `list`
+        Tile centers as (lat, lon) tuples.
+    """
+    side_m = dist * 1852 * math.sqrt(2)
+    d_lat = side_m / 111320
+    min_lat = min(lat for lat, _ in polygon)
+    max_lat = max(lat for lat, _ in polygon)
+    min_lon = min(lon for _, lon in polygon)
+    max_lon = max(lon for _, lon in polygon)
+
+    tiles = []
+    row_lat = min_lat
+    while row_lat < max_lat:
+        top_lat = min(90.0, row_lat + d_lat)
+        # Size the row for its equatorward edge, where a degree of longitude is
+        # longest, so the tiles still overlap at the poleward edge.
+        widest = 0.0 if row_lat <= 0 <= top_lat else min(abs(row_lat), abs(top_lat))
+        d_lon = min(
+            360.0, side_m / (111320 * max(0.01, math.cos(math.radians(widest))))
+        )
+        cell_lon = min_lon
+        while cell_lon < max_lon:
+            cell = [
+                (row_lat, cell_lon),
+                (row_lat, cell_lon + d_lon),
+                (top_lat, cell_lon + d_lon),
+                (top_lat, cell_lon),
+            ]
+            if _cell_intersects(cell, polygon):
+                tiles.append((row_lat + d_lat / 2, cell_lon + d_lon / 2))
+            cell_lon += d_lon
+        row_lat += d_lat
+    return tiles
+
+
+def tile_feed_urls(
+    urls: List[str],
+    polygon: List[Tuple[float, float]],
+    dist: float = adsbxcot.DEFAULT_TILE_DIST,
+) -> List[str]:
+    """
+    Expands FEED_URLs with {lat}, {lon} and {dist} placeholders into one URL per
+    tile covering the polygon. URLs without placeholders are passed through.
+    """
+    tiles = cover_tiles(polygon, dist)
+    tiled: List[str] = []
+    for url in urls:
+        if "{lat}" not in url or "{lon}" not in url:
+            tiled.append(url)
+            continue
+        for lat, lon in tiles:
+            tiled.append(
+                url.replace("{lat}", f"{lat:.4f}")
+                .replace("{lon}", f"{lon:.4f}")
+                .replace("{dist}", f"{dist:g}")
+            )
+    return tiled
+
+
+_EARTH_RADIUS_M: float = 6371008.8
+
+
+def distance_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle (haversine) distance, in meters, between two points."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    hav = (
+        math.sin(d_phi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    )
+    return 2 * _EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(hav)))
+
+
+def extrapolate(craft: dict, seconds: float) -> Optional[dict]:
+    """
+    Dead-reckons an aircraft forward along its `track` at its ground speed, and
+    climbs or descends it at its vertical rate.
 
     Parameters
     ----------
     craft : `dict`
-        Key/Value data struct of decoded ADS-B aircraft data.
+        Aircraft data from the feed, which is not modified.
+    seconds : `float`
+        Time since the aircraft's position fix.
+
+    Returns
+    -------
+    `dict`
+        Copy of the aircraft at its predicted position, or None if it has no
+        position, track or ground speed, or is on the ground.
+    """
+    lat, lon = craft.get("lat"), craft.get("lon")
+    track, speed = craft.get("track"), craft.get("gs")
+    if not all(isinstance(val, (int, float)) for val in (lat, lon, track, speed)):
+        return None
+    if craft.get("alt_baro") == "ground":
+        return None
+
+    delta: float = speed * 1852 / 3600 * seconds / _EARTH_RADIUS_M
+    theta: float = math.radians(track)
+    phi1: float = math.radians(lat)
+    phi2: float = math.asin(
+        math.sin(phi1) * math.cos(delta)
+        + math.cos(phi1) * math.sin(delta) * math.cos(theta)
+    )
+    lambda2: float = math.radians(lon) + math.atan2(
+        math.sin(theta) * math.sin(delta) * math.cos(phi1),
+        math.cos(delta) - math.sin(phi1) * math.sin(phi2),
+    )
+
+    predicted = craft.copy()
+    predicted["lat"] = round(math.degrees(phi2), 6)
+    predicted["lon"] = round((math.degrees(lambda2) + 540) % 360 - 180, 6)
+    # `seconds` is already counted from the fix, so it is the predicted age:
+    if isinstance(craft.get("seen_pos"), (int, float)):
+        predicted["seen_pos"] = seconds
+
+    for alt_key, rate_key in (("alt_baro", "baro_rate"), ("alt_geom", "geom_rate")):
+        rate = craft.get(rate_key, craft.get("baro_rate"))
+        if isinstance(rate, (int, float)) and isinstance(
+            craft.get(alt_key), (int, float)
+        ):
+            predicted[alt_key] = round(craft[alt_key] + rate * seconds / 60)
+    if isinstance(craft.get("x_alt_geom"), (int, float)):
+        predicted["x_alt_geom"] = predicted["alt_baro"] + craft.get(
+            "x_alt_baro_offset", 0
+        )
+    # Derived from alt_geom, so recomputed from the predicted alt_geom:
+    predicted.pop("x_hae", None)
+    return predicted
+
+
+def craft_state(craft: dict) -> dict:
+    """Snapshot of the aircraft fields used for change detection."""
+    return {
+        "lat": craft.get("lat"),
+        "lon": craft.get("lon"),
+        "alt": craft.get("alt_geom", craft.get("alt_baro")),
+        "track": craft.get("track"),
+        "gs": craft.get("gs"),
+        "squawk": craft.get("squawk"),
+        "flight": (craft.get("flight") or "").strip().upper(),
+    }
+
+
+def _exceeds(old, new, threshold: float) -> bool:
+    """Compare two numeric values against a threshold, or by equality otherwise."""
+    if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+        return abs(new - old) >= threshold
+    return old != new
+
+
+def craft_changed(  # pylint: disable=too-many-arguments
+    prev: Optional[dict],
+    state: dict,
+    min_position: float = adsbxcot.DEFAULT_MIN_POSITION_CHANGE,
+    min_altitude: float = adsbxcot.DEFAULT_MIN_ALTITUDE_CHANGE,
+    min_track: float = adsbxcot.DEFAULT_MIN_TRACK_CHANGE,
+    min_speed: float = adsbxcot.DEFAULT_MIN_SPEED_CHANGE,
+) -> bool:
+    """
+    Determines if an aircraft has changed enough since it was last sent.
+
+    Parameters
+    ----------
+    prev : `dict`
+        State of the aircraft when it was last sent, from `craft_state()`.
+    state : `dict`
+        Current state of the aircraft, from `craft_state()`.
+    min_position : `float`
+        Minimum position change, in meters.
+    min_altitude : `float`
+        Minimum altitude change, in feet.
+    min_track : `float`
+        Minimum track (course) change, in degrees.
+    min_speed : `float`
+        Minimum ground speed change, in knots.
+
+    Returns
+    -------
+    `bool`
+        True if the aircraft should be sent again.
+    """
+    if not prev:
+        return True
+
+    if prev["squawk"] != state["squawk"] or prev["flight"] != state["flight"]:
+        return True
+
+    if None in (prev["lat"], prev["lon"], state["lat"], state["lon"]):
+        if (prev["lat"], prev["lon"]) != (state["lat"], state["lon"]):
+            return True
+    elif (
+        distance_m(prev["lat"], prev["lon"], state["lat"], state["lon"]) >= min_position
+    ):
+        return True
+
+    if _exceeds(prev["alt"], state["alt"], min_altitude):
+        return True
+
+    if isinstance(prev["track"], (int, float)) and isinstance(
+        state["track"], (int, float)
+    ):
+        delta = abs(state["track"] - prev["track"]) % 360
+        if min(delta, 360 - delta) >= min_track:
+            return True
+    elif prev["track"] != state["track"]:
+        return True
+
+    return _exceeds(prev["gs"], state["gs"], min_speed)
+
+
+def _change_ratio(old, new, threshold: float) -> float:
+    """Change between two numeric values, in multiples of a threshold."""
+    if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+        return abs(new - old) / threshold if threshold else 0.0
+    return 0.0 if old == new else 1.0
+
+
+def change_score(
+    prev: Optional[dict],
+    state: dict,
+    profile: "adsbxcot.ConversionProfile",
+    now: float,
+) -> float:
+    """
+    Scores how much an aircraft has changed since it was last sent, for sharing
+    an OUTPUT_RATE budget. Each `MIN_*_CHANGE` threshold, and each
+    `HEARTBEAT_INTERVAL` since the aircraft was sent, counts as 1.
+
+    Parameters
+    ----------
+    prev : `dict`
+        State of the aircraft when it was last sent, from `craft_state()`.
+    state : `dict`
+        Current state of the aircraft, from `craft_state()`.
+    profile : `adsbxcot.ConversionProfile`
+        Compiled config, with the thresholds.
+    now : `float`
+        Current `time.monotonic()`.
+
+    Returns
+    -------
+    `float`
+        Change score, infinite if the aircraft has never been sent.
+    """
+    if not prev:
+        return math.inf
+
+    score: float = (now - prev["sent"]) / profile.heartbeat_interval
+    score += float(prev["squawk"] != state["squawk"])
+    score += float(prev["flight"] != state["flight"])
+
+    if None in (prev["lat"], prev["lon"], state["lat"], state["lon"]):
+        score += float((prev["lat"], prev["lon"]) != (state["lat"], state["lon"]))
+    elif profile.min_position_change:
+        score += (
+            distance_m(prev["lat"], prev["lon"], state["lat"], state["lon"])
+            / profile.min_position_change
+        )
+
+    score += _change_ratio(prev["alt"], state["alt"], profile.min_altitude_change)
+    if isinstance(prev["track"], (int, float)) and isinstance(
+        state["track"], (int, float)
+    ):
+        delta = abs(state["track"] - prev["track"]) % 360
+        score += _change_ratio(0, min(delta, 360 - delta), profile.min_track_change)
+    else:
+        score += float(prev["track"] != state["track"])
+    score += _change_ratio(prev["gs"], state["gs"], profile.min_speed_change)
+    return score
+
+
+def output_priority(
+    prev: Optional[dict],
+    state: dict,
+    profile: "adsbxcot.ConversionProfile",
+    now: float,
+) -> float:
+    """
+    Priority of an aircraft held back by an OUTPUT_RATE budget: its
+    `change_score()`, weighted by the time since it was last sent. Aircraft that
+    changed more go first, but one just sent drops to the back, so every
+    aircraft held back long enough is sent in turn, however much others change.
+
+    Returns
+    -------
+    `float`
+        Priority, infinite if the aircraft has never been sent.
+    """
+    if not prev:
+        return math.inf
+    return change_score(prev, state, profile, now) * max(0.0, now - prev["sent"])
+
+
+def output_lane(craft: dict, known_craft: Optional[dict] = None) -> int:
+    """
+    Priority lane of an aircraft, for an OUTPUT_RATE budget: 0 if it is squawking
+    an emergency (7500, 7600 or 7700), 1 if it is in KNOWN_CRAFT, otherwise 2.
+    """
+    squawk = craft.get("squawk")
+    if squawk and str(squawk).strip() in adsbxcot.EMERGENCY_SQUAWKS:
+        return 0
+    if known_craft:
+        return 1
+    return 2
+
+
+def get_cot_fields(  # NOQA pylint: disable=too-many-locals,too-many-branches,too-many-statements
+    craft: dict,
+    config: Optional[dict] = None,
+    known_craft: Optional[dict] = None,
+    profile: Optional["adsbxcot.ConversionProfile"] = None,
+    fragments: Optional["adsbxcot.CotFragmentCache"] = None,
+) -> Optional[dict]:
+    """
+    Derives the Cursor on Target field values for an ADS-B Aggregator aircraft.
+
+    This is the serializer-independent part of the conversion, shared by
+    `adsbx_to_cot_xml()`, `adsbx_to_cot_template()` and `adsbx_to_cot_protobuf()`.
+
+    Parameters
+    ----------
+    craft : `adsbxcot.Aircraft`
+        Aircraft record, or a `dict` of decoded ADS-B aircraft data to build one
+        from.
     config : `configparser.ConfigParser`
         Configuration options and values.
         Uses config options: UID_KEY, COT_STALE, COT_HOST_ID
+    profile : `adsbxcot.ConversionProfile`
+        Compiled config, used instead of `config` if given.
+    fragments : `adsbxcot.CotFragmentCache`
+        Cache of each aircraft's static CoT fields, if given.
 
     Returns
     -------
-    `xml.etree.ElementTree.Element`
-        Cursor on Target XML ElementTree object.
+    `dict`
+        CoT field values, all as `str` apart from `stale` and `aircot`, the
+        ordered list of `_aircot_` attribute name/value pairs.
     """
     known_craft = known_craft or {}
-    config = config or {}
 
-    lat = craft.get("lat")
-    lon = craft.get("lon")
+    if not isinstance(craft, adsbxcot.Aircraft):
+        craft = adsbxcot.Aircraft(craft)
+
+    lat = craft.lat
+    lon = craft.lon
 
     if lat is None or lon is None:
         return None
 
-    remarks_fields = []
+    profile = profile or compile_profile(config)
 
-    uid_key = config.get("UID_KEY", "ICAO")
-    cot_stale = int(config.get("COT_STALE", pytak.DEFAULT_COT_STALE))
-    cot_host_id = config.get("COT_HOST_ID", pytak.DEFAULT_HOST_ID)
+    # Already stripped and upper cased by `adsbxcot.Aircraft`:
+    inputs: tuple = (
+        craft.hex or "",
+        craft.r or "",
+        craft.flight or "",
+        craft.squawk,
+        craft.category,
+        craft.t or "",
+        profile.uid_key,
+        profile.cot_host_id,
+    )
+    static: Optional[dict] = None
+    if fragments is not None:
+        static = fragments.get(inputs[0], inputs, known_craft)
+    if static is None:
+        static = static_cot_fields(inputs, known_craft)
+        if static is None:
+            return None
+        if fragments is not None:
+            fragments.put(inputs[0], inputs, known_craft, static)
 
-    aircotx = ET.Element("_aircot_")
-    aircotx.set("cot_host_id", cot_host_id)
+    remarks_fields = list(static["remarks"])
+    if craft.alt_geom is not None:
+        remarks_fields.append(f"Alt:{craft.alt_geom}")
+    zones: str = ",".join(craft.x_zones or ())
+    if zones:
+        remarks_fields.append(f"Zones:{zones}")
+    remarks_fields.append(profile.cot_host_id)
 
-    icao_hex = craft.get("hex", craft.get("icao", ""))
-    reg = craft.get("r", "")
-    flight = craft.get("flight", "")
-    cat = craft.get("category")
-    squawk = craft.get("squawk")
-    craft_type = craft.get("t", "")
+    return {
+        "lat": str(lat),
+        "lon": str(lon),
+        "ce": str(craft.get("nac_p", "9999999.0")),
+        "le": str(craft.get("nac_v", "9999999.0")),
+        "hae": craft.x_hae
+        or aircot.functions.get_hae(craft.get("alt_geom", craft.alt_geom_x)),
+        "uid": static["uid"],
+        "cot_type": static["cot_type"],
+        "stale": profile.cot_stale,
+        "callsign": static["callsign"],
+        "course": str(craft.get("track", "9999999.0")),
+        "speed": craft.x_speed or aircot.functions.get_speed(craft.gs),
+        "aircot": static["aircot"]
+        + [
+            ("alt_geom", str(craft.alt_geom)),
+            ("x_alt_geom", str(craft.x_alt_geom)),
+            ("alt_baro", str(craft.alt_baro)),
+            ("x_alt_baro_offset", str(craft.x_alt_baro_offset)),
+        ]
+        + ([("zones", zones)] if zones else []),
+        "icon": static["icon"],
+        "remarks": " ".join(filter(None, remarks_fields)),
+    }
+
+
+def static_cot_fields(inputs: tuple, known_craft: dict) -> Optional[dict]:
+    """
+    Derives the CoT field values of an aircraft that only change when its
+    identity does, for `get_cot_fields()` and its FRAGMENT_CACHE_SIZE cache.
+
+    Parameters
+    ----------
+    inputs : `tuple`
+        The aircraft's normalized hex, reg, flight, squawk, category and type,
+        and the UID_KEY and COT_HOST_ID, as built by `get_cot_fields()`.
+    known_craft : `dict`
+        The aircraft's KNOWN_CRAFT row, if any.
+
+    Returns
+    -------
+    `dict`
+        UID, CoT type, callsign, icon, the static ``_aircot_`` attributes and the
+        static remarks, or None if the aircraft has no usable UID.
+    """
+    icao_hex, reg, flight, squawk, cat, craft_type, uid_key, cot_host_id = inputs
+
+    remarks_fields = []
+    aircot_attrs = [("cot_host_id", cot_host_id)]
 
     if reg:
-        reg = reg.strip().upper()
         remarks_fields.append(reg)
-        aircotx.set("reg", reg)
+        aircot_attrs.append(("reg", reg))
 
     if flight:
-        flight = flight.strip().upper()
         remarks_fields.append(flight)
-        aircotx.set("flight", flight)
+        aircot_attrs.append(("flight", flight))
 
     if squawk:
-        squawk = squawk.strip().upper()
         remarks_fields.append(f"Squawk:{squawk}")
-        aircotx.set("squawk", squawk)
+        aircot_attrs.append(("squawk", squawk))
 
     if icao_hex:
-        icao_hex = icao_hex.strip().upper()
         remarks_fields.append(icao_hex)
-        aircotx.set("icao", icao_hex)
+        aircot_attrs.append(("icao", icao_hex))
 
     if cat:
-        cat = cat.strip().upper()
         remarks_fields.append(f"Cat:{cat}")
-        aircotx.set("cat", cat)
+        aircot_attrs.append(("cat", cat))
 
     if craft_type:
-        craft_type = craft_type.strip().upper()
         remarks_fields.append(f"Type:{craft_type}")
-        aircotx.set("type", craft_type)
-
-    if "alt_geom" in craft:
-        remarks_fields.append(f"Alt:{craft.get('alt_geom')}")
-
-    aircotx.set("alt_geom", str(craft.get("alt_geom")))
-    aircotx.set("x_alt_geom", str(craft.get("x_alt_geom")))
-    aircotx.set("alt_baro", str(craft.get("alt_baro")))
-    aircotx.set("x_alt_baro_offset", str(craft.get("x_alt_baro_offset")))
+        aircot_attrs.append(("type", craft_type))
 
     if "REG" in uid_key and reg:
         cot_uid = f"REG-{reg}"
@@ -140,54 +1370,91 @@ def adsbx_to_cot_xml(  # NOQA pylint: disable=too-many-locals,too-many-branches,
     else:
         return None
 
-    if flight:
-        callsign = flight
-    elif reg:
-        callsign = reg
-    else:
-        callsign = icao_hex
-
     _, callsign = aircot.set_name_callsign(
         icao_hex, reg, craft_type, flight, known_craft
     )
     cat = aircot.set_category(cat, known_craft)
     cot_type = aircot.set_cot_type(icao_hex, cat, flight, known_craft)
 
+    return {
+        "uid": cot_uid,
+        "cot_type": cot_type,
+        "callsign": str(callsign),
+        "icon": known_craft.get("ICON"),
+        "aircot": aircot_attrs,
+        "remarks": tuple(remarks_fields),
+    }
+
+
+def adsbx_to_cot_xml(
+    craft: dict,
+    config: Optional[dict] = None,
+    known_craft: Optional[dict] = None,
+    profile: Optional["adsbxcot.ConversionProfile"] = None,
+    fragments: Optional["adsbxcot.CotFragmentCache"] = None,
+) -> Optional[ET.Element]:
+    """
+    Serializes ADS-B Aggregator aircraft objects as Cursor on Target.
+
+    Parameters
+    ----------
+    craft : `dict`
+        Key/Value data struct of decoded ADS-B aircraft data.
+    config : `configparser.ConfigParser`
+        Configuration options and values.
+        Uses config options: UID_KEY, COT_STALE, COT_HOST_ID
+    profile : `adsbxcot.ConversionProfile`
+        Compiled config, used instead of `config` if given.
+    fragments : `adsbxcot.CotFragmentCache`
+        Cache of each aircraft's static CoT fields, if given.
+
+    Returns
+    -------
+    `xml.etree.ElementTree.Element`
+        Cursor on Target XML ElementTree object.
+    """
+    fields: Optional[dict] = get_cot_fields(
+        craft, config, known_craft, profile, fragments
+    )
+    if not fields:
+        return None
+
+    aircotx = ET.Element("_aircot_")
+    for key, val in fields["aircot"]:
+        aircotx.set(key, val)
+
     contact = ET.Element("contact")
-    contact.set("callsign", str(callsign))
+    contact.set("callsign", fields["callsign"])
 
     track = ET.Element("track")
-    track.set("course", str(craft.get("track", "9999999.0")))
-
-    track.set("speed", aircot.functions.get_speed(craft.get("gs")))
+    track.set("course", fields["course"])
+    track.set("speed", fields["speed"])
 
     detail = ET.Element("detail")
-    detail.set("uid", cot_uid)
+    detail.set("uid", fields["uid"])
     detail.append(contact)
     detail.append(track)
     detail.append(aircotx)
 
-    icon = known_craft.get("ICON")
+    icon = fields["icon"]
     if icon:
         usericon = ET.Element("usericon")
         usericon.set("iconsetpath", icon)
         detail.append(usericon)
 
     remarks = ET.Element("remarks")
-    remarks_fields.append(f"{cot_host_id}")
-    _remarks = " ".join(list(filter(None, remarks_fields)))
-    remarks.text = _remarks
+    remarks.text = fields["remarks"]
     detail.append(remarks)
 
     cot_d = {
-        "lat": str(lat),
-        "lon": str(lon),
-        "ce": str(craft.get("nac_p", "9999999.0")),
-        "le": str(craft.get("nac_v", "9999999.0")),
-        "hae": aircot.functions.get_hae(craft.get("alt_geom", craft.get("alt_geom_x"))),
-        "uid": cot_uid,
-        "cot_type": cot_type,
-        "stale": cot_stale,
+        "lat": fields["lat"],
+        "lon": fields["lon"],
+        "ce": fields["ce"],
+        "le": fields["le"],
+        "hae": fields["hae"],
+        "uid": fields["uid"],
+        "cot_type": fields["cot_type"],
+        "stale": fields["stale"],
     }
     cot = pytak.gen_cot_xml(**cot_d)
 
@@ -200,11 +1467,365 @@ def adsbx_to_cot_xml(  # NOQA pylint: disable=too-many-locals,too-many-branches,
     return cot
 
 
+def xml_escape_attrib(text: str) -> str:
+    """Escapes an XML attribute value exactly as `xml.etree.ElementTree` does."""
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    if '"' in text:
+        text = text.replace('"', "&quot;")
+    if "\r" in text:
+        text = text.replace("\r", "&#13;")
+    if "\n" in text:
+        text = text.replace("\n", "&#10;")
+    if "\t" in text:
+        text = text.replace("\t", "&#09;")
+    return text
+
+
+def xml_escape_text(text: str) -> str:
+    """Escapes XML character data exactly as `xml.etree.ElementTree` does."""
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+
+def _tag_template(tag: str, attrs: List[Tuple[str, str]], empty: bool = False) -> str:
+    """
+    Start (or empty) tag template, with attributes in the order
+    `xml.etree.ElementTree` writes them: as set, or sorted before Python 3.8.
+    """
+    if sys.version_info < (3, 8):
+        attrs = sorted(attrs)
+    attrib: str = "".join(f' {key}="{val}"' for key, val in attrs)
+    return f"<{tag}{attrib}{' /' if empty else ''}>"
+
+
+_COT_HEAD_TEMPLATE: str = (
+    _tag_template(
+        "event",
+        [
+            ("version", "2.0"),
+            ("type", "{cot_type}"),
+            ("uid", "{event_uid}"),
+            ("how", "m-g"),
+            ("time", "{time}"),
+            ("start", "{time}"),
+            ("stale", "{stale}"),
+        ],
+    )
+    + _tag_template(
+        "point",
+        [
+            ("lat", "{lat}"),
+            ("lon", "{lon}"),
+            ("le", "{le}"),
+            ("hae", "{hae}"),
+            ("ce", "{ce}"),
+        ],
+        empty=True,
+    )
+    + _tag_template("detail", [("uid", "{uid}")])
+    + _tag_template("contact", [("callsign", "{callsign}")], empty=True)
+    + _tag_template("track", [("course", "{course}"), ("speed", "{speed}")], True)
+    + "<_aircot_{aircot} />"
+)
+_USERICON_TEMPLATE: str = '<usericon iconsetpath="{icon}" />'
+_REMARKS_TEMPLATE: str = "<remarks>{remarks}</remarks>"
+_FLOW_TAGS_TEMPLATE: str = (
+    "<_flow-tags_ "
+    + f"{pytak.DEFAULT_HOST_ID}-v{pytak.__version__}".replace("@", "-")
+    + '="{time}" />'
+)
+_COT_TAIL_TEMPLATE: str = _FLOW_TAGS_TEMPLATE + "</detail></event>"
+
+
+def adsbx_to_cot_template(
+    craft: dict,
+    config: Optional[dict] = None,
+    known_craft: Optional[dict] = None,
+    profile: Optional["adsbxcot.ConversionProfile"] = None,
+    fragments: Optional["adsbxcot.CotFragmentCache"] = None,
+) -> Optional[bytes]:
+    """
+    Serializes ADS-B Aggregator aircraft objects as Cursor on Target XML bytes.
+
+    Renders the same bytes as `adsbx_to_cot()` from precompiled string templates,
+    without building an `xml.etree.ElementTree` per aircraft.
+
+    Parameters
+    ----------
+    craft : `dict`
+        Key/Value data struct of decoded ADS-B aircraft data.
+    config : `configparser.ConfigParser`
+        Configuration options and values.
+        Uses config options: UID_KEY, COT_STALE, COT_HOST_ID
+    profile : `adsbxcot.ConversionProfile`
+        Compiled config, used instead of `config` if given.
+    fragments : `adsbxcot.CotFragmentCache`
+        Cache of each aircraft's static CoT fields, if given.
+
+    Returns
+    -------
+    `bytes`
+        Cursor on Target XML, prefixed with an XML declaration.
+    """
+    fields: Optional[dict] = get_cot_fields(
+        craft, config, known_craft, profile, fragments
+    )
+    if not fields:
+        return None
+
+    cot_time: str = pytak.cot_time()
+    aircot_attrs: list = fields["aircot"]
+    if sys.version_info < (3, 8):
+        aircot_attrs = sorted(aircot_attrs)
+
+    # The same fallbacks as `pytak.gen_cot_xml()`, used by `adsbx_to_cot_xml()`:
+    parts = [
+        _COT_HEAD_TEMPLATE.format(
+            cot_type=xml_escape_attrib(fields["cot_type"] or "a-u-G"),
+            event_uid=xml_escape_attrib(fields["uid"] or pytak.DEFAULT_HOST_ID),
+            uid=xml_escape_attrib(fields["uid"]),
+            time=cot_time,
+            stale=pytak.cot_time(fields["stale"] or pytak.DEFAULT_COT_STALE),
+            lat=xml_escape_attrib(str(fields["lat"] or "0.0")),
+            lon=xml_escape_attrib(str(fields["lon"] or "0.0")),
+            le=xml_escape_attrib(str(fields["le"] or pytak.DEFAULT_COT_VAL)),
+            hae=xml_escape_attrib(str(fields["hae"] or pytak.DEFAULT_COT_VAL)),
+            ce=xml_escape_attrib(str(fields["ce"] or pytak.DEFAULT_COT_VAL)),
+            callsign=xml_escape_attrib(fields["callsign"]),
+            course=xml_escape_attrib(fields["course"]),
+            speed=xml_escape_attrib(fields["speed"]),
+            aircot="".join(
+                f' {key}="{xml_escape_attrib(val)}"' for key, val in aircot_attrs
+            ),
+        )
+    ]
+
+    if fields["icon"]:
+        parts.append(_USERICON_TEMPLATE.format(icon=xml_escape_attrib(fields["icon"])))
+
+    if fields["remarks"]:
+        parts.append(
+            _REMARKS_TEMPLATE.format(remarks=xml_escape_text(fields["remarks"]))
+        )
+    else:
+        parts.append("<remarks />")
+
+    parts.append(_COT_TAIL_TEMPLATE.format(time=cot_time))
+
+    return b"\n".join(
+        [
+            pytak.DEFAULT_XML_DECLARATION,
+            "".join(parts).encode("ascii", "xmlcharrefreplace"),
+        ]
+    )
+
+
+def _proto_number(value) -> float:
+    """Converts a CoT field value to a `float`, for TAK Protocol v1."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 9999999.0
+
+
+def _proto_event(  # pylint: disable=too-many-arguments
+    cot_type: str,
+    uid: str,
+    how: str = "m-g",
+    stale=None,
+    point: Tuple[float, float, float, float, float] = (
+        0.0,
+        0.0,
+        9999999.0,
+        9999999.0,
+        9999999.0,
+    ),
+    xml_detail: str = "",
+    detail: bytes = b"",
+    framing: str = "stream",
+) -> bytes:
+    """
+    Encodes a framed TAK Protocol v1 ``TakMessage`` holding one ``CotEvent``.
+
+    `point` is (lat, lon, hae, ce, le). `xml_detail` is any ``<detail>`` XML not
+    covered by the other ``Detail`` fields in `detail`.
+    """
+    now_ms: int = int(time.time() * 1000)
+    stale_ms: int = now_ms + int(float(stale or pytak.DEFAULT_COT_STALE) * 1000)
+    lat, lon, hae, ce, le = point  # pylint: disable=invalid-name
+
+    xml_detail += _FLOW_TAGS_TEMPLATE.format(time=pytak.cot_time())
+
+    event: bytes = b"".join(
+        [
+            proto_functions.string_field(proto_functions.COT_TYPE, cot_type),
+            proto_functions.string_field(proto_functions.COT_UID, uid),
+            proto_functions.uint64_field(proto_functions.COT_SEND_TIME, now_ms),
+            proto_functions.uint64_field(proto_functions.COT_START_TIME, now_ms),
+            proto_functions.uint64_field(proto_functions.COT_STALE_TIME, stale_ms),
+            proto_functions.string_field(proto_functions.COT_HOW, how),
+            proto_functions.double_field(proto_functions.COT_LAT, lat),
+            proto_functions.double_field(proto_functions.COT_LON, lon),
+            proto_functions.double_field(proto_functions.COT_HAE, hae),
+            proto_functions.double_field(proto_functions.COT_CE, ce),
+            proto_functions.double_field(proto_functions.COT_LE, le),
+            proto_functions.message_field(
+                proto_functions.COT_DETAIL,
+                proto_functions.string_field(proto_functions.DETAIL_XML, xml_detail)
+                + detail,
+            ),
+        ]
+    )
+    return proto_functions.frame(
+        proto_functions.message_field(proto_functions.TAK_MESSAGE_COT_EVENT, event),
+        framing,
+    )
+
+
+def adsbx_to_cot_protobuf(
+    craft: dict,
+    config: Optional[dict] = None,
+    known_craft: Optional[dict] = None,
+    profile: Optional["adsbxcot.ConversionProfile"] = None,
+    fragments: Optional["adsbxcot.CotFragmentCache"] = None,
+) -> Optional[bytes]:
+    """
+    Serializes ADS-B Aggregator aircraft objects as TAK Protocol v1 (Protobuf).
+
+    Contact and track are encoded as ``Detail`` fields, and the ``_aircot_``,
+    ``usericon``, ``remarks`` and ``_flow-tags_`` elements as ``xmlDetail``.
+
+    Parameters
+    ----------
+    craft : `dict`
+        Key/Value data struct of decoded ADS-B aircraft data.
+    config : `configparser.ConfigParser`
+        Configuration options and values.
+        Uses config options: UID_KEY, COT_STALE, COT_HOST_ID, TAK_PROTO_FRAMING
+    profile : `adsbxcot.ConversionProfile`
+        Compiled config, used instead of `config` if given.
+    fragments : `adsbxcot.CotFragmentCache`
+        Cache of each aircraft's static CoT fields, if given.
+
+    Returns
+    -------
+    `bytes`
+        ``TakMessage``, with the TAK_PROTO_FRAMING mesh or stream header.
+    """
+    profile = profile or compile_profile(config)
+    fields: Optional[dict] = get_cot_fields(
+        craft, config, known_craft, profile, fragments
+    )
+    if not fields:
+        return None
+
+    parts = [
+        "<_aircot_ "
+        + " ".join(f'{key}="{xml_escape_attrib(val)}"' for key, val in fields["aircot"])
+        + " />"
+    ]
+    if fields["icon"]:
+        parts.append(_USERICON_TEMPLATE.format(icon=xml_escape_attrib(fields["icon"])))
+    if fields["remarks"]:
+        parts.append(
+            _REMARKS_TEMPLATE.format(remarks=xml_escape_text(fields["remarks"]))
+        )
+    else:
+        parts.append("<remarks />")
+
+    contact: bytes = proto_functions.string_field(
+        proto_functions.CONTACT_CALLSIGN, fields["callsign"]
+    )
+    track: bytes = proto_functions.double_field(
+        proto_functions.TRACK_SPEED, _proto_number(fields["speed"])
+    ) + proto_functions.double_field(
+        proto_functions.TRACK_COURSE, _proto_number(fields["course"])
+    )
+
+    return _proto_event(
+        cot_type=fields["cot_type"] or "a-u-G",
+        uid=fields["uid"],
+        stale=fields["stale"],
+        point=(
+            _proto_number(fields["lat"]),
+            _proto_number(fields["lon"]),
+            _proto_number(fields["hae"]),
+            _proto_number(fields["ce"]),
+            _proto_number(fields["le"]),
+        ),
+        xml_detail="".join(parts),
+        detail=proto_functions.message_field(proto_functions.DETAIL_CONTACT, contact)
+        + proto_functions.message_field(proto_functions.DETAIL_TRACK, track),
+        framing=profile.tak_proto_framing,
+    )
+
+
 def adsbx_to_cot(
-    craft: dict, config: Optional[dict] = None, known_craft: Optional[dict] = None
+    craft: dict,
+    config: Optional[dict] = None,
+    known_craft: Optional[dict] = None,
+    profile: Optional["adsbxcot.ConversionProfile"] = None,
+    fragments: Optional["adsbxcot.CotFragmentCache"] = None,
 ) -> Optional[bytes]:
-    """Wrapper that returns COT as an XML string."""
-    cot: Union[ET.Element, None] = adsbx_to_cot_xml(craft, config, known_craft)
+    """Wrapper that returns COT as an XML string, or TAK Protocol v1 bytes."""
+    profile = profile or compile_profile(config)
+    if profile.cot_serializer == "template":
+        return adsbx_to_cot_template(craft, config, known_craft, profile, fragments)
+    if profile.cot_serializer == "protobuf":
+        return adsbx_to_cot_protobuf(craft, config, known_craft, profile, fragments)
+
+    cot: Union[ET.Element, None] = adsbx_to_cot_xml(
+        craft, config, known_craft, profile, fragments
+    )
     return (
         b"\n".join([pytak.DEFAULT_XML_DECLARATION, ET.tostring(cot)]) if cot else None
     )
+
+
+# Each CONVERT_PROCESSES worker process keeps its own static CoT field cache:
+_shard_fragments: Optional["adsbxcot.CotFragmentCache"] = None
+
+
+def convert_shard(
+    items: list, profile: "adsbxcot.ConversionProfile"
+) -> List[Tuple[str, Optional[bytes]]]:
+    """
+    Converts a shard of aircraft to CoT, in a CONVERT_PROCESSES worker process.
+
+    Parameters
+    ----------
+    items : `list`
+        (ICAO, aircraft data, KNOWN_CRAFT row) tuples, in feed order.
+    profile : `adsbxcot.ConversionProfile`
+        Compiled config.
+
+    Returns
+    -------
+    `list`
+        (ICAO, CoT event) tuples, in the same order as `items`.
+    """
+    global _shard_fragments  # pylint: disable=global-statement,invalid-name
+    if _shard_fragments is None and profile.fragment_cache_size > 0:
+        _shard_fragments = adsbxcot.CotFragmentCache(profile.fragment_cache_size)
+    return [
+        (
+            icao,
+            adsbx_to_cot(
+                craft,
+                known_craft=known_craft,
+                profile=profile,
+                fragments=_shard_fragments,
+            ),
+        )
+        for icao, craft, known_craft in items
+    ]
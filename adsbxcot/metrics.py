@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright Sensors & Signals LLC https://www.snstac.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""ADSBXCOT Worker Metrics, in Prometheus text format."""
+
+import asyncio
+import bisect
+
+from typing import Dict, List, Optional, Sequence
+
+# Histogram bucket upper bounds, in seconds, from one aircraft's conversion up
+# to a whole poll cycle:
+DEFAULT_BUCKETS: Sequence[float] = (
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+# Poll cycle stages timed by the worker:
+STAGES: Sequence[str] = ("fetch", "decode", "filter", "convert", "enqueue", "cycle")
+
+
+class Histogram:
+    """Cumulative histogram of observed values, as a Prometheus histogram."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets: Sequence[float] = tuple(sorted(buckets))
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        """Record one observed value."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str = "") -> List[str]:
+        """Render as Prometheus text format sample lines."""
+        sep: str = "," if labels else ""
+        suffix: str = f"{{{labels}}}" if labels else ""
+        lines: List[str] = []
+        cumulative: int = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{suffix} {self.sum!r}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+class WorkerMetrics:
+    """
+    Per-stage timings and aircraft counts for `ADSBXWorker`.
+
+    Stages are timed per call: ``fetch`` and ``decode`` per feed response,
+    ``filter``, ``convert`` and ``enqueue`` per aircraft (or per snapshot, or
+    shard, when done in bulk), and ``cycle`` per poll cycle.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.stages: Dict[str, Histogram] = {
+            stage: Histogram(buckets) for stage in STAGES
+        }
+        self.received: int = 0
+        self.emitted: int = 0
+        self.dropped: int = 0
+        self.extrapolated: int = 0
+        self.staled: int = 0
+        self.filtered: Dict[str, int] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """Record the time taken by one call of a stage."""
+        self.stages[stage].observe(seconds)
+
+    def filter(self, reason: str, count: int = 1) -> None:
+        """Count aircraft that were not sent, and why."""
+        self.filtered[reason] = self.filtered.get(reason, 0) + count
+
+    def render(
+        self, queue: Optional[asyncio.Queue] = None, registry_size: Optional[int] = None
+    ) -> str:
+        """
+        Render all metrics, the TX queue depth and the number of aircraft tracked,
+        in Prometheus text format.
+        """
+        lines: List[str] = [
+            "# HELP adsbxcot_stage_seconds Time taken by each poll cycle stage.",
+            "# TYPE adsbxcot_stage_seconds histogram",
+        ]
+        for stage, histogram in self.stages.items():
+            lines.extend(histogram.render("adsbxcot_stage_seconds", f'stage="{stage}"'))
+
+        lines.extend(
+            [
+                "# HELP adsbxcot_aircraft_received_total Aircraft received from feeds.",
+                "# TYPE adsbxcot_aircraft_received_total counter",
+                f"adsbxcot_aircraft_received_total {self.received}",
+                "# HELP adsbxcot_aircraft_filtered_total Aircraft not sent, by reason.",
+                "# TYPE adsbxcot_aircraft_filtered_total counter",
+            ]
+        )
+        for reason, count in sorted(self.filtered.items()):
+            lines.append(
+                f'adsbxcot_aircraft_filtered_total{{reason="{reason}"}} {count}'
+            )
+        lines.extend(
+            [
+                "# HELP adsbxcot_aircraft_emitted_total CoT events put on the TX queue.",
+                "# TYPE adsbxcot_aircraft_emitted_total counter",
+                f"adsbxcot_aircraft_emitted_total {self.emitted}",
+                "# HELP adsbxcot_queue_dropped_total CoT events dropped, queue full.",
+                "# TYPE adsbxcot_queue_dropped_total counter",
+                f"adsbxcot_queue_dropped_total {self.dropped}",
+                "# HELP adsbxcot_aircraft_extrapolated_total Dead-reckoned positions.",
+                "# TYPE adsbxcot_aircraft_extrapolated_total counter",
+                f"adsbxcot_aircraft_extrapolated_total {self.extrapolated}",
+                "# HELP adsbxcot_aircraft_staled_total STALE_OUT events sent.",
+                "# TYPE adsbxcot_aircraft_staled_total counter",
+                f"adsbxcot_aircraft_staled_total {self.staled}",
+            ]
+        )
+        if queue is not None:
+            lines.extend(
+                [
+                    "# HELP adsbxcot_queue_depth CoT events waiting on the TX queue.",
+                    "# TYPE adsbxcot_queue_depth gauge",
+                    f"adsbxcot_queue_depth {queue.qsize()}",
+                ]
+            )
+        if hasattr(queue, "coalesced"):
+            lines.extend(
+                [
+                    "# HELP adsbxcot_queue_coalesced_total CoT events replaced by "
+                    "a newer event for the same UID.",
+                    "# TYPE adsbxcot_queue_coalesced_total counter",
+                    f"adsbxcot_queue_coalesced_total {queue.coalesced}",
+                ]
+            )
+        if registry_size is not None:
+            lines.extend(
+                [
+                    "# HELP adsbxcot_registry_size Aircraft currently tracked.",
+                    "# TYPE adsbxcot_registry_size gauge",
+                    f"adsbxcot_registry_size {registry_size}",
+                ]
+            )
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright Sensors & Signals LLC https://www.snstac.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+ADSBXCOT TAK Protocol Version 1 (Protobuf) Functions.
+
+Writes, and reads back just enough of, the TAK Protocol v1 ``TakMessage`` wire
+format, without depending on `takproto` or `protobuf`. Field numbers are from
+TAK's ``takmessage.proto``, ``cotevent.proto``, ``detail.proto``,
+``contact.proto`` and ``track.proto``.
+"""
+
+import struct
+
+from typing import List, Optional, Tuple
+
+# TAK Protocol header magic byte, and the mesh (UDP) header:
+MAGIC: bytes = b"\xbf"
+MESH_HEADER: bytes = b"\xbf\x01\xbf"
+
+# Protobuf wire types:
+VARINT: int = 0
+FIXED64: int = 1
+LENGTH: int = 2
+
+# TakMessage:
+TAK_MESSAGE_COT_EVENT: int = 2
+
+# CotEvent:
+COT_TYPE: int = 1
+COT_UID: int = 5
+COT_SEND_TIME: int = 6
+COT_START_TIME: int = 7
+COT_STALE_TIME: int = 8
+COT_HOW: int = 9
+COT_LAT: int = 10
+COT_LON: int = 11
+COT_HAE: int = 12
+COT_CE: int = 13
+COT_LE: int = 14
+COT_DETAIL: int = 15
+
+# Detail:
+DETAIL_XML: int = 1
+DETAIL_CONTACT: int = 2
+DETAIL_TRACK: int = 7
+
+# Contact:
+CONTACT_CALLSIGN: int = 2
+
+# Track:
+TRACK_SPEED: int = 1
+TRACK_COURSE: int = 2
+
+
+def varint(value: int) -> bytes:
+    """Encodes an unsigned integer as a protobuf varint."""
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def read_varint(data: bytes, pos: int = 0) -> Tuple[int, int]:
+    """Decodes a protobuf varint, returning its value and the next position."""
+    value: int = 0
+    shift: int = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError("Truncated varint")
+        byte: int = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def string_field(field: int, value: Optional[str]) -> bytes:
+    """Encodes a string field, omitted if empty (the proto3 default)."""
+    if not value:
+        return b""
+    encoded: bytes = value.encode()
+    return varint(field << 3 | LENGTH) + varint(len(encoded)) + encoded
+
+
+def message_field(field: int, value: bytes) -> bytes:
+    """Encodes an embedded message field."""
+    return varint(field << 3 | LENGTH) + varint(len(value)) + value
+
+
+def double_field(field: int, value: float) -> bytes:
+    """Encodes a double field, omitted if 0 (the proto3 default)."""
+    if not value:
+        return b""
+    return varint(field << 3 | FIXED64) + struct.pack("<d", value)
+
+
+def uint64_field(field: int, value: int) -> bytes:
+    """Encodes a uint64 field, omitted if 0 (the proto3 default)."""
+    if not value:
+        return b""
+    return varint(field << 3 | VARINT) + varint(value)
+
+
+def read_fields(data: bytes) -> List[Tuple[int, int, object]]:
+    """
+    Decodes a protobuf message into its fields.
+
+    Returns
+    -------
+    `list`
+        (field number, wire type, value) of each field, in order. Values are
+        `int` for varints, and `bytes` otherwise.
+    """
+    fields: List[Tuple[int, int, object]] = []
+    pos: int = 0
+    while pos < len(data):
+        key, pos = read_varint(data, pos)
+        field, wire_type = key >> 3, key & 0x07
+        if wire_type == VARINT:
+            value, pos = read_varint(data, pos)
+        elif wire_type == FIXED64:
+            value, pos = data[pos : pos + 8], pos + 8
+        elif wire_type == LENGTH:
+            length, pos = read_varint(data, pos)
+            value, pos = data[pos : pos + length], pos + length
+        elif wire_type == 5:
+            value, pos = data[pos : pos + 4], pos + 4
+        else:
+            raise ValueError(f"Unsupported wire type: {wire_type}")
+        fields.append((field, wire_type, value))
+    return fields
+
+
+def write_fields(fields: List[Tuple[int, int, object]]) -> bytes:
+    """Encodes fields, as returned by `read_fields()`, back into a message."""
+    out = bytearray()
+    for field, wire_type, value in fields:
+        out += varint(field << 3 | wire_type)
+        if wire_type == VARINT:
+            out += varint(value)  # type: ignore
+        elif wire_type == LENGTH:
+            out += varint(len(value)) + value  # type: ignore
+        else:
+            out += value  # type: ignore
+    return bytes(out)
+
+
+def frame(payload: bytes, framing: str = "stream") -> bytes:
+    """Adds the TAK Protocol v1 mesh or stream header to a `TakMessage`."""
+    if framing == "mesh":
+        return MESH_HEADER + payload
+    return MAGIC + varint(len(payload)) + payload
+
+
+def unframe(data: bytes) -> Tuple[bytes, str]:
+    """
+    Removes the TAK Protocol v1 header from a `TakMessage`.
+
+    Returns
+    -------
+    `tuple`
+        The `TakMessage`, and its framing: "mesh" or "stream".
+    """
+    if data.startswith(MESH_HEADER):
+        return data[len(MESH_HEADER) :], "mesh"
+    if data.startswith(MAGIC):
+        length, pos = read_varint(data, 1)
+        return data[pos : pos + length], "stream"
+    raise ValueError("Not a TAK Protocol v1 message")
+
+
+def is_tak_proto(data: bytes) -> bool:
+    """Determines if an event is TAK Protocol v1, rather than XML."""
+    return data[:1] == MAGIC
+
+
+def cot_event(data: bytes) -> List[Tuple[int, int, object]]:
+    """Decodes the `CotEvent` fields of a framed TAK Protocol v1 message."""
+    payload, _ = unframe(data)
+    for field, wire_type, value in read_fields(payload):
+        if field == TAK_MESSAGE_COT_EVENT and wire_type == LENGTH:
+            return read_fields(value)  # type: ignore
+    return []
+
+
+def proto_uid(data: bytes) -> Optional[bytes]:
+    """Gets the UID of a framed TAK Protocol v1 message."""
+    try:
+        for field, wire_type, value in cot_event(data):
+            if field == COT_UID and wire_type == LENGTH:
+                return value  # type: ignore
+    except ValueError:
+        pass
+    return None
+
+
+def restamp(data: bytes, send_time: int, start_time: int, stale_time: int) -> bytes:
+    """Replaces the send, start and stale times (ms) of a framed message."""
+    _, framing = unframe(data)
+    times: dict = {
+        COT_SEND_TIME: send_time,
+        COT_START_TIME: start_time,
+        COT_STALE_TIME: stale_time,
+    }
+    fields = [
+        (field, wire_type, times[field] if field in times else value)
+        for field, wire_type, value in cot_event(data)
+    ]
+    return frame(message_field(TAK_MESSAGE_COT_EVENT, write_fields(fields)), framing)
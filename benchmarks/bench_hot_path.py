@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright Sensors & Signals LLC https://www.snstac.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+ADSBXCOT snapshot-to-CoT hot path benchmarks.
+
+Runs each benchmark against deterministic, synthetic snapshots and writes the
+results as JSON, so runs of different releases can be compared::
+
+    python3 benchmarks/bench_hot_path.py --output build/benchmark.json
+    python3 benchmarks/bench_hot_path.py --compare old.json build/benchmark.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from configparser import ConfigParser
+from typing import Callable, List, Optional
+
+# Benchmark the checkout this script is in, whether or not adsbxcot is installed:
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import adsbxcot  # NOQA pylint: disable=wrong-import-position
+import adsbxcot.functions  # NOQA pylint: disable=wrong-import-position
+
+from adsbxcot import decode_functions  # NOQA pylint: disable=wrong-import-position
+
+SIZES: List[int] = [100, 1_000, 10_000, 50_000]
+
+# Share of aircraft in a snapshot that are TIS-B, on the ground, or are missing
+# one or more fields (position, altitude, speed, callsign):
+TISB_SHARE: float = 0.05
+GROUND_SHARE: float = 0.05
+MISSING_SHARE: float = 0.10
+
+
+def make_craft(rand: random.Random, index: int) -> dict:
+    """Generate one aircraft, as found in the `ac` list of an ADSBX snapshot."""
+    icao: str = f"{(0xA00000 + index * 7) & 0xFFFFFF:06x}"
+    craft: dict = {
+        "hex": icao,
+        "type": "adsb_icao",
+        "flight": f"{rand.choice(['UAL', 'DAL', 'SWA', 'AAL', 'N'])}"
+        f"{rand.randint(1, 9999):<5}",
+        "r": f"N{rand.randint(100, 99999)}",
+        "t": rand.choice(["B738", "A320", "C172", "E75L", "B77W"]),
+        "alt_baro": rand.randint(1_000, 43_000),
+        "alt_geom": 0,
+        "gs": round(rand.uniform(90.0, 520.0), 1),
+        "track": round(rand.uniform(0.0, 359.9), 2),
+        "squawk": f"{rand.randint(0, 7777):04d}",
+        "category": rand.choice(["A1", "A3", "A5", "B1"]),
+        "lat": round(rand.uniform(-60.0, 70.0), 6),
+        "lon": round(rand.uniform(-180.0, 180.0), 6),
+        "seen_pos": round(rand.uniform(0.0, 30.0), 1),
+        "seen": round(rand.uniform(0.0, 10.0), 1),
+        "messages": rand.randint(1, 100_000),
+        "rssi": round(rand.uniform(-30.0, -3.0), 1),
+    }
+    craft["alt_geom"] = craft["alt_baro"] + rand.randint(-500, 500)
+
+    roll: float = rand.random()
+    if roll < TISB_SHARE:
+        craft["hex"] = f"~{icao}"
+        craft["type"] = "tisb_other"
+    elif roll < TISB_SHARE + GROUND_SHARE:
+        craft["alt_baro"] = "ground"
+        craft["gs"] = round(rand.uniform(0.0, 25.0), 1)
+        del craft["alt_geom"]
+    elif roll < TISB_SHARE + GROUND_SHARE + MISSING_SHARE:
+        for key in rand.sample(["lat", "alt_geom", "gs", "flight", "track"], 2):
+            craft.pop(key, None)
+        if "lat" not in craft:
+            craft.pop("lon", None)
+            craft.pop("seen_pos", None)
+    return craft
+
+
+def make_snapshot(size: int, seed: int = 0) -> list:
+    """Generate a deterministic snapshot of `size` aircraft."""
+    rand = random.Random(f"{seed}-{size}")
+    return [make_craft(rand, index) for index in range(size)]
+
+
+def make_config(options: Optional[dict] = None) -> ConfigParser:
+    """Worker config for benchmarks, with any extra `options` set."""
+    config = ConfigParser()
+    config.read_dict({"adsbxcot": {"FEED_URL": "http://localhost", **(options or {})}})
+    return config["adsbxcot"]
+
+
+def percentiles(latencies_ns: List[int]) -> dict:
+    """Summarize per-aircraft latencies, in microseconds."""
+    latencies: List[float] = sorted(ns / 1_000 for ns in latencies_ns)
+    if not latencies:
+        return {}
+
+    def pick(share: float) -> float:
+        return latencies[min(len(latencies) - 1, int(share * len(latencies)))]
+
+    return {
+        "p50_us": pick(0.50),
+        "p90_us": pick(0.90),
+        "p99_us": pick(0.99),
+        "max_us": latencies[-1],
+        "mean_us": statistics.fmean(latencies),
+    }
+
+
+def peak_memory(func: Callable[[], None]) -> int:
+    """Peak memory, in bytes, allocated while running `func`."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def convertible(snapshot: list) -> list:
+    """Aircraft the conversion functions accept on their own (TIS-B is filtered
+    by the worker before conversion)."""
+    return [craft for craft in snapshot if "~" not in craft["hex"]]
+
+
+def bench_function(func: Callable, snapshot: list, profile) -> dict:
+    """Benchmark a conversion function, called once per aircraft."""
+    crafts: list = convertible(snapshot)
+    latencies: List[int] = []
+    start: int = time.perf_counter_ns()
+    for craft in crafts:
+        call_start: int = time.perf_counter_ns()
+        func(craft, profile=profile)
+        latencies.append(time.perf_counter_ns() - call_start)
+    elapsed: float = (time.perf_counter_ns() - start) / 1e9
+
+    return {
+        "aircraft": len(crafts),
+        "seconds": elapsed,
+        "aircraft_per_second": len(crafts) / elapsed if elapsed else None,
+        **percentiles(latencies),
+        "peak_memory_bytes": peak_memory(
+            lambda: [func(craft, profile=profile) for craft in crafts]
+        ),
+    }
+
+
+def bench_decode(snapshot: list, decoder: str) -> dict:
+    """Benchmark decoding a whole snapshot response with a JSON_DECODER."""
+    decode: Callable = decode_functions.get_decoder(decoder)
+    body: bytes = json.dumps({"now": 1700000000.0, "ac": snapshot}).encode()
+    start: int = time.perf_counter_ns()
+    decode(body)
+    elapsed: float = (time.perf_counter_ns() - start) / 1e9
+    return {
+        "aircraft": len(snapshot),
+        "bytes": len(body),
+        "seconds": elapsed,
+        "aircraft_per_second": len(snapshot) / elapsed if elapsed else None,
+        "peak_memory_bytes": peak_memory(lambda: decode(body)),
+    }
+
+
+def new_worker(options: Optional[dict] = None) -> "adsbxcot.ADSBXWorker":
+    """Worker with an unbounded queue, so nothing blocks on TX."""
+    worker = adsbxcot.ADSBXWorker(asyncio.Queue(), make_config(options))
+    worker._profile = adsbxcot.compile_profile(worker.config)
+    return worker
+
+
+def bench_process_craft(snapshot: list, options: Optional[dict] = None) -> dict:
+    """Benchmark `ADSBXWorker.process_craft()`, called once per aircraft."""
+
+    async def run(crafts: list, latencies: Optional[List[int]]) -> None:
+        worker = new_worker(options)
+        for craft in crafts:
+            call_start: int = time.perf_counter_ns()
+            await worker.process_craft(craft)
+            if latencies is not None:
+                latencies.append(time.perf_counter_ns() - call_start)
+
+    latencies: List[int] = []
+    crafts: list = [dict(craft) for craft in snapshot]
+    start: int = time.perf_counter_ns()
+    asyncio.run(run(crafts, latencies))
+    elapsed: float = (time.perf_counter_ns() - start) / 1e9
+
+    crafts = [dict(craft) for craft in snapshot]
+    return {
+        "aircraft": len(snapshot),
+        "seconds": elapsed,
+        "aircraft_per_second": len(snapshot) / elapsed if elapsed else None,
+        **percentiles(latencies),
+        "peak_memory_bytes": peak_memory(lambda: asyncio.run(run(crafts, None))),
+    }
+
+
+def bench_handle_data(snapshot: list, options: Optional[dict] = None) -> dict:
+    """Benchmark `ADSBXWorker.handle_data()` end to end, one call per snapshot."""
+
+    async def run(crafts: list) -> int:
+        worker = new_worker(options)
+        try:
+            await worker.handle_data(crafts)
+        finally:
+            worker.shutdown_executor()
+        return worker.queue.qsize()
+
+    crafts: list = [dict(craft) for craft in snapshot]
+    start: int = time.perf_counter_ns()
+    events: int = asyncio.run(run(crafts))
+    elapsed: float = (time.perf_counter_ns() - start) / 1e9
+
+    crafts = [dict(craft) for craft in snapshot]
+    return {
+        "aircraft": len(snapshot),
+        "events": events,
+        "seconds": elapsed,
+        "aircraft_per_second": len(snapshot) / elapsed if elapsed else None,
+        "peak_memory_bytes": peak_memory(lambda: asyncio.run(run(crafts))),
+    }
+
+
+def run_benchmarks(sizes: List[int], seed: int = 0) -> dict:
+    """Run every benchmark at every snapshot size."""
+    profile = adsbxcot.compile_profile(make_config())
+    template = adsbxcot.compile_profile(make_config({"COT_SERIALIZER": "template"}))
+
+    results: dict = {}
+    for size in sizes:
+        snapshot: list = make_snapshot(size, seed)
+        results[str(size)] = {
+            "adsbx_to_cot_xml": bench_function(
+                adsbxcot.functions.adsbx_to_cot_xml, snapshot, profile
+            ),
+            "adsbx_to_cot": bench_function(adsbxcot.adsbx_to_cot, snapshot, profile),
+            "adsbx_to_cot[template]": bench_function(
+                adsbxcot.adsbx_to_cot, snapshot, template
+            ),
+            **{
+                f"decode[{decoder}]": bench_decode(snapshot, decoder)
+                for decoder in ("json", "orjson", "msgspec")
+            },
+            "process_craft": bench_process_craft(snapshot),
+            "handle_data": bench_handle_data(snapshot),
+        }
+        print(f"{size} aircraft:", file=sys.stderr)
+        for name, result in results[str(size)].items():
+            p99: str = f"{result['p99_us']:>8.1f}us" if "p99_us" in result else "-"
+            print(
+                f"  {name:<24} {result['aircraft_per_second'] or 0:>12,.0f} ac/s"
+                f"  p99 {p99:>10}"
+                f"  peak {result['peak_memory_bytes'] / 1e6:>8.1f}MB",
+                file=sys.stderr,
+            )
+
+    return {
+        "adsbxcot": getattr(adsbxcot, "__version__", None),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "results": results,
+    }
+
+
+def compare(old: dict, new: dict) -> None:
+    """Print the throughput change between two result files."""
+    for size, benches in new["results"].items():
+        for name, result in benches.items():
+            before = old["results"].get(size, {}).get(name, {})
+            if not before.get("aircraft_per_second"):
+                continue
+            change = result["aircraft_per_second"] / before["aircraft_per_second"] - 1
+            print(f"{size:>6} {name:<24} {change:>+8.1%}")
+
+
+def main() -> None:
+    """Benchmark command-line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=SIZES,
+        help="Comma-separated snapshot sizes. Default: %(default)s",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file.")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("OLD", "NEW"),
+        help="Compare two result files instead of running benchmarks.",
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], encoding="UTF-8") as old_fd, open(
+            args.compare[1], encoding="UTF-8"
+        ) as new_fd:
+            compare(json.load(old_fd), json.load(new_fd))
+        return
+
+    results: dict = run_benchmarks(args.sizes, args.seed)
+    if args.output:
+        with open(args.output, "w", encoding="UTF-8") as out_fd:
+            json.dump(results, out_fd, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ADSBXCOT Batch (NumPy) Function Tests."""
+
+import asyncio
+
+import aircot
+import pytest
+
+import adsbxcot
+
+np = pytest.importorskip("numpy")
+
+from adsbxcot import batch_functions  # NOQA pylint: disable=wrong-import-position
+
+
+@pytest.fixture
+def snapshot():
+    return [
+        {"hex": "a9ee47", "lat": 37.8, "lon": -122.0, "alt_baro": 3700, "gs": 79.5},
+        {"hex": "~2ba4e1", "lat": 37.7, "lon": -122.1, "alt_baro": 1200},
+        {"hex": "3c4586", "alt_baro": 37000, "gs": 487.6},
+        {"hex": "a18b41", "lat": 39.4, "lon": -120.4, "alt_baro": 39000},
+        {"hex": "abd994", "lat": 37.9, "lon": -122.2, "alt_baro": "ground", "gs": 0},
+        {"hex": "a00001", "lat": 37.6, "lon": -122.3, "seen_pos": 90.0},
+        {
+            "hex": "a00002",
+            "lat": 37.5,
+            "lon": -122.4,
+            "alt_baro": 17650,
+            "alt_geom": 18650,
+            "gs": 353.4,
+            "r": "n739ul ",
+        },
+        {"hex": "a00003", "lat": 37.5, "lon": -122.4, "flight": "TACO01  "},
+        "not a dict",
+    ]
+
+
+def _scalar_filter(data, config, rows):
+    """The per-aircraft filters of `ADSBXWorker.prepare_craft()`."""
+    worker = adsbxcot.ADSBXWorker(asyncio.Queue(), config)
+    worker.known_craft_db = rows
+    survivors = []
+    for craft in data:
+        prepared = worker.prepare_craft(craft)
+        if prepared is not None:
+            survivors.append(prepared[0])
+    return survivors
+
+
+@pytest.mark.parametrize(
+    "config",
+    [
+        {},
+        {"INCLUDE_TISB": "true"},
+        {"TISB_ONLY": "true", "INCLUDE_TISB": "true"},
+        {"TISB_ONLY": "true", "INCLUDE_TISB": "false"},
+        {"BBOX": "37.6,-122.25,38,-121"},
+        # Concave, its notch excluding a9ee47 but not its neighbours:
+        {"POLYGON": "37.4,-122.5 38,-122.5 38,-121 37.8,-122.45 37.4,-121"},
+        {"BBOX": "37.6,-122.25,38,-121", "POLYGON": "37,-123 38,-123 38,-122.15"},
+        {"MIN_ALTITUDE": "1000", "MAX_ALTITUDE": "20000"},
+        {"MAX_SEEN_POS": "60"},
+        {"INCLUDE_ALL_CRAFT": "false", "KNOWN": "true"},
+    ],
+)
+def test_batch_filter_matches_process_craft(snapshot, config):
+    """Tests that the batch filter keeps the same aircraft as the scalar path."""
+    profile = adsbxcot.compile_profile(config)
+    rows, index = None, None
+    if config.get("KNOWN"):
+        rows = [{"HEX": "A9EE47"}, {"REG": "N739UL"}, {"FLIGHT": "TACO01"}]
+        index = adsbxcot.KnownCraftIndex(rows)
+    expected = _scalar_filter(snapshot, config, rows)
+    actual = batch_functions.batch_filter(snapshot, profile, index)
+    assert [craft["hex"] for craft in actual] == expected
+
+
+def test_batch_filter_unit_conversions(snapshot):
+    """Tests that vectorized conversions format exactly as aircot does."""
+    for craft in batch_functions.batch_filter(
+        snapshot, adsbxcot.compile_profile({"INCLUDE_TISB": "true"})
+    ):
+        assert craft["x_speed"] == aircot.functions.get_speed(craft.get("gs"))
+        assert craft["x_hae"] == aircot.functions.get_hae(craft.get("alt_geom"))
+
+
+def test_batch_filter_copies(snapshot):
+    """Tests that survivors are copies, leaving the feed's aircraft unmodified."""
+    before = [dict(craft) if isinstance(craft, dict) else craft for craft in snapshot]
+    survivors = batch_functions.batch_filter(snapshot, adsbxcot.ConversionProfile())
+    assert survivors
+    assert snapshot == before
+    assert all("x_speed" in craft and "x_hae" in craft for craft in survivors)
+
+
+def test_batch_filter_empty():
+    """Tests that an empty or invalid snapshot returns no aircraft."""
+    assert batch_functions.batch_filter([], adsbxcot.ConversionProfile()) == []
+    assert batch_functions.batch_filter([None], adsbxcot.ConversionProfile()) == []
@@ -4,10 +4,35 @@
 """ADSBXCOT Class Tests."""
 
 import pytest
-from adsbxcot.classes import ADSBXWorker
+from adsbxcot.classes import (
+    ADSBXWorker,
+    Aircraft,
+    AircraftRegistry,
+    AircraftStreamParser,
+    AltitudeReferenceCache,
+    CoalescingQueue,
+    CotFragmentCache,
+    FeedRecorder,
+    FileWatcher,
+    KnownCraftIndex,
+    OutputBudget,
+    RequestBudget,
+    ZoneIndex,
+)
 from configparser import ConfigParser, SectionProxy
 import asyncio
+import json
 import logging
+import os
+import pickle
+import random
+import sys
+import time
+
+import adsbxcot
+import aiohttp
+import aiohttp.test_utils
+import aiohttp.web
 
 from unittest.mock import patch, MagicMock
 
@@ -78,8 +103,8 @@ def test_calc_altitude_no_alt_geom(real_worker):
 
 
 def test_calc_altitude_with_cache(real_worker):
-    craft_with_both_altitudes = {"alt_baro": 37000, "alt_geom": 37500}
-    craft_with_only_baro = {"alt_baro": 37000}
+    craft_with_both_altitudes = {"hex": "a9ee47", "alt_baro": 37000, "alt_geom": 37500}
+    craft_with_only_baro = {"hex": "a9ee47", "alt_baro": 36000}
 
     # Test with both altitudes
     result = real_worker.calc_altitude(craft_with_both_altitudes)
@@ -87,7 +112,158 @@ def test_calc_altitude_with_cache(real_worker):
 
     # Test with only barometric altitude
     result = real_worker.calc_altitude(craft_with_only_baro)
-    assert result == {"x_alt_baro_offset": 0.0, "x_alt_geom": 37000.0}
+    assert result == {"x_alt_baro_offset": 500.0, "x_alt_geom": 36500.0}
+
+
+def test_calc_altitude_per_region(real_worker):
+    """Tests that other aircraft take the reference of their own region only."""
+    real_worker.calc_altitude(
+        {
+            "hex": "a9ee47",
+            "alt_baro": 37000,
+            "alt_geom": 37500,
+            "lat": 37.5,
+            "lon": -122.5,
+        }
+    )
+    real_worker.calc_altitude(
+        {
+            "hex": "3c4586",
+            "alt_baro": 37000,
+            "alt_geom": 36800,
+            "lat": 52.5,
+            "lon": 13.5,
+        }
+    )
+
+    # Same region:
+    result = real_worker.calc_altitude(
+        {"hex": "abd994", "alt_baro": 17000, "lat": 37.6, "lon": -122.4}
+    )
+    assert result == {"x_alt_baro_offset": 500.0, "x_alt_geom": 17500.0}
+
+    # Neighbouring region:
+    result = real_worker.calc_altitude(
+        {"hex": "abd994", "alt_baro": 17000, "lat": 51.9, "lon": 13.5}
+    )
+    assert result == {"x_alt_baro_offset": -200.0, "x_alt_geom": 16800.0}
+
+    # No nearby reference:
+    assert (
+        real_worker.calc_altitude(
+            {"hex": "abd995", "alt_baro": 17000, "lat": 10.0, "lon": 10.0}
+        )
+        == {}
+    )
+    assert real_worker.calc_altitude({"hex": "abd995", "alt_baro": 17000}) == {}
+
+
+def test_aircraft():
+    """Tests an Aircraft record normalizes once, and behaves as a dict."""
+    craft = {
+        "hex": " ~a9ee47 ",
+        "flight": "ual1    ",
+        "r": "n1",
+        "category": "a3",
+        "t": "b738",
+        "squawk": "7700",
+        "lat": 37.1,
+        "lon": -122.2,
+        "alt_baro": "ground",
+        "nac_p": None,
+        **{f"unused_{i}": i for i in range(30)},
+    }
+    record = Aircraft(craft)
+    assert record.hex == "~A9EE47" and record.tisb
+    assert record.flight == "UAL1"
+    assert (record.r, record.category, record.t) == ("N1", "A3", "B738")
+    assert record == {
+        "hex": "~A9EE47",
+        "flight": "UAL1",
+        "r": "N1",
+        "category": "A3",
+        "t": "B738",
+        "squawk": "7700",
+        "lat": 37.1,
+        "lon": -122.2,
+        "alt_baro": "ground",
+    }
+    assert "nac_p" not in record and record.get("nac_p", "x") == "x"
+    assert "unused_1" not in record
+    assert sys.getsizeof(record) < sys.getsizeof(craft)
+
+    record.update({"x_alt_geom": 100.0})
+    assert record["x_alt_geom"] == 100.0
+    del record["x_alt_geom"]
+    with pytest.raises(KeyError):
+        record["x_alt_geom"]  # pylint: disable=pointless-statement
+    with pytest.raises(KeyError):
+        record["unused_1"] = 1
+
+    copy = record.copy()
+    copy["lat"] = 38.0
+    assert record["lat"] == 37.1 and copy.tisb
+    assert pickle.loads(pickle.dumps(record)) == record
+    assert Aircraft({"icao": "abc123"}).hex == "ABC123"
+
+
+def test_cot_fragment_cache():
+    """Tests cached fields are only used while their inputs are unchanged."""
+    cache = CotFragmentCache(2)
+    known = {"HEX": "A9EE47", "CALLSIGN": "N1"}
+    inputs = ("A9EE47", "N1", "UAL1", "1200", "A3", "B738", "ICAO", "host")
+    cache.put("A9EE47", inputs, known, {"uid": "ICAO-A9EE47"})
+
+    assert cache.get("A9EE47", inputs, known) == {"uid": "ICAO-A9EE47"}
+    assert cache.get("A9EE47", inputs, dict(known)) == {"uid": "ICAO-A9EE47"}
+    assert cache.get("A9EE47", inputs[:2] + ("UAL2",) + inputs[3:], known) is None
+    assert cache.get("A9EE47", inputs, {}) is None
+    assert (cache.hits, cache.misses) == (2, 2)
+
+    cache.put("A9EE48", inputs, {}, {})
+    cache.get("A9EE47", inputs, known)
+    cache.put("A9EE49", inputs, {}, {})
+    assert list(cache.entries) == ["A9EE47", "A9EE49"]
+    cache.discard("A9EE47")
+    cache.discard("A9EE47")
+    assert len(cache) == 1
+
+
+@pytest.mark.asyncio
+async def test_process_craft_fragment_cache(real_worker):
+    """Tests the worker caches static fields, and forgets them with the aircraft."""
+    craft = {"hex": "a9ee47", "flight": "UAL1", "lat": 37.0, "lon": -122.0}
+    await real_worker.process_craft(dict(craft))
+    await real_worker.process_craft(dict(craft))
+    assert real_worker.fragments.hits == 1
+    assert len(real_worker.fragments) == 1
+
+    real_worker.forget_craft("A9EE47")
+    assert len(real_worker.fragments) == 0
+
+    real_worker.config["FRAGMENT_CACHE_SIZE"] = "0"
+    worker = ADSBXWorker(asyncio.Queue(), real_worker.config)
+    await worker.process_craft(dict(craft))
+    assert worker.fragments is None
+    assert worker.queue.qsize() == 1
+
+
+def test_altitude_reference_cache_bounded():
+    """Tests that the altitude reference cache evicts by size and by TTL."""
+    cache = AltitudeReferenceCache(max_size=2, ttl=60, cell_size=1.0)
+    cache.update("A", 100.0, 37.5, -122.5, now=0)
+    cache.update("B", 200.0, now=10)
+    cache.update("C", 300.0, now=20)
+    assert len(cache) == 2
+    assert cache.get("A", now=20) is None
+    assert cache.get("B", now=20) == 200.0
+    assert cache.get("Z", 37.1, -122.9, now=20) == 100.0
+
+    assert cache.get("Z", 37.1, -122.9, now=61) is None
+    assert cache.get("B", now=71) is None
+    assert cache.get("C", now=71) == 300.0
+    assert len(cache) == 1
+    assert not cache.cells
 
 
 @pytest.mark.asyncio
@@ -135,7 +311,7 @@ def test_ADSBXWorker():
     assert worker.queue.empty()
     assert worker._logger.level == logging.INFO
     assert worker._logger.handlers[0].level == logging.INFO
-    assert worker.altitudes == {}
+    assert len(worker.altitudes) == 0
 
 
 # @pytest.mark.asyncio
@@ -228,3 +404,920 @@ async def test_process_craft_empty_cot(real_worker):
 #                     result = await real_worker.process_craft(craft)
 #                     assert result == "ABC123"
 #                     mock_put_queue.assert_called_once_with(b"cot_event")
+
+
+@pytest.mark.asyncio
+async def test_process_craft_change_detection(real_worker):
+    """Tests that unchanged aircraft are only re-sent on the heartbeat."""
+    craft = {"hex": "a9ee47", "lat": 37.836449, "lon": -122.030281, "gs": 79.5}
+    real_worker.config["CHANGE_DETECTION"] = "true"
+    real_worker.config["HEARTBEAT_INTERVAL"] = "60"
+
+    assert await real_worker.process_craft(dict(craft)) == "A9EE47"
+    assert await real_worker.process_craft(dict(craft)) is None
+    assert real_worker.queue.qsize() == 1
+
+    assert await real_worker.process_craft(dict(craft, lat=37.9)) == "A9EE47"
+    assert real_worker.queue.qsize() == 2
+
+    real_worker.craft_states["A9EE47"]["sent"] -= 60
+    assert await real_worker.process_craft(dict(craft, lat=37.9)) == "A9EE47"
+    assert real_worker.queue.qsize() == 3
+
+
+@pytest.mark.asyncio
+async def test_process_craft_profile(real_worker):
+    """Tests that aircraft are converted from the compiled profile alone."""
+    craft = {"hex": "a9ee47", "lat": 37.836449, "lon": -122.030281}
+    with patch.object(
+        adsbxcot, "adsbx_to_cot", wraps=adsbxcot.adsbx_to_cot
+    ) as adsbx_to_cot:
+        assert await real_worker.process_craft(craft) == "A9EE47"
+    assert "config" not in adsbx_to_cot.call_args.kwargs
+    assert adsbx_to_cot.call_args.kwargs["profile"] is real_worker.profile
+
+
+def test_aircraft_stream_parser():
+    """Tests that aircraft are returned as soon as they are fully received."""
+    body = (
+        b'{"now": 1602849987100, "msg": "No error", '
+        b'"ac": [{"hex": "a9ee47", "lat": 37.8, "flight": "N739UL \\u00e9"}, '
+        b'{"hex": "3c4586", "alt_baro": 37000, "r": "D-\xc3\xa9"}], "total": 2}'
+    )
+    for size in (1, 7, len(body)):
+        parser = AircraftStreamParser("ac")
+        crafts = []
+        for i in range(0, len(body), size):
+            crafts.extend(parser.feed(body[i : i + size]))
+        crafts.extend(parser.close())
+        assert parser.found
+        assert [c["hex"] for c in crafts] == ["a9ee47", "3c4586"]
+        assert crafts[1]["r"] == "D-é"
+        assert parser.meta == {"now": 1602849987100, "msg": "No error", "total": 2}
+
+
+def test_aircraft_stream_parser_first_item_before_end():
+    """Tests that the first aircraft is available before the array ends."""
+    parser = AircraftStreamParser("ac")
+    assert parser.feed(b'{"ac": [{"hex": "a9ee47"}, {"hex": "3c') == [{"hex": "a9ee47"}]
+
+
+def test_aircraft_stream_parser_truncated():
+    """Tests that a truncated response raises ValueError on close."""
+    parser = AircraftStreamParser("ac")
+    parser.feed(b'{"ac": [{"hex": "a9ee47"}, {"hex": "3c')
+    with pytest.raises(ValueError):
+        parser.close()
+
+
+def test_aircraft_stream_parser_keys():
+    """Tests that the aircraft array is found under either key by default."""
+    parser = AircraftStreamParser()
+    assert parser.feed(b'{"now": 1.0, "aircraft": [{"hex": "a9ee47"}]}') == [
+        {"hex": "a9ee47"}
+    ]
+    assert parser.close() == []
+    assert parser.found
+
+
+def test_aircraft_stream_parser_no_key():
+    """Tests that a response without the aircraft key is reported."""
+    parser = AircraftStreamParser("ac")
+    assert parser.feed(b'{"msg": "You need a key", "now": 12}') == []
+    assert parser.close() == []
+    assert not parser.found
+
+
+class MockContent:
+    """Mock aiohttp StreamReader."""
+
+    def __init__(self, body, size=16):
+        self.body = body
+        self.size = size
+
+    async def iter_chunked(self, _):
+        for i in range(0, len(self.body), self.size):
+            yield self.body[i : i + self.size]
+
+
+@pytest.mark.asyncio
+async def test_stream_feed(real_worker):
+    """Tests that a streamed response is processed aircraft by aircraft."""
+    resp = MagicMock()
+    resp.content = MockContent(
+        b'{"ac": [{"hex": "a9ee47", "lat": 37.8, "lon": -122.0}, '
+        b'{"hex": "3c4586", "lat": 37.9, "lon": -122.1}]}'
+    )
+    await real_worker.stream_feed(resp, "https://example.com/")
+    assert real_worker.queue.qsize() == 2
+
+
+@pytest.mark.asyncio
+async def test_stream_feed_batch_filter(real_worker):
+    """Tests that BATCH_FILTER is applied to streamed responses as a whole."""
+    pytest.importorskip("numpy")
+    real_worker.config["BATCH_FILTER"] = "true"
+    real_worker.config["BBOX"] = "37.85,-122.05,37.95,-121.95"
+    resp = MagicMock()
+    resp.content = MockContent(
+        b'{"ac": [{"hex": "a9ee47", "lat": 37.8, "lon": -122.0}, '
+        b'{"hex": "3c4586", "lat": 37.9, "lon": -122.0}]}'
+    )
+    with patch.object(
+        real_worker, "batch_filter", wraps=real_worker.batch_filter
+    ) as batch_filter:
+        await real_worker.stream_feed(resp, "https://example.com/")
+    assert len(batch_filter.call_args.args[0]) == 2
+    assert real_worker.queue.qsize() == 1
+
+
+@pytest.mark.asyncio
+async def test_handle_data_batch_filter_prefiltered(real_worker):
+    """Tests that BATCH_FILTER survivors skip the per-aircraft filters."""
+    pytest.importorskip("numpy")
+    real_worker.config["BATCH_FILTER"] = "true"
+    real_worker.config["BBOX"] = "37.85,-122.05,37.95,-121.95"
+    data = [
+        {"hex": "a9ee47", "lat": 37.8, "lon": -122.0},
+        {"hex": "3c4586", "lat": 37.9, "lon": -122.0},
+    ]
+    with patch.object(
+        adsbxcot, "craft_in_limits", wraps=adsbxcot.craft_in_limits
+    ) as craft_in_limits:
+        await real_worker.handle_data(data)
+    craft_in_limits.assert_not_called()
+    assert real_worker.queue.qsize() == 1
+    assert real_worker.metrics.filtered["batch_filter"] == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_feed_errors(real_worker):
+    """Tests that only parse errors are reported as invalid JSON."""
+    resp = MagicMock()
+    resp.content = MockContent(
+        b'{"ac": [{"hex": "a9ee47", "lat": 37.8, "lon": -122.0}, {"hex": ]}'
+    )
+    await real_worker.stream_feed(resp, "https://example.com/")
+    assert real_worker.queue.qsize() == 1
+
+    resp.content = MockContent(b'{"ac": [{"hex": "a9ee47", "lat": 37.8}]}')
+    with patch.object(real_worker, "process_craft", side_effect=ValueError("bug")):
+        with pytest.raises(ValueError, match="bug"):
+            await real_worker.stream_feed(resp, "https://example.com/")
+
+
+@pytest.mark.asyncio
+async def test_get_feeds(real_worker):
+    """Tests that several feeds are polled and each aircraft is sent once."""
+    feeds = {
+        "https://a/": [{"hex": "a9ee47", "lat": 1.0, "lon": 1.0, "seen_pos": 5.0}],
+        "https://b/": [
+            {"hex": "a9ee47", "lat": 1.1, "lon": 1.1, "seen_pos": 0.5},
+            {"hex": "3c4586", "lat": 2.0, "lon": 2.0, "seen_pos": 1.0},
+        ],
+        "https://c/": RuntimeError("connection refused"),
+    }
+
+    async def fetch_feed(url, stream=False):
+        if isinstance(feeds[url], Exception):
+            raise feeds[url]
+        return feeds[url]
+
+    with patch.object(real_worker, "fetch_feed", side_effect=fetch_feed):
+        await real_worker.get_feeds(list(feeds))
+
+    events = [real_worker.queue.get_nowait() for _ in range(real_worker.queue.qsize())]
+    assert len(events) == 2
+    assert b'lat="1.1"' in events[0]
+
+
+def test_request_budget():
+    """Tests that the request budget is enforced per window."""
+    budget = RequestBudget(2, 60)
+    assert budget.acquire(0)
+    assert budget.acquire(1)
+    assert budget.remaining == 0
+    assert not budget.acquire(2)
+    assert budget.acquire(61)
+    assert budget.remaining == 1
+
+
+@pytest.mark.asyncio
+async def test_fetch_feed_backoff(real_worker):
+    """Tests that HTTP 429 backs off from a feed, honoring Retry-After."""
+    requests = []
+
+    async def handler(request):
+        requests.append(request)
+        return aiohttp.web.Response(status=429, headers={"Retry-After": "120"})
+
+    app = aiohttp.web.Application()
+    app.router.add_get("/", handler)
+    async with aiohttp.test_utils.TestServer(app) as server:
+        async with aiohttp.ClientSession() as real_worker.session:
+            url = str(server.make_url("/"))
+            assert await real_worker.fetch_feed(url) is None
+            assert await real_worker.fetch_feed(url) is None
+
+    assert len(requests) == 1
+    assert real_worker.backoffs[url]["failures"] == 1
+    assert real_worker.backoffs[url]["until"] - time.monotonic() > 110
+
+
+@pytest.mark.asyncio
+async def test_fetch_feed_request_budget(real_worker):
+    """Tests that RapidAPI URLs are not polled once the budget is exhausted."""
+    real_worker.request_budget = RequestBudget(0, 60)
+    real_worker.session = MagicMock(closed=False)
+    assert await real_worker.fetch_feed("https://rapidapi.example.com/") is None
+    real_worker.session.get.assert_not_called()
+
+
+def test_feed_headers(real_worker):
+    """Tests that API_KEY is only sent to ADSBX and RapidAPI feeds."""
+    real_worker.config["API_KEY"] = "secret"
+    assert real_worker.feed_headers("https://adsbexchange.com/api/aircraft/v2/") == {
+        "api-auth": "secret"
+    }
+    assert real_worker.feed_headers("https://api.adsbexchange.com/v2/") == {
+        "api-auth": "secret"
+    }
+    assert (
+        real_worker.feed_headers("https://x.p.rapidapi.com/v2/")["x-rapidapi-key"]
+        == "secret"
+    )
+    for url in (
+        "https://opendata.adsb.fi/api/v2/lat/1/lon/2/dist/25",
+        "http://localhost/tar1090/data/aircraft.json",
+        "https://adsbexchange.com.example.net/",
+    ):
+        assert real_worker.feed_headers(url) == {}
+
+
+@pytest.mark.asyncio
+async def test_fetch_feed_aircraft_key(real_worker):
+    """Tests that readsb/tar1090 aircraft.json, keyed 'aircraft', is accepted."""
+    body = b'{"now": 1700000000.0, "aircraft": [{"hex": "a9ee47", "lat": 37.0}]}'
+
+    async def handler(request):
+        return aiohttp.web.Response(body=body, content_type="application/json")
+
+    app = aiohttp.web.Application()
+    app.router.add_get("/", handler)
+    async with aiohttp.test_utils.TestServer(app) as server:
+        async with aiohttp.ClientSession() as real_worker.session:
+            url = str(server.make_url("/"))
+            assert await real_worker.fetch_feed(url) == [{"hex": "a9ee47", "lat": 37.0}]
+            with patch.object(real_worker, "process_craft") as process_craft:
+                await real_worker.fetch_feed(url, stream=True)
+            process_craft.assert_called_once_with({"hex": "a9ee47", "lat": 37.0})
+
+
+def test_known_craft_index():
+    """Tests lookups by HEX, then REG, then FLIGHT, first row winning."""
+    rows = [
+        {"HEX": "a9ee47 ", "REG": "N1", "CALLSIGN": "FIRST"},
+        {"HEX": "A9EE47", "REG": "N2", "CALLSIGN": "SECOND"},
+        {"HEX": "", "REG": "n739ul", "CALLSIGN": "TACO_01"},
+        {"REG": "", "FLIGHT": "SWA1241", "CALLSIGN": "SOUTHWEST"},
+    ]
+    index = KnownCraftIndex(rows)
+    assert len(index) == 4
+    assert index.lookup("A9EE47")["CALLSIGN"] == "FIRST"
+    assert index.lookup("ABD994", reg="N739UL ")["CALLSIGN"] == "TACO_01"
+    assert index.lookup("ABD994", flight="swa1241 ")["CALLSIGN"] == "SOUTHWEST"
+    assert index.lookup("ABD994", reg="N3", flight="X") == {}
+    assert index.get("", "REG") == {}
+
+
+@pytest.mark.asyncio
+async def test_load_known_craft_reload(real_worker, tmp_path):
+    """Tests that KNOWN_CRAFT is reloaded when the file changes."""
+    known_craft = tmp_path / "known_craft.csv"
+    known_craft.write_text("HEX,CALLSIGN\nA9EE47,TACO_01\n")
+    real_worker.config["KNOWN_CRAFT"] = str(known_craft)
+
+    await real_worker.load_known_craft()
+    assert real_worker.get_known_craft({}, "A9EE47")["CALLSIGN"] == "TACO_01"
+
+    known_craft.write_text("HEX,CALLSIGN\nA9EE47,TACO_02\n")
+    os.utime(known_craft, ns=(0, real_worker.known_craft_mtime + 1_000_000_000))
+    await real_worker.load_known_craft()
+    assert real_worker.get_known_craft({}, "A9EE47")["CALLSIGN"] == "TACO_02"
+
+    known_craft.unlink()
+    await real_worker.load_known_craft()
+    assert real_worker.get_known_craft({}, "A9EE47")["CALLSIGN"] == "TACO_02"
+
+
+def _uids(queue):
+    events = []
+    while not queue.empty():
+        events.append(queue.get_nowait())
+    return [event.split(b'uid="')[1].split(b'"')[0] for event in events]
+
+
+@pytest.mark.asyncio
+async def test_handle_data_sharded(real_worker):
+    """Tests CONVERT_PROCESSES gives the same events as inline conversion."""
+    data = [
+        {"hex": f"a9{i:04x}", "lat": 37.0 + i / 100, "lon": -122.0, "alt_baro": 9000}
+        for i in range(20)
+    ]
+
+    await real_worker.handle_data([dict(craft) for craft in data])
+    expected = _uids(real_worker.queue)
+    assert len(expected) == 20
+
+    real_worker.config["CONVERT_PROCESSES"] = "2"
+    real_worker._profile = None
+    try:
+        await real_worker.handle_data([dict(craft) for craft in data])
+        sharded = _uids(real_worker.queue)
+    finally:
+        real_worker.shutdown_executor()
+
+    assert sorted(sharded) == sorted(expected)
+    assert real_worker.executor is None
+
+
+@pytest.mark.asyncio
+async def test_handle_data_sharded_worker_crash(real_worker):
+    """Tests a dead conversion process falls back to inline and restarts the pool."""
+    real_worker.config["CONVERT_PROCESSES"] = "2"
+    data = [
+        {"hex": f"a9{i:04x}", "lat": 37.0, "lon": -122.0, "alt_baro": 9000}
+        for i in range(10)
+    ]
+
+    executor = real_worker.get_executor()
+    with pytest.raises(Exception):
+        executor.submit(os._exit, 1).result()
+
+    await real_worker.handle_data(data)
+    assert len(_uids(real_worker.queue)) == 10
+    assert real_worker.executor is None
+
+    try:
+        await real_worker.handle_data(data)
+        assert len(_uids(real_worker.queue)) == 10
+        assert real_worker.executor is not None
+    finally:
+        real_worker.shutdown_executor()
+
+
+@pytest.mark.asyncio
+async def test_replay(real_worker, tmp_path):
+    """Tests replaying a recording as fast as possible, and at the recorded cadence."""
+    recording = tmp_path / "recording.json"
+    recording.write_text(
+        "\n".join(
+            json.dumps(
+                {
+                    "now": 1700000000000 + i * 200,
+                    "ac": [{"hex": f"a9ee4{i}", "lat": 37.0, "lon": -122.0}],
+                }
+            )
+            for i in range(3)
+        )
+    )
+
+    assert await real_worker.replay(str(recording), 0, 30) == 3
+    assert real_worker.queue.qsize() == 3
+
+    start = time.monotonic()
+    assert await real_worker.replay(str(recording), 2, 30) == 3
+    assert time.monotonic() - start >= 0.19
+    assert real_worker.queue.qsize() == 6
+
+
+@pytest.mark.asyncio
+async def test_replay_aircraft_json(real_worker, tmp_path):
+    """Tests replaying readsb aircraft.json snapshots, keyed 'aircraft'."""
+    recording = tmp_path / "aircraft.jsonl"
+    recording.write_text(
+        "\n".join(
+            json.dumps(
+                {
+                    "now": 1700000000.0 + i,
+                    "aircraft": [{"hex": f"a9ee4{i}", "lat": 37.0, "lon": -122.0}],
+                }
+            )
+            for i in range(2)
+        )
+    )
+    assert await real_worker.replay(str(recording), 0, 30) == 2
+    assert real_worker.queue.qsize() == 2
+
+
+@pytest.mark.asyncio
+async def test_replay_invalid_record(real_worker, tmp_path):
+    """Tests a RECORD_DIR archive replays around a response that is not JSON."""
+    recorder = FeedRecorder(str(tmp_path), rotate=3600)
+    for i, body in enumerate(
+        [
+            b'{"ac": [{"hex": "a9ee47", "lat": 37.0, "lon": -122.0}]}',
+            b"<html>bad gateway</html>",
+            b'{"ac": [{"hex": "a9ee48", "lat": 37.0, "lon": -122.0}]}',
+        ]
+    ):
+        recorder.record("http://a", body, now=1700000000.0 + i)
+    recorder.close()
+
+    assert await real_worker.replay(str(tmp_path), 0, 30) == 2
+    assert real_worker.queue.qsize() == 2
+
+
+async def _wait_for(predicate, timeout: float = 5.0) -> None:
+    """Wait until `predicate()` is true."""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "Timed out"
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("inotify", [True, False])
+async def test_watch_file(real_worker, tmp_path, inotify):
+    """Tests a feed file is read when rewritten, but not when unchanged."""
+    feed_file = tmp_path / "aircraft.json"
+
+    def write(aircraft: list) -> None:
+        # As readsb does, write a temporary file and rename it into place:
+        temp = tmp_path / "aircraft.json.tmp"
+        temp.write_text(json.dumps({"now": time.time(), "aircraft": aircraft}))
+        os.replace(temp, feed_file)
+
+    craft = {"hex": "a9ee47", "lat": 37.0, "lon": -122.0}
+    write([craft])
+    task = asyncio.create_task(real_worker.watch_file(str(feed_file), 0.05, inotify))
+    try:
+        await _wait_for(lambda: real_worker.queue.qsize() == 1)
+
+        # Same bytes, new file: skipped after the CRC check.
+        contents = feed_file.read_bytes()
+        feed_file.unlink()
+        feed_file.write_bytes(contents)
+        await asyncio.sleep(0.2)
+        assert real_worker.queue.qsize() == 1
+
+        write([craft, {"hex": "a9ee48", "lat": 37.1, "lon": -122.1}])
+        await _wait_for(lambda: real_worker.queue.qsize() == 3)
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+
+@pytest.mark.asyncio
+async def test_watch_file_invalid_json(real_worker, tmp_path):
+    """Tests a feed file caught mid-write is read again, though unchanged."""
+    feed_file = tmp_path / "aircraft.json"
+    feed_file.write_text(
+        json.dumps({"aircraft": [{"hex": "a9ee47", "lat": 37.0, "lon": -122.0}]})
+    )
+    decode_json = real_worker.decode_json
+    reads: list = []
+
+    def decode_once_invalid(body):
+        reads.append(body)
+        if len(reads) == 1:
+            raise ValueError("truncated")
+        return decode_json(body)
+
+    real_worker.decode_json = decode_once_invalid
+    task = asyncio.create_task(real_worker.watch_file(str(feed_file), 0.05, False))
+    try:
+        await _wait_for(lambda: real_worker.queue.qsize() == 1)
+        assert len(reads) == 2
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+
+@pytest.mark.asyncio
+async def test_file_watcher_inotify(tmp_path):
+    """Tests inotify wakes the watcher only for the watched file."""
+    watcher = FileWatcher(str(tmp_path / "aircraft.json"), 5)
+    if not watcher.start():
+        pytest.skip("inotify unavailable")
+    try:
+        (tmp_path / "other.json").write_text("{}")
+        await asyncio.sleep(0.1)
+        assert not watcher.changed.is_set()
+
+        start = time.monotonic()
+        (tmp_path / "aircraft.json").write_text("{}")
+        await watcher.wait()
+        assert time.monotonic() - start < 1
+    finally:
+        watcher.close()
+
+
+@pytest.mark.asyncio
+async def test_fetch_feed_recorder(real_worker, tmp_path):
+    """Tests raw responses are recorded, whole and streamed, and can be read back."""
+    body = b'{"now": 1700000000000,\n "ac": [{"hex": "a9ee47", "lat": 37.0}]}'
+
+    async def handler(request):
+        return aiohttp.web.Response(body=body, content_type="application/json")
+
+    real_worker.recorder = FeedRecorder(str(tmp_path), rotate=3600)
+    real_worker.config["STREAM_CHUNK_SIZE"] = "7"
+    app = aiohttp.web.Application()
+    app.router.add_get("/", handler)
+    async with aiohttp.test_utils.TestServer(app) as server:
+        async with aiohttp.ClientSession() as real_worker.session:
+            url = str(server.make_url("/"))
+            assert len(await real_worker.fetch_feed(url)) == 1
+            assert await real_worker.fetch_feed(url, stream=True) is None
+    real_worker.recorder.close()
+
+    (archive,) = [str(path) for path in tmp_path.glob("adsbxcot-*.jsonl.gz")]
+    index = adsbxcot.read_recording_index(archive)
+    assert [entry[3] for entry in index] == [url, url]
+
+    # Both may be recorded in the same millisecond, so take the last from then:
+    records = list(adsbxcot.read_recording(archive, index[1][0], index[1][0]))
+    assert 1 <= len(records) <= 2
+    assert records[-1]["url"] == url
+    assert records[-1]["response"] == json.loads(body)
+
+    replayed = list(adsbxcot.read_replay(str(tmp_path)))
+    assert replayed == [json.loads(body), json.loads(body)]
+
+
+@pytest.mark.asyncio
+async def test_fetch_feed_recorder_invalid(real_worker, tmp_path):
+    """Tests invalid and truncated responses are recorded as parseable raw text."""
+    bodies = [b"<html>bad\ngateway</html>", b'{"ac": [{"hex": "a9ee47"']
+
+    async def handler(request):
+        return aiohttp.web.Response(body=bodies[int(request.query["i"])])
+
+    real_worker.recorder = FeedRecorder(str(tmp_path), rotate=3600)
+    app = aiohttp.web.Application()
+    app.router.add_get("/", handler)
+    async with aiohttp.test_utils.TestServer(app) as server:
+        async with aiohttp.ClientSession() as real_worker.session:
+            assert await real_worker.fetch_feed(str(server.make_url("/?i=0"))) is None
+            await real_worker.fetch_feed(str(server.make_url("/?i=1")), stream=True)
+    real_worker.recorder.close()
+
+    (archive,) = [str(path) for path in tmp_path.glob("adsbxcot-*.jsonl.gz")]
+    records = list(adsbxcot.read_recording(archive))
+    assert [record["raw"] for record in records] == [True, True]
+    assert [record["response"].encode() for record in records] == bodies
+    assert not list(adsbxcot.read_replay(archive))
+
+
+def test_feed_recorder_rotate(tmp_path):
+    """Tests the recorder starts a new archive every RECORD_ROTATE seconds."""
+    recorder = FeedRecorder(str(tmp_path), rotate=60)
+    recorder.record("http://a", b'{"ac": []}', now=120.0)
+    recorder.record("http://a", b"", now=150.0)
+    recorder.record("http://b", b'{"ac": []}', now=185.0)
+    recorder.close()
+
+    archives = sorted(str(path) for path in tmp_path.glob("*.jsonl.gz"))
+    assert [os.path.basename(path) for path in archives] == [
+        "adsbxcot-19700101T000200Z.jsonl.gz",
+        "adsbxcot-19700101T000300Z.jsonl.gz",
+    ]
+    assert [rec["response"] for rec in adsbxcot.read_recording(archives[0])] == [
+        {"ac": []},
+        None,
+    ]
+    assert list(adsbxcot.read_replay(archives[1])) == [{"ac": [], "now": 185.0}]
+
+
+@pytest.mark.asyncio
+async def test_metrics(real_worker):
+    """Tests aircraft are counted by filter reason, and served over HTTP."""
+    await real_worker.handle_data(
+        [
+            {"hex": "a9ee47", "lat": 37.0, "lon": -122.0},
+            {"hex": "~a9ee48", "lat": 37.0, "lon": -122.0},
+            {"hex": "a9ee49"},
+            {"lat": 37.0, "lon": -122.0},
+        ]
+    )
+    metrics = real_worker.metrics
+    assert metrics.received == 4
+    assert metrics.emitted == 1
+    assert metrics.filtered == {"tisb": 1, "no_position": 1, "no_uid": 1}
+    assert metrics.stages["filter"].count == 4
+    assert metrics.stages["convert"].count == 1
+    assert metrics.stages["enqueue"].count == 1
+
+    port = aiohttp.test_utils.unused_port()
+    real_worker.config["METRICS_PORT"] = str(port)
+    await real_worker.start_metrics_server()
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{port}/metrics") as resp:
+                assert resp.status == 200
+                text = await resp.text()
+    finally:
+        await real_worker.stop_metrics_server()
+
+    assert "adsbxcot_aircraft_emitted_total 1\n" in text
+    assert "adsbxcot_queue_depth 1\n" in text
+
+
+@pytest.mark.asyncio
+async def test_coalescing_queue():
+    """Tests a newer event for a queued UID replaces it in place."""
+    queue = CoalescingQueue()
+    await queue.put(b'<event uid="ICAO-A"><point lat="1"/></event>')
+    await queue.put(b'<event uid="ICAO-B"><point lat="1"/></event>')
+    await queue.put(b"<no-uid/>")
+    await queue.put(b"<no-uid/>")
+    await queue.put(b'<event uid="ICAO-A"><point lat="2"/></event>')
+
+    assert queue.qsize() == 4
+    assert queue.coalesced == 1
+    assert queue.get_nowait() == b'<event uid="ICAO-A"><point lat="2"/></event>'
+    assert queue.get_nowait() == b'<event uid="ICAO-B"><point lat="1"/></event>'
+    assert queue.get_nowait() == b"<no-uid/>"
+    assert queue.get_nowait() == b"<no-uid/>"
+    assert queue.empty()
+
+    await queue.put(b'<event uid="ICAO-A"><point lat="3"/></event>')
+    assert queue.get_nowait() == b'<event uid="ICAO-A"><point lat="3"/></event>'
+
+
+@pytest.mark.asyncio
+async def test_coalescing_queue_worker(config):
+    """Tests repeated snapshots only leave the latest event per aircraft queued."""
+    worker = ADSBXWorker(CoalescingQueue(), config)
+    for lat in (37.0, 37.1, 37.2):
+        await worker.handle_data(
+            [
+                {"hex": "a9ee47", "lat": lat, "lon": -122.0},
+                {"hex": "a9ee48", "lat": lat, "lon": -122.0},
+            ]
+        )
+
+    assert worker.queue.qsize() == 2
+    assert b'lat="37.2"' in worker.queue.get_nowait()
+    assert b'lat="37.2"' in worker.queue.get_nowait()
+
+
+def test_output_budget():
+    """Tests the output budget refills at its rate, up to its burst."""
+    budget = OutputBudget(rate=2, byte_rate=100, burst=1)
+    assert budget.allow(40, now=0)
+    assert not budget.allow(70, now=0)
+    assert budget.delay(70, now=0) == pytest.approx(0.1)
+    assert budget.allow(60, now=0)
+    assert not budget.allow(1, now=0)
+    assert budget.delay(1, now=0) == pytest.approx(0.5)
+    assert budget.allow(50, now=0.5)
+    budget.consume(1000, now=0.5)
+    assert not budget.allow(1, now=10)
+    assert budget.allow(1, now=20)
+
+    # An event bigger than the whole burst waits for a full bucket, then goes:
+    budget = OutputBudget(byte_rate=100, burst=1)
+    assert budget.delay(500, now=0) == 0
+    assert budget.allow(500, now=0)
+    assert budget.delay(500, now=0) == pytest.approx(5)
+    assert budget.allow(500, now=5)
+
+
+@pytest.mark.asyncio
+async def test_handle_data_output_budget(real_worker):
+    """Tests emergencies go at once, then KNOWN_CRAFT, and the rest are held."""
+    real_worker.config["OUTPUT_RATE"] = "1"
+    real_worker.config["OUTPUT_BURST"] = "2"
+    real_worker.known_craft_db = [{"HEX": "A9EE49", "CALLSIGN": "WATCHED"}]
+    data = [
+        {"hex": "a9ee47", "lat": 37.0, "lon": -122.0, "squawk": "1200"},
+        {"hex": "a9ee48", "lat": 37.0, "lon": -122.0, "squawk": "7700"},
+        {"hex": "a9ee4a", "lat": 37.0, "lon": -122.0, "squawk": "1200"},
+        {"hex": "a9ee49", "lat": 37.0, "lon": -122.0, "squawk": "1200"},
+    ]
+
+    await real_worker.handle_data([dict(craft) for craft in data])
+    real_worker.pacer.cancel()
+    assert _uids(real_worker.queue) == [b"ICAO-A9EE48", b"ICAO-A9EE49"]
+    assert list(real_worker.deferred) == ["A9EE47", "A9EE4A"]
+
+    # Held events are released one at a time, as the budget refills:
+    now = real_worker.output_budget.updated
+    assert await real_worker.release_deferred(now) == pytest.approx(1)
+    assert await real_worker.release_deferred(now + 1) == pytest.approx(1)
+    assert _uids(real_worker.queue) == [b"ICAO-A9EE47"]
+    assert await real_worker.release_deferred(now + 2) is None
+    assert _uids(real_worker.queue) == [b"ICAO-A9EE4A"]
+
+    # A newer event replaces a held one, and KNOWN_CRAFT still go first:
+    real_worker.output_budget.events = 0
+    await real_worker.handle_data([dict(craft) for craft in data])
+    await real_worker.handle_data([dict(craft) for craft in data])
+    real_worker.pacer.cancel()
+    assert _uids(real_worker.queue) == [b"ICAO-A9EE48", b"ICAO-A9EE48"]
+    assert real_worker.metrics.filtered["budget"] == 3
+    assert list(real_worker.deferred_order) == ["A9EE49", "A9EE47", "A9EE4A"]
+
+    real_worker.forget_craft("A9EE49")
+    real_worker.stop_pacer()
+    assert not real_worker.deferred
+
+
+@pytest.mark.asyncio
+async def test_pace_output(real_worker):
+    """Tests held events are spread across the budget period, not sent at once."""
+    real_worker.config["OUTPUT_RATE"] = "20"
+    real_worker.config["OUTPUT_BURST"] = "0.05"
+    data = [
+        {"hex": f"a9ee4{i}", "lat": 37.0, "lon": -122.0, "squawk": "1200"}
+        for i in range(5)
+    ]
+
+    start = time.monotonic()
+    await real_worker.handle_data(data)
+    assert real_worker.queue.qsize() == 1
+    await real_worker.pacer
+    assert time.monotonic() - start >= 0.19
+    assert real_worker.queue.qsize() == 5
+    assert not real_worker.deferred
+
+
+@pytest.mark.asyncio
+async def test_extrapolate_tracks(real_worker):
+    """Tests predicted positions are sent between polls, until the fix is too old."""
+    real_worker.config["EXTRAPOLATE_INTERVAL"] = "5"
+    real_worker.config["EXTRAPOLATE_MAX_AGE"] = "60"
+    await real_worker.handle_data(
+        [
+            {
+                "hex": "a9ee47",
+                "lat": 37.0,
+                "lon": -122.0,
+                "track": 0,
+                "gs": 360,
+                "seen_pos": 0,
+            },
+            {"hex": "a9ee48", "lat": 37.0, "lon": -122.0},
+        ]
+    )
+    assert real_worker.queue.qsize() == 2
+    _uids(real_worker.queue)
+
+    fixed = real_worker.tracks["A9EE47"][2]
+    assert await real_worker.extrapolate_tracks(now=fixed + 30) == 1
+    event = real_worker.queue.get_nowait()
+    assert b'uid="ICAO-A9EE47"' in event
+    lat = float(event.split(b' lat="')[1].split(b'"')[0])
+    assert lat == pytest.approx(37.05, abs=0.0001)
+
+    assert await real_worker.extrapolate_tracks(now=fixed + 61) == 0
+    assert "A9EE47" not in real_worker.tracks
+    assert real_worker.metrics.extrapolated == 1
+
+
+@pytest.mark.asyncio
+async def test_extrapolate_tracks_seen_pos(real_worker):
+    """Tests predicted positions are as old as the time since the fix."""
+    real_worker.config["EXTRAPOLATE_INTERVAL"] = "5"
+    craft = {"hex": "a9ee47", "lat": 37.0, "lon": -122.0, "track": 0, "gs": 360}
+    await real_worker.handle_data([dict(craft, seen_pos=10)])
+    fixed = real_worker.tracks["A9EE47"][2]
+    with patch.object(
+        adsbxcot, "adsbx_to_cot", wraps=adsbxcot.adsbx_to_cot
+    ) as adsbx_to_cot:
+        assert await real_worker.extrapolate_tracks(now=fixed + 30) == 1
+    assert adsbx_to_cot.call_args.args[0]["seen_pos"] == 30
+
+
+def test_aircraft_registry():
+    """Tests aircraft expire after the TTL, and the least recently seen are evicted."""
+    registry = AircraftRegistry(ttl=60, max_size=2)
+    assert registry.seen("A", now=0) is None
+    assert registry.seen("B", now=10) is None
+    registry.sent("B", "ICAO-B")
+    assert registry.seen("A", now=20) is None
+    assert registry.seen("C", now=30) == "B"
+    assert len(registry) == 2
+
+    assert registry.expire(now=79) == []
+    assert [icao for icao, _ in registry.expire(now=80)] == ["A"]
+    assert list(registry.aircraft) == ["C"]
+
+
+def test_aircraft_ttl_default(real_queue, config):
+    """Tests AIRCRAFT_TTL defaults to a few POLL_INTERVALs, at most COT_STALE."""
+    assert ADSBXWorker(real_queue, config).registry.ttl == 90
+    config["POLL_INTERVAL"] = "10"
+    assert ADSBXWorker(real_queue, config).registry.ttl == 30
+    config["POLL_INTERVAL"] = "60"
+    config["COT_STALE"] = "120"
+    assert ADSBXWorker(real_queue, config).registry.ttl == 120
+    config["AIRCRAFT_TTL"] = "500"
+    assert ADSBXWorker(real_queue, config).registry.ttl == 500
+
+
+@pytest.mark.asyncio
+async def test_expire_craft(real_worker):
+    """Tests aircraft that leave the feed are forgotten, and staled out."""
+    real_worker.config["STALE_OUT"] = "delete"
+    real_worker.config["CHANGE_DETECTION"] = "true"
+    await real_worker.handle_data(
+        [
+            {"hex": "a9ee47", "lat": 37.0, "lon": -122.0},
+            {"hex": "a9ee48", "lat": 37.0, "lon": -122.0},
+        ]
+    )
+    _uids(real_worker.queue)
+    assert len(real_worker.registry) == 2
+
+    now = time.monotonic()
+    await real_worker.handle_data([{"hex": "a9ee48", "lat": 37.0, "lon": -122.0}])
+    real_worker.registry.aircraft["A9EE48"]["seen"] = now + 200
+    assert await real_worker.expire_craft(now=now + 200) == 1
+
+    assert _uids(real_worker.queue) == [b"ICAO-A9EE47-delete"]
+    assert "A9EE47" not in real_worker.craft_states
+    assert "A9EE48" in real_worker.craft_states
+    assert real_worker.metrics.staled == 1
+
+
+@pytest.mark.asyncio
+async def test_expire_craft_stale(real_worker):
+    """Tests STALE_OUT=stale re-sends the last event, stale now."""
+    real_worker.config["STALE_OUT"] = "stale"
+    await real_worker.handle_data([{"hex": "a9ee47", "lat": 37.0, "lon": -122.0}])
+    sent = real_worker.queue.get_nowait()
+
+    assert await real_worker.expire_craft(now=time.monotonic() + 200) == 1
+    stale = real_worker.queue.get_nowait()
+    assert b'uid="ICAO-A9EE47"' in stale
+    assert stale.split(b"<point")[1] == sent.split(b"<point")[1]
+    assert len(real_worker.registry) == 0
+
+
+def _square(lat: float, lon: float, size: float) -> list:
+    return [
+        [(lat, lon), (lat, lon + size), (lat + size, lon + size), (lat + size, lon)]
+    ]
+
+
+def test_zone_index():
+    """Tests the grid index finds the same zones as testing every polygon."""
+    rand = random.Random(0)
+    zones = [
+        (f"Z{i}", _square(rand.uniform(30, 40), rand.uniform(-120, -110), 0.7))
+        for i in range(100)
+    ]
+    zones.append(("TRI", [[(33.0, -115.0), (35.13, -113.0), (34.0, -111.9)]]))
+    index = ZoneIndex(zones, 0.25)
+    assert len(index) == 101
+
+    for _ in range(2000):
+        lat, lon = rand.uniform(29, 42), rand.uniform(-121, -109)
+        expected = tuple(
+            name for name, rings in zones if adsbxcot.point_in_zone(lat, lon, rings)
+        )
+        assert index.lookup(lat, lon) == expected
+    assert index.lookup(0, 0) == ()
+
+
+@pytest.mark.asyncio
+async def test_process_craft_zones(config, tmp_path):
+    """Tests aircraft are tagged with their zones, and ZONE_FILTER drops them."""
+    path = tmp_path / "zones.geojson"
+    path.write_text(
+        json.dumps(
+            {
+                "type": "Feature",
+                "properties": {"name": "Base <North>"},
+                "geometry": {
+                    "type": "Polygon",
+                    "coordinates": [[[-123, 37], [-121, 37], [-121, 38], [-123, 37]]],
+                },
+            }
+        )
+    )
+    config["ZONES"] = str(path)
+    inside = {"hex": "a9ee47", "lat": 37.2, "lon": -121.5}
+    outside = {"hex": "a9ee48", "lat": 36.0, "lon": -121.5}
+
+    for zone_filter, sent in (("", 2), ("inside", 1), ("outside", 1)):
+        config["ZONE_FILTER"] = zone_filter
+        worker = ADSBXWorker(asyncio.Queue(), config)
+        await worker.load_zones()
+        assert len(worker.zones) == 1
+        await worker.process_craft(dict(inside))
+        await worker.process_craft(dict(outside))
+        assert worker.queue.qsize() == sent
+        events = [worker.queue.get_nowait() for _ in range(sent)]
+        tagged = [event for event in events if b"ICAO-A9EE47" in event]
+        assert bool(tagged) == (zone_filter != "outside")
+        for event in tagged:
+            assert b'zones="Base &lt;North&gt;"' in event
+            assert b"Zones:Base &lt;North&gt;" in event
+        if zone_filter:
+            assert worker.metrics.filtered["zone"] == 1
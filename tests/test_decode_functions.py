@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ADSBXCOT Feed Response Decoding Functions Tests."""
+
+import json
+
+import pytest
+
+import adsbxcot
+import adsbxcot.functions
+
+from adsbxcot import decode_functions
+
+CRAFT: dict = {
+    "hex": "a9ee47",
+    "type": "adsb_icao",
+    "flight": "UAL1    ",
+    "r": "N1",
+    "t": "B738",
+    "alt_baro": 35000,
+    "alt_geom": 35425,
+    "gs": 452.1,
+    "track": 90,
+    "baro_rate": -64,
+    "squawk": "1200",
+    "category": "A3",
+    "nav_qnh": 1013.6,
+    "nav_modes": ["autopilot", "tcas"],
+    "lat": 37.1,
+    "lon": -122.2,
+    "nic": 8,
+    "nac_p": 9,
+    "seen_pos": 0.2,
+    "mlat": [],
+    "messages": 1234,
+    "rssi": -20.5,
+}
+BODY: bytes = json.dumps(
+    {"now": 1700000000.1, "msg": "No error", "ac": [CRAFT, {"hex": "~a9ee48"}]}
+).encode()
+
+
+def test_get_decoder():
+    """Tests JSON_DECODER picks a decoder, falling back to json."""
+    assert decode_functions.get_decoder(None) is decode_functions.decode_json
+    assert decode_functions.get_decoder(" JSON ") is decode_functions.decode_json
+    assert decode_functions.get_decoder("auto") in (
+        decode_functions.decode_msgspec,
+        decode_functions.decode_orjson,
+        decode_functions.decode_json,
+    )
+    with pytest.raises(ValueError):
+        decode_functions.get_decoder("yaml")
+
+
+@pytest.mark.skipif(not decode_functions.HAS_MSGSPEC, reason="msgspec not installed")
+def test_decode_msgspec():
+    """Tests msgspec keeps only the fields ADSBXCOT reads, unchanged."""
+    response = decode_functions.decode_msgspec(BODY)
+    assert response["now"] == 1700000000.1
+    assert set(response) == {"now", "ac"}
+    craft = response["ac"][0]
+    assert isinstance(craft, dict)
+    assert craft == {
+        key: val
+        for key, val in CRAFT.items()
+        if key in decode_functions.AIRCRAFT_FIELDS
+    }
+    assert isinstance(craft["track"], int) and isinstance(craft["gs"], float)
+    assert response["ac"][1] == {"hex": "~a9ee48"}
+
+    # Same CoT fields as from the full response:
+    profile = adsbxcot.compile_profile({})
+    full = json.loads(BODY)["ac"][0]
+    fields = adsbxcot.functions.get_cot_fields(craft, profile=profile)
+    assert fields == adsbxcot.functions.get_cot_fields(full, profile=profile)
+
+    # Responses that do not fit the schema fall back to json:
+    odd = b'{"ac": [{"hex": "a9ee47", "lat": "37.1"}]}'
+    assert decode_functions.decode_msgspec(odd) == json.loads(odd)
+    assert decode_functions.decode_msgspec(b"[1]") == [1]
+    with pytest.raises(ValueError):
+        decode_functions.decode_msgspec(b'{"ac": [')
+
+
+@pytest.mark.skipif(not decode_functions.HAS_ORJSON, reason="orjson not installed")
+def test_decode_orjson():
+    """Tests orjson decodes the same as json."""
+    assert decode_functions.decode_orjson(BODY) == json.loads(BODY)
+    with pytest.raises(ValueError):
+        decode_functions.decode_orjson(b'{"ac": [')
@@ -3,13 +3,21 @@
 
 """ADSBXCOT Module Tests."""
 
+import asyncio
 import csv
+import gzip
 import io
+import json
+import struct
 
 import xml.etree.ElementTree as ET
 
+from configparser import ConfigParser
+from unittest.mock import MagicMock, patch
+
 import pytest
 import adsbxcot.functions
+import adsbxcot.proto_functions
 
 __author__ = "Greg Albrecht W2GMD <oss@undef.net>"
 __copyright__ = "Copyright 2022 Greg Albrecht"
@@ -244,3 +252,760 @@ def test_negative_adsbx_to_cot():
     sample_craft = {"taco": "burrito"}
     cot = adsbxcot.adsbx_to_cot(sample_craft)
     assert cot == None
+
+
+def test_craft_changed():
+    """Tests that only aircraft that moved past a threshold are changed."""
+    craft = {
+        "lat": 37.836449,
+        "lon": -122.030281,
+        "alt_geom": 3750,
+        "track": 50.1,
+        "gs": 79.5,
+        "squawk": "1200",
+        "flight": "N739UL  ",
+    }
+    prev = adsbxcot.craft_state(craft)
+
+    assert adsbxcot.craft_changed(None, prev)
+    assert not adsbxcot.craft_changed(prev, adsbxcot.craft_state(craft))
+
+    assert not adsbxcot.craft_changed(
+        prev, adsbxcot.craft_state(dict(craft, lat=37.8365, alt_geom=3775, gs=80))
+    )
+    assert adsbxcot.craft_changed(prev, adsbxcot.craft_state(dict(craft, lat=37.84)))
+    assert adsbxcot.craft_changed(
+        prev, adsbxcot.craft_state(dict(craft, alt_geom=3900))
+    )
+    assert adsbxcot.craft_changed(prev, adsbxcot.craft_state(dict(craft, track=60)))
+    assert adsbxcot.craft_changed(prev, adsbxcot.craft_state(dict(craft, gs=90)))
+    assert adsbxcot.craft_changed(
+        prev, adsbxcot.craft_state(dict(craft, squawk="7700"))
+    )
+    assert adsbxcot.craft_changed(
+        prev, adsbxcot.craft_state(dict(craft, flight="TACO01"))
+    )
+
+
+def test_craft_changed_track_wraps():
+    """Tests that track changes across north are measured the short way."""
+    prev = adsbxcot.craft_state({"lat": 1.0, "lon": 1.0, "track": 359.0})
+    state = adsbxcot.craft_state({"lat": 1.0, "lon": 1.0, "track": 1.0})
+    assert not adsbxcot.craft_changed(prev, state)
+
+
+def _fixed_cot_time(cot_stale=None):
+    """Deterministic stand-in for `pytak.cot_time()`."""
+    if cot_stale:
+        return f"2024-01-01T00:{int(cot_stale) // 60:02d}:00.000000Z"
+    return "2024-01-01T00:00:00.000000Z"
+
+
+def test_adsbx_to_cot_template_matches_xml(sample_feed, sample_known_craft):
+    """Tests that the template serializer renders byte-identical CoT."""
+    crafts = list(sample_feed["aircraft"]) + [
+        {
+            "hex": " a9ee48 ",
+            "lat": 0,
+            "lon": 0.0,
+            "r": 'N1"&<>\tÉ',
+            "t": "b738",
+            "flight": "TACO\n01",
+            "squawk": "7700",
+            "category": "a7",
+            "alt_baro": "ground",
+            "alt_geom": None,
+            "x_alt_geom": 123.4,
+            "x_alt_baro_offset": -5.0,
+        },
+        {"hex": "a9ee49", "lat": "", "lon": "", "nac_p": "", "nac_v": "", "gs": ""},
+        {"hex": "a9ee4a", "lat": 0.0, "lon": 1.5, "nac_p": 0, "nac_v": None},
+    ]
+    known_crafts = [{}, dict(sample_known_craft[6], ICON="f7f71666/Aircraft/A.png")]
+    configs = [
+        None,
+        {"UID_KEY": "REG", "COT_STALE": "600", "COT_HOST_ID": "a&b@<host>"},
+        {"UID_KEY": "FLIGHT", "COT_HOST_ID": ""},
+    ]
+
+    with patch("pytak.cot_time", _fixed_cot_time):
+        for craft in crafts:
+            for known_craft in known_crafts:
+                for config in configs:
+                    expected = adsbxcot.adsbx_to_cot(craft, config, known_craft)
+                    actual = adsbxcot.functions.adsbx_to_cot_template(
+                        craft, config, known_craft
+                    )
+                    assert actual == expected
+
+
+def test_tag_template_attribute_order():
+    """Tests that template attributes are sorted as ElementTree sorts them on 3.7."""
+    attrs = [("lat", "{lat}"), ("ce", "{ce}")]
+    assert adsbxcot.functions._tag_template("point", attrs, empty=True) == (
+        '<point lat="{lat}" ce="{ce}" />'
+    )
+    with patch.object(adsbxcot.functions.sys, "version_info", (3, 7, 17)):
+        assert adsbxcot.functions._tag_template("point", attrs) == (
+            '<point ce="{ce}" lat="{lat}">'
+        )
+
+
+def test_adsbx_to_cot_serializer_config(sample_feed):
+    """Tests that COT_SERIALIZER selects the template serializer."""
+    sample_craft = sample_feed["aircraft"][0]
+    with patch(
+        "adsbxcot.functions.adsbx_to_cot_template", return_value=b"tmpl"
+    ) as mock_template:
+        assert adsbxcot.adsbx_to_cot(sample_craft, {"COT_SERIALIZER": "template"}) == (
+            b"tmpl"
+        )
+        mock_template.assert_called_once()
+    assert adsbxcot.adsbx_to_cot(sample_craft, {}) != b"tmpl"
+
+
+def test_negative_adsbx_to_cot_template():
+    """Tests that `adsbx_to_cot_template()` returns None for an invalid craft."""
+    assert adsbxcot.functions.adsbx_to_cot_template({"taco": "burrito"}) is None
+
+
+def test_get_aircraft():
+    """Tests the aircraft list is found under 'ac' or 'aircraft'."""
+    assert adsbxcot.get_aircraft({"ac": [{"hex": "a"}]}) == [{"hex": "a"}]
+    assert adsbxcot.get_aircraft({"aircraft": [], "now": 1}) == []
+    assert adsbxcot.get_aircraft({"ac": None, "aircraft": [1]}) == [1]
+    assert adsbxcot.get_aircraft({"msg": "No key"}) is None
+    assert adsbxcot.get_aircraft([]) is None
+
+
+def test_get_feed_urls():
+    """Tests that FEED_URL can list several comma or space separated URLs."""
+    assert adsbxcot.get_feed_urls(None) == []
+    assert adsbxcot.get_feed_urls("https://a/") == ["https://a/"]
+    assert adsbxcot.get_feed_urls(" https://a/, https://b/\n https://c/ ") == [
+        "https://a/",
+        "https://b/",
+        "https://c/",
+    ]
+
+
+def test_merge_aircraft():
+    """Tests that aircraft are merged by ICAO, keeping the freshest position."""
+    feed_a = [
+        {"hex": "a9ee47", "lat": 1.0, "lon": 1.0, "seen_pos": 5.0},
+        {"hex": "3c4586", "alt_baro": 37000},
+        {"flight": "NOHEX"},
+    ]
+    feed_b = [
+        {"hex": "A9EE47 ", "lat": 1.1, "lon": 1.1, "seen_pos": 0.5},
+        {"hex": "3c4586", "lat": 2.0, "lon": 2.0, "seen_pos": 30.0},
+        {"hex": "abd994", "lat": 3.0, "lon": 3.0, "seen_pos": None},
+    ]
+    merged = adsbxcot.merge_aircraft([feed_a, feed_b])
+    assert len(merged) == 4
+    assert merged[0]["lat"] == 1.1
+    assert merged[1]["lat"] == 2.0
+    assert merged[2]["hex"] == "abd994"
+    assert merged[3] == {"flight": "NOHEX"}
+
+
+def test_next_cycle():
+    """Tests fixed-rate poll scheduling, skipping overrun cycles."""
+    assert adsbxcot.next_cycle(100.0, 5.0, 101.0) == (105.0, 0)
+    assert adsbxcot.next_cycle(100.0, 5.0, 105.0) == (105.0, 0)
+    assert adsbxcot.next_cycle(100.0, 5.0, 106.0) == (110.0, 1)
+    assert adsbxcot.next_cycle(100.0, 5.0, 117.0) == (120.0, 3)
+
+
+def test_parse_retry_after():
+    """Tests parsing of Retry-After as seconds or as an HTTP-date."""
+    assert adsbxcot.parse_retry_after(None) == 0.0
+    assert adsbxcot.parse_retry_after("120") == 120.0
+    assert adsbxcot.parse_retry_after("taco") == 0.0
+    assert (
+        adsbxcot.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT", 1445412420.0)
+        == 60.0
+    )
+    assert (
+        adsbxcot.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT", 1445412540.0) == 0.0
+    )
+
+
+def test_backoff_delay():
+    """Tests exponential backoff with jitter, capped at the maximum."""
+    for failures, low, high in ((1, 5, 10), (2, 10, 20), (3, 20, 40), (10, 50, 100)):
+        delay = adsbxcot.backoff_delay(failures, 10, 100)
+        assert low <= delay <= high
+
+
+def test_parse_area():
+    """Tests parsing BBOX and POLYGON settings."""
+    assert adsbxcot.parse_area() is None
+    assert adsbxcot.parse_area("37,-123,38,-121") == [
+        (37.0, -123.0),
+        (37.0, -121.0),
+        (38.0, -121.0),
+        (38.0, -123.0),
+    ]
+    assert adsbxcot.parse_area(polygon="37,-123 38,-123 38,-121") == [
+        (37.0, -123.0),
+        (38.0, -123.0),
+        (38.0, -121.0),
+    ]
+    with pytest.raises(ValueError):
+        adsbxcot.parse_area("37,-123,38")
+    with pytest.raises(ValueError):
+        adsbxcot.parse_area(polygon="37,-123 38,-123")
+
+
+def test_point_in_polygon():
+    """Tests the point in polygon check."""
+    triangle = [(37.0, -123.0), (38.0, -123.0), (38.0, -121.0)]
+    assert adsbxcot.point_in_polygon(37.9, -122.9, triangle)
+    assert not adsbxcot.point_in_polygon(37.1, -121.1, triangle)
+
+
+def test_cover_tiles():
+    """Tests that tiles cover every point of the area, and only the area."""
+    dist = 50
+    area = adsbxcot.parse_area(polygon="36,-124 40,-124 40,-118")
+    tiles = adsbxcot.cover_tiles(area, dist)
+    assert tiles
+    for i in range(41):
+        for j in range(61):
+            lat, lon = 36 + i * 0.1, -124 + j * 0.1
+            if adsbxcot.point_in_polygon(lat, lon, area):
+                assert min(
+                    adsbxcot.functions.distance_m(lat, lon, t_lat, t_lon)
+                    for t_lat, t_lon in tiles
+                ) <= (dist * 1852)
+    bbox_tiles = adsbxcot.cover_tiles(adsbxcot.parse_area("36,-124,40,-118"), dist)
+    assert len(tiles) < len(bbox_tiles)
+
+
+def test_tile_feed_urls():
+    """Tests that only FEED_URLs with placeholders are expanded into tiles."""
+    area = adsbxcot.parse_area("37,-123,37.5,-122.5")
+    urls = adsbxcot.tile_feed_urls(
+        ["https://a/lat/{lat}/lon/{lon}/dist/{dist}/", "http://tar1090/data.json"],
+        area,
+        10,
+    )
+    assert urls[-1] == "http://tar1090/data.json"
+    assert len(urls) > 2
+    assert all(url.endswith("/dist/10/") for url in urls[:-1])
+    assert "{lat}" not in "".join(urls)
+
+
+def test_craft_in_limits_polygon():
+    """Tests that POLYGON, used instead of BBOX, drops aircraft outside it."""
+    profile = adsbxcot.compile_profile(
+        {"BBOX": "0,0,50,50", "POLYGON": "0,0 10,0 10,10 5,2 0,10"}
+    )
+    assert profile.bbox == (0.0, 0.0, 10.0, 10.0)
+    assert adsbxcot.craft_in_limits({"lat": 2.0, "lon": 1.0}, profile)
+    assert not adsbxcot.craft_in_limits({"lat": 5.0, "lon": 8.0}, profile)
+    assert not adsbxcot.craft_in_limits({"lat": 20.0, "lon": 20.0}, profile)
+    assert adsbxcot.craft_in_limits({"hex": "a9ee47"}, profile)
+
+
+def test_compile_profile():
+    """Tests that the config is compiled into a validated, immutable profile."""
+    profile = adsbxcot.compile_profile(
+        {
+            "INCLUDE_TISB": "yes",
+            "TISB_ONLY": "0",
+            "UID_KEY": "REG",
+            "COT_STALE": "600",
+            "COT_SERIALIZER": "template",
+            "MIN_POSITION_CHANGE": "250.5",
+        }
+    )
+    assert profile.include_tisb is True
+    assert profile.tisb_only is False
+    assert profile.include_all_craft is False
+    assert profile.uid_key == "REG"
+    assert profile.cot_stale == 600
+    assert profile.heartbeat_interval == 300
+    assert profile.cot_serializer == "template"
+    assert profile.min_position_change == 250.5
+    with pytest.raises(AttributeError):
+        profile.uid_key = "ICAO"
+
+    assert adsbxcot.compile_profile(None) == adsbxcot.ConversionProfile()
+
+    for bad in (
+        {"INCLUDE_TISB": "taco"},
+        {"COT_STALE": "two minutes"},
+        {"COT_SERIALIZER": "json"},
+    ):
+        with pytest.raises(ValueError):
+            adsbxcot.compile_profile(bad)
+
+
+def test_adsbx_to_cot_profile(sample_feed):
+    """Tests that a compiled profile is used in place of the config."""
+    sample_craft = sample_feed["aircraft"][0]
+    profile = adsbxcot.compile_profile({"UID_KEY": "FLIGHT"})
+    cot = adsbxcot.functions.adsbx_to_cot_xml(sample_craft, profile=profile)
+    assert cot.attrib["uid"] == "FLIGHT-N739UL"
+
+
+def test_convert_shard():
+    """Tests convert_shard converts items in order, keyed by ICAO."""
+    profile = adsbxcot.compile_profile({})
+    items = [
+        ("A9EE47", {"hex": "a9ee47", "lat": 37.0, "lon": -122.0}, None),
+        ("A9EE48", {"hex": "a9ee48"}, None),
+    ]
+    result = adsbxcot.convert_shard(items, profile)
+    assert [icao for icao, _ in result] == ["A9EE47", "A9EE48"]
+    assert b'uid="ICAO-A9EE47"' in result[0][1]
+    assert result[1][1] is None
+
+
+def test_read_replay(tmp_path):
+    """Tests reading plain, gzipped and directory recordings."""
+    responses = [{"now": 1000 + i, "ac": [{"hex": f"a9ee4{i}"}]} for i in range(3)]
+
+    single = tmp_path / "single.json"
+    single.write_text(json.dumps(responses[0], indent=2))
+    assert list(adsbxcot.read_replay(str(single))) == responses[:1]
+
+    lines = tmp_path / "lines.json.gz"
+    with gzip.open(lines, "wt") as lines_fd:
+        lines_fd.write("".join(json.dumps(resp) + "\n" for resp in responses))
+    assert list(adsbxcot.read_replay(str(lines))) == responses
+
+    directory = tmp_path / "dir"
+    directory.mkdir()
+    for i, resp in enumerate(responses):
+        (directory / f"{i:03d}.json").write_text(json.dumps(resp))
+    (directory / ".hidden").write_text("not json")
+    assert list(adsbxcot.read_replay(str(directory))) == responses
+
+
+def test_read_replay_invalid(tmp_path, caplog):
+    """Tests invalid responses are skipped, not fatal, when replaying."""
+    responses = [{"now": 1000 + i, "ac": [{"hex": f"a9ee4{i}"}]} for i in range(2)]
+    archive = tmp_path / "adsbxcot-19700101T000000Z.jsonl.gz"
+    with gzip.open(archive, "wt") as archive_fd:
+        archive_fd.write(
+            json.dumps({"recorded": 1, "url": "u", "response": responses[0]})
+            + '\n{"recorded": 2, "url": "u", "response": <html>bad gateway</html>}\n'
+            + json.dumps({"recorded": 3, "url": "u", "response": responses[1]})
+            + "\n"
+        )
+    assert list(adsbxcot.read_replay(str(archive))) == responses
+    assert "line 2" in caplog.text
+
+    (tmp_path / "bad.json").write_text("<html>bad gateway</html>")
+    assert list(adsbxcot.read_replay(str(tmp_path / "bad.json"))) == []
+
+
+def test_response_time():
+    """Tests response times in milliseconds and seconds."""
+    assert adsbxcot.response_time({"now": 1700000000123}) == 1700000000.123
+    assert adsbxcot.response_time({"now": 1700000000.5}) == 1700000000.5
+    assert adsbxcot.response_time({"ac": []}) is None
+    assert adsbxcot.response_time([]) is None
+
+
+def test_cot_uid():
+    """Tests getting the UID of a CoT event."""
+    assert adsbxcot.cot_uid(b'<event version="2.0" uid="ICAO-A9EE47" />') == (
+        b"ICAO-A9EE47"
+    )
+    assert adsbxcot.cot_uid(b"<event />") is None
+
+
+def test_create_tasks_coalesce_queue():
+    """Tests COALESCE_QUEUE swaps the TX queue for a CoalescingQueue."""
+    clitool = MagicMock()
+    clitool.tx_queue = asyncio.Queue()
+    tx_worker = MagicMock()
+    tx_worker.queue = clitool.tx_queue
+    clitool.tasks = {tx_worker}
+
+    config = ConfigParser()
+    config.read_dict({"adsbxcot": {"COALESCE_QUEUE": "true"}})
+
+    (worker,) = adsbxcot.create_tasks(config["adsbxcot"], clitool)
+    assert isinstance(clitool.tx_queue, adsbxcot.CoalescingQueue)
+    assert tx_worker.queue is clitool.tx_queue
+    assert worker.queue is clitool.tx_queue
+
+
+def test_output_lane():
+    """Tests emergencies go first, then KNOWN_CRAFT, then everything else."""
+    assert adsbxcot.output_lane({"squawk": "7700"}) == 0
+    assert adsbxcot.output_lane({"squawk": "7500"}, {"HEX": "A9EE47"}) == 0
+    assert adsbxcot.output_lane({"squawk": "1200"}, {"HEX": "A9EE47"}) == 1
+    assert adsbxcot.output_lane({"squawk": "1200"}) == 2
+    assert adsbxcot.output_lane({}) == 2
+
+
+def test_change_score():
+    """Tests aircraft that changed more, or were sent longer ago, score higher."""
+    profile = adsbxcot.compile_profile({"COT_STALE": "120"})
+    prev = adsbxcot.craft_state({"lat": 37.0, "lon": -122.0, "alt_baro": 10000})
+    prev["sent"] = 100.0
+
+    assert adsbxcot.change_score(None, prev, profile, 100.0) == float("inf")
+
+    same = adsbxcot.craft_state({"lat": 37.0, "lon": -122.0, "alt_baro": 10000})
+    assert adsbxcot.change_score(prev, same, profile, 100.0) == 0
+    assert adsbxcot.change_score(prev, same, profile, 160.0) == 1
+
+    moved = adsbxcot.craft_state({"lat": 37.01, "lon": -122.0, "alt_baro": 10000})
+    climbed = adsbxcot.craft_state({"lat": 37.0, "lon": -122.0, "alt_baro": 10500})
+    assert adsbxcot.change_score(prev, moved, profile, 100.0) > 10
+    assert adsbxcot.change_score(prev, climbed, profile, 100.0) == 5
+
+
+def test_output_priority():
+    """Tests a fast-changing aircraft just sent cannot starve a slow one."""
+    profile = adsbxcot.compile_profile({"COT_STALE": "120"})
+    slow = adsbxcot.craft_state({"lat": 37.0, "lon": -122.0})
+    slow["sent"] = 0.0
+    fast = adsbxcot.craft_state({"lat": 38.0, "lon": -122.0})
+    fast["sent"] = 99.0
+    fast_now = adsbxcot.craft_state({"lat": 38.1, "lon": -122.0})
+
+    assert adsbxcot.output_priority(None, slow, profile, 100.0) == float("inf")
+    assert adsbxcot.output_priority(slow, slow, profile, 100.0) > (
+        adsbxcot.output_priority(fast, fast_now, profile, 100.0)
+    )
+    assert adsbxcot.output_priority(fast, fast_now, profile, 99.0) == 0
+
+
+def test_extrapolate():
+    """Tests dead reckoning along the track, at the ground and vertical speeds."""
+    craft = {
+        "hex": "a9ee47",
+        "lat": 37.0,
+        "lon": -122.0,
+        "track": 0.0,
+        "gs": 360.0,
+        "alt_baro": 10000,
+        "baro_rate": 1200,
+        "seen_pos": 1.0,
+        "x_hae": "3048.0",
+    }
+    predicted = adsbxcot.extrapolate(craft, 60)
+    assert predicted["lat"] == pytest.approx(37.1, abs=0.0001)
+    assert predicted["lon"] == -122.0
+    assert predicted["alt_baro"] == 11200
+    assert predicted["seen_pos"] == 60
+    assert "x_hae" not in predicted
+    assert craft["lat"] == 37.0
+
+    east = adsbxcot.extrapolate({"lat": 0.0, "lon": 179.95, "track": 90, "gs": 360}, 60)
+    assert east["lat"] == pytest.approx(0.0)
+    assert east["lon"] == pytest.approx(-179.95, abs=0.0001)
+
+    assert adsbxcot.extrapolate({"lat": 37.0, "lon": -122.0, "track": 0}, 60) is None
+    assert (
+        adsbxcot.extrapolate(
+            {"lat": 37.0, "lon": -122.0, "track": 0, "gs": 10, "alt_baro": "ground"},
+            60,
+        )
+        is None
+    )
+
+
+def test_stale_event():
+    """Tests an event is rewritten to be stale now, leaving its detail alone."""
+    event = (
+        b'<?xml version="1.0"?>\n<event version="2.0" uid="ICAO-A9EE47" '
+        b'time="2020-01-01T00:00:00Z" start="2020-01-01T00:00:00Z" '
+        b'stale="2020-01-01T00:02:00Z"><detail><_flow-tags_ '
+        b'x="2020-01-01T00:00:00Z" /></detail></event>'
+    )
+    with patch("pytak.cot_time", return_value="2021-01-01T00:00:00Z"):
+        stale = adsbxcot.stale_event(event)
+    assert stale == event.replace(b'"2020-01-01T00:0', b'"2021-01-01T00:0', 3).replace(
+        b'stale="2021-01-01T00:02:00Z"', b'stale="2021-01-01T00:00:00Z"'
+    )
+
+
+def test_delete_event():
+    """Tests a CoT delete event links to the deleted UID."""
+    event = ET.fromstring(adsbxcot.delete_event("ICAO-A9EE47").split(b"\n", 1)[1])
+    assert event.get("type") == "t-x-d-d"
+    assert event.get("uid") == "ICAO-A9EE47-delete"
+    assert event.find("detail/link").get("uid") == "ICAO-A9EE47"
+    assert event.find("detail/__forcedelete") is not None
+
+
+def _proto_fields(data: bytes) -> dict:
+    """Decode a TAK Protocol v1 event's CotEvent fields, by field number."""
+    return {
+        field: value for field, _, value in adsbxcot.proto_functions.cot_event(data)
+    }
+
+
+def test_adsbx_to_cot_protobuf():
+    """Tests COT_SERIALIZER=protobuf encodes the same fields as the XML."""
+    craft = {
+        "hex": "a9ee47",
+        "flight": "UAL1 ",
+        "r": "N1",
+        "squawk": "1200",
+        "lat": 37.1,
+        "lon": -122.2,
+        "alt_geom": 3000,
+        "gs": 200,
+        "track": 90,
+    }
+    profile = adsbxcot.compile_profile(
+        {"COT_SERIALIZER": "protobuf", "TAK_PROTO_FRAMING": "stream"}
+    )
+    data = adsbxcot.adsbx_to_cot(dict(craft), profile=profile)
+    xml = ET.fromstring(adsbxcot.adsbx_to_cot(dict(craft)).split(b"\n", 1)[1])
+    assert len(data) < len(ET.tostring(xml))
+    assert data.startswith(b"\xbf") and not data.startswith(b"\xbf\x01\xbf")
+
+    fields = _proto_fields(data)
+    assert fields[1] == xml.get("type").encode()
+    assert fields[5] == b"ICAO-A9EE47"
+    assert fields[9] == b"m-g"
+    assert struct.unpack("<d", fields[10])[0] == 37.1
+    assert struct.unpack("<d", fields[11])[0] == -122.2
+    assert fields[8] - fields[6] == profile.cot_stale * 1000
+
+    detail = {
+        field: value
+        for field, _, value in adsbxcot.proto_functions.read_fields(fields[15])
+    }
+    xml_detail = ET.fromstring(b"<detail>" + detail[1] + b"</detail>")
+    assert xml_detail.find("_aircot_").attrib == xml.find("detail/_aircot_").attrib
+    assert xml_detail.find("remarks").text == xml.find("detail/remarks").text
+    assert xml_detail.find("_flow-tags_") is not None
+    assert detail[2] == adsbxcot.proto_functions.string_field(2, "UAL1")
+    track = dict(
+        (field, struct.unpack("<d", value)[0])
+        for field, _, value in adsbxcot.proto_functions.read_fields(detail[7])
+    )
+    assert track == {2: 90.0, 1: pytest.approx(102.8888)}
+
+    assert adsbxcot.cot_uid(data) == b"ICAO-A9EE47"
+    assert adsbxcot.adsbx_to_cot({"hex": "a9ee47"}, profile=profile) is None
+
+
+def test_tak_proto_framing():
+    """Tests framing follows COT_URL unless TAK_PROTO_FRAMING is set."""
+    assert (
+        adsbxcot.compile_profile({"COT_URL": "udp://239.2.3.1:6969"}).tak_proto_framing
+        == "mesh"
+    )
+    assert (
+        adsbxcot.compile_profile({"COT_URL": "tcp://takserver:8087"}).tak_proto_framing
+        == "stream"
+    )
+    assert (
+        adsbxcot.compile_profile(
+            {"COT_URL": "tcp://takserver:8087", "TAK_PROTO_FRAMING": "Mesh"}
+        ).tak_proto_framing
+        == "mesh"
+    )
+    with pytest.raises(ValueError):
+        adsbxcot.compile_profile({"TAK_PROTO_FRAMING": "xml"})
+
+
+def test_protobuf_stale_and_delete_events():
+    """Tests STALE_OUT events are TAK Protocol v1 with COT_SERIALIZER=protobuf."""
+    profile = adsbxcot.compile_profile(
+        {"COT_SERIALIZER": "protobuf", "TAK_PROTO_FRAMING": "mesh"}
+    )
+    event = adsbxcot.adsbx_to_cot(
+        {"hex": "a9ee47", "lat": 37.1, "lon": -122.2}, profile=profile
+    )
+    with patch("time.time", return_value=2_000_000_000):
+        stale = adsbxcot.stale_event(event)
+    fields = _proto_fields(stale)
+    assert fields[6] == fields[7] == fields[8] == 2_000_000_000_000
+    assert fields[15] == _proto_fields(event)[15]
+
+    delete = adsbxcot.delete_event("ICAO-A9EE47", profile)
+    assert delete.startswith(b"\xbf\x01\xbf")
+    fields = _proto_fields(delete)
+    assert fields[1] == b"t-x-d-d"
+    assert fields[5] == b"ICAO-A9EE47-delete"
+    assert b'<link uid="ICAO-A9EE47"' in fields[15]
+    assert b"<__forcedelete />" in fields[15]
+
+
+def test_create_tasks_protobuf():
+    """Tests pytak does not re-encode COT_SERIALIZER=protobuf events."""
+    clitool = MagicMock()
+    tx_worker = MagicMock()
+    tx_worker.use_protobuf = True
+    clitool.tasks = {tx_worker}
+
+    config = ConfigParser()
+    config.read_dict({"adsbxcot": {"COT_SERIALIZER": "protobuf"}})
+    adsbxcot.create_tasks(config["adsbxcot"], clitool)
+    assert tx_worker.use_protobuf is False
+
+
+def test_read_feed_file(tmp_path):
+    """Tests a feed file is only returned when its contents change."""
+    feed_file = tmp_path / "aircraft.json"
+    feed_file.write_bytes(b"")
+    assert adsbxcot.read_feed_file(str(feed_file)) == (None, None)
+    assert adsbxcot.file_signature(str(tmp_path / "missing.json")) is None
+
+    feed_file.write_bytes(b'{"aircraft": []}')
+    signature = adsbxcot.file_signature(str(feed_file))
+    crc, body = adsbxcot.read_feed_file(str(feed_file))
+    assert body == b'{"aircraft": []}'
+    assert adsbxcot.read_feed_file(str(feed_file), crc) == (crc, None)
+
+    feed_file.write_bytes(b'{"aircraft": [{}]}')
+    assert adsbxcot.file_signature(str(feed_file)) != signature
+    assert adsbxcot.read_feed_file(str(feed_file), crc)[1] == b'{"aircraft": [{}]}'
+
+
+def test_read_feed_file_mmap(tmp_path, monkeypatch):
+    """Tests large feed files read through a memory map read the same."""
+    feed_file = tmp_path / "aircraft.json"
+    feed_file.write_bytes(b'{"aircraft": []}')
+    crc, body = adsbxcot.read_feed_file(str(feed_file))
+
+    monkeypatch.setattr(adsbxcot, "FEED_FILE_MMAP_SIZE", 1)
+    assert adsbxcot.read_feed_file(str(feed_file)) == (crc, body)
+    assert adsbxcot.read_feed_file(str(feed_file), crc) == (crc, None)
+
+
+def test_get_cot_fields_aircraft():
+    """Tests an Aircraft record converts the same as its dict."""
+    craft = {
+        "hex": "a9ee47",
+        "flight": "UAL1 ",
+        "r": "n1",
+        "t": "B738",
+        "category": "A3",
+        "squawk": "1200",
+        "lat": 37.1,
+        "lon": -122.2,
+        "alt_baro": 35000,
+        "alt_geom": 35400,
+        "gs": 450,
+        "track": 90.5,
+        "nac_p": 9,
+    }
+    profile = adsbxcot.compile_profile({})
+    record = adsbxcot.Aircraft(craft)
+    fields = adsbxcot.functions.get_cot_fields(record, profile=profile)
+    assert fields == adsbxcot.functions.get_cot_fields(craft, profile=profile)
+    assert fields["uid"] == "ICAO-A9EE47"
+    assert fields["remarks"] == (
+        "N1 UAL1 Squawk:1200 A9EE47 Cat:A3 Type:B738 Alt:35400 " + profile.cot_host_id
+    )
+
+    predicted = adsbxcot.extrapolate(record, 60)
+    assert isinstance(predicted, adsbxcot.Aircraft)
+    assert record["lat"] == 37.1 and predicted["lat"] != 37.1
+
+
+def test_get_cot_fields_fragments():
+    """Tests cached static fields convert the same, and follow identity changes."""
+    craft = {"hex": "a9ee47", "flight": "UAL1", "lat": 37.1, "lon": -122.2}
+    profile = adsbxcot.compile_profile({})
+    fragments = adsbxcot.CotFragmentCache()
+
+    expected = adsbxcot.functions.get_cot_fields(craft, profile=profile)
+    for _ in range(2):
+        fields = adsbxcot.functions.get_cot_fields(
+            craft, profile=profile, fragments=fragments
+        )
+        assert fields == expected
+    assert fragments.hits == 1
+
+    craft.update({"flight": "UAL2", "alt_geom": 1000})
+    fields = adsbxcot.functions.get_cot_fields(
+        craft, profile=profile, fragments=fragments
+    )
+    assert fields == adsbxcot.functions.get_cot_fields(craft, profile=profile)
+    assert fields["callsign"] == "UAL2"
+    assert "UAL2" in fields["remarks"] and "Alt:1000" in fields["remarks"]
+
+    known_craft = {"HEX": "A9EE47", "CALLSIGN": "Mercy 1", "COT": "a-f-A-C-H"}
+    fields = adsbxcot.functions.get_cot_fields(
+        craft, known_craft=known_craft, profile=profile, fragments=fragments
+    )
+    assert fields["callsign"] == "Mercy 1"
+    assert fields["cot_type"] == "a-f-A-C-H"
+
+
+ZONES_GEOJSON: dict = {
+    "type": "FeatureCollection",
+    "features": [
+        {
+            "type": "Feature",
+            "properties": {"name": "R-2508"},
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [
+                    [[-118, 35], [-116, 35], [-116, 37], [-118, 37], [-118, 35]],
+                    [[-117.5, 35.5], [-117, 35.5], [-117, 36], [-117.5, 35.5]],
+                ],
+            },
+        },
+        {
+            "type": "Feature",
+            "id": "tfr-1",
+            "properties": {},
+            "geometry": {
+                "type": "MultiPolygon",
+                "coordinates": [
+                    [[[-122, 37], [-121.9, 37], [-121.9, 37.1], [-122, 37]]],
+                    [[[-120, 37], [-119.9, 37], [-119.9, 37.1], [-120, 37]]],
+                ],
+            },
+        },
+        {"type": "Feature", "geometry": {"type": "Point", "coordinates": [0, 0]}},
+    ],
+}
+
+
+def test_read_zones(tmp_path):
+    """Tests GeoJSON polygons are read as named (lat, lon) rings."""
+    path = tmp_path / "zones.geojson"
+    path.write_text(json.dumps(ZONES_GEOJSON))
+    zones = adsbxcot.read_zones(str(path))
+    assert [name for name, _ in zones] == ["R-2508", "tfr-1", "tfr-1"]
+    assert zones[0][1][0][0] == (35.0, -118.0)
+    assert len(zones[0][1]) == 2
+
+    path.write_text(json.dumps(ZONES_GEOJSON["features"][0]["geometry"]))
+    assert adsbxcot.read_zones(str(path))[0][0] == "zone-0"
+
+    path.write_text("[]")
+    with pytest.raises(ValueError):
+        adsbxcot.read_zones(str(path))
+
+
+def test_point_in_zone_and_classify_cell():
+    """Tests holes are excluded, and cells classified by the zone boundary."""
+    rings = [
+        [(35, -118), (35, -116), (37, -116), (37, -118)],
+        [(35.5, -117.5), (35.5, -117), (36, -117), (36, -117.5)],
+    ]
+    assert adsbxcot.point_in_zone(36.5, -117, rings)
+    assert not adsbxcot.point_in_zone(35.75, -117.25, rings)
+    assert not adsbxcot.point_in_zone(38, -117, rings)
+
+    def cell(lat, lon, size=0.25):
+        return [
+            (lat, lon),
+            (lat, lon + size),
+            (lat + size, lon + size),
+            (lat + size, lon),
+        ]
+
+    assert adsbxcot.classify_cell(cell(36.5, -116.75), rings) is True
+    assert adsbxcot.classify_cell(cell(36.9, -117), rings) is False
+    assert adsbxcot.classify_cell(cell(35.6, -117.4, 0.1), rings) is None
+    assert adsbxcot.classify_cell(cell(40, -117), rings) is None
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ADSBXCOT Metrics Tests."""
+
+import asyncio
+
+from adsbxcot.metrics import Histogram, WorkerMetrics
+
+
+def test_histogram():
+    """Tests observations are counted into cumulative buckets."""
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        histogram.observe(value)
+
+    assert histogram.render("x", 'stage="a"') == [
+        'x_bucket{stage="a",le="0.1"} 2',
+        'x_bucket{stage="a",le="1"} 3',
+        'x_bucket{stage="a",le="+Inf"} 4',
+        'x_sum{stage="a"} 5.65',
+        'x_count{stage="a"} 4',
+    ]
+    assert histogram.render("y")[-1] == "y_count 4"
+
+
+def test_worker_metrics_render():
+    """Tests counters, filter reasons and queue depth are rendered."""
+    metrics = WorkerMetrics()
+    metrics.received += 3
+    metrics.emitted += 1
+    metrics.filter("tisb")
+    metrics.filter("tisb")
+    metrics.filter("no_position")
+    metrics.observe("convert", 0.0002)
+    queue = asyncio.Queue()
+    queue.put_nowait(b"event")
+
+    text = metrics.render(queue)
+    assert "adsbxcot_aircraft_received_total 3\n" in text
+    assert "adsbxcot_aircraft_emitted_total 1\n" in text
+    assert 'adsbxcot_aircraft_filtered_total{reason="tisb"} 2\n' in text
+    assert 'adsbxcot_aircraft_filtered_total{reason="no_position"} 1\n' in text
+    assert 'adsbxcot_stage_seconds_count{stage="convert"} 1\n' in text
+    assert 'adsbxcot_stage_seconds_count{stage="fetch"} 0\n' in text
+    assert "adsbxcot_queue_depth 1\n" in text
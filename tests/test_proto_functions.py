@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ADSBXCOT TAK Protocol Version 1 (Protobuf) Functions Tests."""
+
+import struct
+
+import pytest
+
+from adsbxcot import proto_functions
+
+
+def test_varint():
+    """Tests varints round trip, including multi-byte values."""
+    assert proto_functions.varint(1) == b"\x01"
+    assert proto_functions.varint(300) == b"\xac\x02"
+    for value in (0, 127, 128, 1_700_000_000_000):
+        assert proto_functions.read_varint(proto_functions.varint(value)) == (
+            value,
+            len(proto_functions.varint(value)),
+        )
+    with pytest.raises(ValueError):
+        proto_functions.read_varint(b"\x80")
+
+
+def test_fields_round_trip():
+    """Tests fields are encoded, and decoded back, in order."""
+    message = (
+        proto_functions.string_field(1, "a-f-A")
+        + proto_functions.string_field(4, "")
+        + proto_functions.uint64_field(6, 1_700_000_000_000)
+        + proto_functions.double_field(10, 37.5)
+        + proto_functions.double_field(11, 0.0)
+    )
+    fields = proto_functions.read_fields(message)
+    assert fields == [
+        (1, proto_functions.LENGTH, b"a-f-A"),
+        (6, proto_functions.VARINT, 1_700_000_000_000),
+        (10, proto_functions.FIXED64, struct.pack("<d", 37.5)),
+    ]
+    assert proto_functions.write_fields(fields) == message
+
+
+def test_frame():
+    """Tests the mesh and stream headers."""
+    payload = b"\x12\x00"
+    assert proto_functions.frame(payload, "mesh") == b"\xbf\x01\xbf\x12\x00"
+    assert proto_functions.frame(payload, "stream") == b"\xbf\x02\x12\x00"
+    assert proto_functions.unframe(b"\xbf\x01\xbf\x12\x00") == (payload, "mesh")
+    assert proto_functions.unframe(b"\xbf\x02\x12\x00") == (payload, "stream")
+    with pytest.raises(ValueError):
+        proto_functions.unframe(b"<event />")
+
+
+def test_proto_uid_and_restamp():
+    """Tests the UID is found, and times replaced, inside the CotEvent."""
+    event = proto_functions.string_field(
+        proto_functions.COT_UID, "ICAO-A9EE47"
+    ) + proto_functions.uint64_field(proto_functions.COT_STALE_TIME, 1)
+    data = proto_functions.frame(
+        proto_functions.message_field(proto_functions.TAK_MESSAGE_COT_EVENT, event),
+        "mesh",
+    )
+    assert proto_functions.is_tak_proto(data)
+    assert proto_functions.proto_uid(data) == b"ICAO-A9EE47"
+    assert proto_functions.proto_uid(b"\xbf\x05") is None
+
+    restamped = proto_functions.restamp(data, 5, 5, 5)
+    assert restamped.startswith(proto_functions.MESH_HEADER)
+    assert dict(
+        (field, value) for field, _, value in proto_functions.cot_event(restamped)
+    ) == {proto_functions.COT_UID: b"ICAO-A9EE47", proto_functions.COT_STALE_TIME: 5}